@@ -36,14 +36,17 @@ def entailment_score(premise: str, hypothesis: str) -> float:
 def make_hyp(feature: str) -> str:
     return f"This sentence is about: {feature}."
 
-def feature_equivalence(R1, F1, R2, F2, th=0.7):
+def feature_equivalence(R1, F1, R2, F2, th=0.7, lazy=False):
     H1 = make_hyp(F1)
     H2 = make_hyp(F2)
 
     e12 = entailment_score(R1, H2)  # R1 => H2
-    e21 = entailment_score(R2, H1)  # R2 => H1
 
-    score = min(e12, e21)
+    # lazy: min(e12, e21) < th whenever e12 < th, so R2 => H1 cannot change pred
+    dir2_skipped = lazy and e12 < th
+    e21 = None if dir2_skipped else entailment_score(R2, H1)  # R2 => H1
+
+    score = e12 if dir2_skipped else min(e12, e21)
     pred = int(score >= th)
 
     return {
@@ -52,7 +55,8 @@ def feature_equivalence(R1, F1, R2, F2, th=0.7):
         "e12": e12,
         "e21": e21,
         "score": score,
-        "pred": pred
+        "pred": pred,
+        "dir2_skipped": dir2_skipped
     }
 
 # Example
@@ -70,8 +70,11 @@ print("CV avg (precision, recall, f1):",
 # 5) Predict function for new pairs
 FINAL_T = float(np.median(ts))
 
-def predict_same_feature(review1, feature1, review2, feature2, t=FINAL_T):
+def predict_same_feature(review1, feature1, review2, feature2, t=FINAL_T, lazy=False):
     s12 = entail_prob(review1, H(feature2))
+    if lazy and s12 < t:
+        # min(s12, s21) < t already, so skip the second NLI call (score is s12, an upper bound)
+        return 0, s12
     s21 = entail_prob(review2, H(feature1))
     score = min(s12, s21)
     ans = 1 if score >= t else 0
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Embedding-based candidate blocking for all-vs-all feature matching.
+
+Instead of scoring all N^2 (feature, review) mention pairs with NLI, embed every mention with
+`build_embeddings`, take its top-k nearest neighbours by cosine, and emit only those pairs in the
+pair-CSV layout that score_demo.py / nli_enhanced_eval.py read.
+
+Pair CSV in (mentions = both sides of every row, deduplicated):
+python3 candidate_pairs.py --csv "Ground Truth.csv" --top-k 20 --out candidate_pairs.csv
+
+Mention table in:
+python3 candidate_pairs.py --csv mentions.csv --feature-col feature --review-col review \
+  --top-k 50 --index faiss-hnsw --out candidate_pairs.csv
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from nli_enhanced_eval import (
+    COL_F1,
+    COL_F2,
+    COL_FIAZ,
+    COL_NAVEEN,
+    COL_R1,
+    COL_R2,
+    build_embeddings,
+    consensus_mask,
+    read_table,
+    safe_int_series,
+    write_table,
+)
+
+
+def load_mentions(df: pd.DataFrame, feature_col: str, review_col: str) -> pd.DataFrame:
+    """Unique (feature, review) mentions from a mention table or from both sides of a pair CSV."""
+    if feature_col and review_col:
+        mentions = df[[feature_col, review_col]].set_axis(["feature", "review"], axis=1)
+    else:
+        left = df[[COL_F1, COL_R1]].set_axis(["feature", "review"], axis=1)
+        right = df[[COL_F2, COL_R2]].set_axis(["feature", "review"], axis=1)
+        mentions = pd.concat([left, right], ignore_index=True)
+    mentions = mentions.fillna("").astype(str)
+    return mentions.drop_duplicates().reset_index(drop=True)
+
+
+def mention_vectors(
+    mentions: pd.DataFrame,
+    emb_map: Dict[str, np.ndarray],
+    embed_on: str,
+) -> np.ndarray:
+    """L2-normalized float32 vector per mention (feature text, review text, or their sum)."""
+    parts = []
+    if embed_on in {"feature", "both"}:
+        parts.append(np.stack([emb_map[t] for t in mentions["feature"]]))
+    if embed_on in {"review", "both"}:
+        parts.append(np.stack([emb_map[t] for t in mentions["review"]]))
+    vec = np.sum(parts, axis=0).astype(np.float32)
+    vec /= np.maximum(np.linalg.norm(vec, axis=1, keepdims=True), 1e-12)
+    return vec
+
+
+def topk_numpy(vec: np.ndarray, k: int, block_rows: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Exact top-k neighbours by inner product (self excluded), one query block at a time."""
+    n = len(vec)
+    k = min(k, n - 1)
+    if block_rows <= 0:
+        # Keep each (block x n) similarity matrix around 256 MB of float32.
+        block_rows = max(1, (1 << 26) // max(n, 1))
+    nbr = np.zeros((n, k), dtype=np.int64)
+    sim = np.zeros((n, k), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        s = vec[start:stop] @ vec.T
+        s[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        part = np.argpartition(-s, k - 1, axis=1)[:, :k]
+        part_sim = np.take_along_axis(s, part, axis=1)
+        order = np.argsort(-part_sim, axis=1, kind="stable")
+        nbr[start:stop] = np.take_along_axis(part, order, axis=1)
+        sim[start:stop] = np.take_along_axis(part_sim, order, axis=1)
+    return nbr, sim
+
+
+def topk_faiss(
+    vec: np.ndarray,
+    k: int,
+    index_type: str,
+    nlist: int,
+    nprobe: int,
+    hnsw_m: int,
+    ef_search: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Approximate top-k with faiss (flat, IVF or HNSW over inner product on normalized vectors)."""
+    try:
+        import faiss
+    except ImportError as exc:
+        raise RuntimeError(f"--index {index_type} requires faiss (pip install faiss-cpu).") from exc
+    n, d = vec.shape
+    k = min(k, n - 1)
+    if index_type == "faiss-ivf":
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFFlat(quantizer, d, max(1, min(nlist, n // 39)), faiss.METRIC_INNER_PRODUCT)
+        index.train(vec)
+        index.nprobe = nprobe
+    elif index_type == "faiss-hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = max(ef_search, k + 1)
+    else:
+        index = faiss.IndexFlatIP(d)
+    index.add(vec)
+    sim, nbr = index.search(vec, k + 1)
+    # Drop each query's own id (or the last hit if the index missed it).
+    keep = nbr != np.arange(n)[:, None]
+    keep[keep.sum(axis=1) > k, -1] = False
+    return nbr[keep].reshape(n, k).astype(np.int64), sim[keep].reshape(n, k)
+
+
+def candidate_pairs(nbr: np.ndarray, sim: np.ndarray, min_cosine: float) -> pd.DataFrame:
+    """Unordered, deduplicated (i, j) pairs from the neighbour lists."""
+    i = np.repeat(np.arange(len(nbr)), nbr.shape[1])
+    j = nbr.ravel()
+    s = sim.ravel()
+    ok = (j >= 0) & (s >= min_cosine)
+    lo = np.minimum(i[ok], j[ok])
+    hi = np.maximum(i[ok], j[ok])
+    pairs = pd.DataFrame({"mention_1": lo, "mention_2": hi, "cosine": s[ok]})
+    return pairs.drop_duplicates(["mention_1", "mention_2"]).reset_index(drop=True)
+
+
+def blocking_recall(df: pd.DataFrame, mentions: pd.DataFrame, pairs: pd.DataFrame) -> Optional[float]:
+    """Share of consensus-positive labelled pairs that survive blocking (pair CSV input only)."""
+    if not {COL_FIAZ, COL_NAVEEN}.issubset(df.columns):
+        return None
+    fiaz = safe_int_series(df[COL_FIAZ])
+    naveen = safe_int_series(df[COL_NAVEEN])
+    pos = df[consensus_mask(fiaz, naveen) & (fiaz == 1)]
+    if pos.empty:
+        return None
+    ids = {m: i for i, m in enumerate(zip(mentions["feature"], mentions["review"]))}
+    found = set(zip(pairs["mention_1"], pairs["mention_2"]))
+    hits = 0
+    for a, b in zip(
+        zip(pos[COL_F1].fillna("").astype(str), pos[COL_R1].fillna("").astype(str)),
+        zip(pos[COL_F2].fillna("").astype(str), pos[COL_R2].fillna("").astype(str)),
+    ):
+        i, j = ids[a], ids[b]
+        hits += (min(i, j), max(i, j)) in found
+    return hits / len(pos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Top-k embedding candidate pairs for NLI feature matching.")
+    parser.add_argument("--csv", default="Ground Truth.csv", help="Pair CSV or mention table (.csv/.parquet).")
+    parser.add_argument("--feature-col", default="", help="Feature column of a mention table (default: pair CSV).")
+    parser.add_argument("--review-col", default="", help="Review column of a mention table (default: pair CSV).")
+    parser.add_argument("--out", default="candidate_pairs.csv")
+    parser.add_argument("--output-format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument(
+        "--embed-on",
+        choices=["feature", "review", "both"],
+        default="feature",
+        help="Text used for the mention vector; both = normalized sum of feature and review embeddings.",
+    )
+    parser.add_argument("--top-k", type=int, default=20, help="Neighbours kept per mention.")
+    parser.add_argument("--min-cosine", type=float, default=-1.0, help="Drop candidate pairs below this cosine.")
+    parser.add_argument(
+        "--index",
+        choices=["auto", "numpy", "faiss-flat", "faiss-ivf", "faiss-hnsw"],
+        default="auto",
+        help="auto: faiss-hnsw when faiss is installed, otherwise exact NumPy brute force.",
+    )
+    parser.add_argument("--block-rows", type=int, default=0, help="Query rows per NumPy block (0 = auto).")
+    parser.add_argument("--ivf-nlist", type=int, default=1024)
+    parser.add_argument("--ivf-nprobe", type=int, default=16)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--hnsw-ef-search", type=int, default=128)
+    args = parser.parse_args()
+
+    df = read_table(args.csv)
+    mentions = load_mentions(df, args.feature_col, args.review_col)
+    n = len(mentions)
+    if n < 2:
+        raise ValueError("Need at least two distinct mentions.")
+    print(f"Mentions: {n} unique (feature, review) pairs from {args.csv}")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Loading embedding model: {args.embedding_model} on device={device}")
+    emb_tok = AutoTokenizer.from_pretrained(args.embedding_model)
+    emb_model = AutoModel.from_pretrained(args.embedding_model).to(device)
+    emb_model.eval()
+    texts: List[str] = []
+    if args.embed_on in {"feature", "both"}:
+        texts.extend(mentions["feature"])
+    if args.embed_on in {"review", "both"}:
+        texts.extend(mentions["review"])
+    emb_map = build_embeddings(texts, emb_tok, emb_model, device=device)
+    vec = mention_vectors(mentions, emb_map, args.embed_on)
+
+    index = args.index
+    if index == "auto":
+        try:
+            import faiss  # noqa: F401
+
+            index = "faiss-hnsw"
+        except ImportError:
+            index = "numpy"
+    t0 = time.perf_counter()
+    if index == "numpy":
+        nbr, sim = topk_numpy(vec, args.top_k, args.block_rows)
+    else:
+        nbr, sim = topk_faiss(
+            vec, args.top_k, index, args.ivf_nlist, args.ivf_nprobe, args.hnsw_m, args.hnsw_ef_search
+        )
+    search_sec = time.perf_counter() - t0
+
+    pairs = candidate_pairs(nbr, sim, args.min_cosine)
+    m1 = mentions.iloc[pairs["mention_1"]].reset_index(drop=True)
+    m2 = mentions.iloc[pairs["mention_2"]].reset_index(drop=True)
+    out = pd.DataFrame(
+        {
+            COL_F1: m1["feature"],
+            COL_R1: m1["review"],
+            COL_F2: m2["feature"],
+            COL_R2: m2["review"],
+            "mention_1": pairs["mention_1"],
+            "mention_2": pairs["mention_2"],
+            "cosine": pairs["cosine"],
+        }
+    )
+    out_path = write_table(out, Path(args.out), args.output_format)
+
+    all_pairs = n * (n - 1) // 2
+    print(
+        f"Index={index} top_k={args.top_k}: {len(out)} candidate pairs of {all_pairs} "
+        f"({len(out) / max(all_pairs, 1):.4%}, {2 * len(out)} NLI calls instead of {2 * all_pairs}) "
+        f"in {search_sec:.2f}s"
+    )
+    recall = blocking_recall(df, mentions, pairs)
+    if recall is not None:
+        print(f"Blocking recall on consensus-positive labelled pairs: {recall:.4f}")
+    print(f"Saved candidate pairs: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Group (feature, review) mentions into equivalence clusters from pairwise scores.
+
+Reads a scored pair table (enhanced_row_scores.csv from nli_enhanced_eval.py, or candidate_pairs.py output
+with a score column), turns it into a sparse graph over unique mentions, and clusters it with either
+connected components (union-find) or pivot correlation clustering. Writes one row per mention with its
+cluster id, plus one row per cluster with size and cohesion stats.
+
+Connected components over predicted matches:
+python3 cluster_pairs.py --pairs enhanced_row_scores.csv --out-dir runs/clusters
+
+Correlation clustering over candidate cosines:
+python3 cluster_pairs.py --pairs candidate_pairs.csv --score-col cosine --threshold 0.8 \
+  --method correlation --out-dir runs/clusters
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from nli_enhanced_eval import (
+    COL_F1,
+    COL_F2,
+    COL_FIAZ,
+    COL_NAVEEN,
+    COL_R1,
+    COL_R2,
+    consensus_mask,
+    read_table,
+    safe_int_series,
+    write_table,
+)
+
+KEY_SEP = "\x1f"
+
+
+def mention_graph(df: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """Unique mentions plus int32 (src, dst) node ids for every row of the pair table."""
+    keys = pd.concat(
+        [
+            df[COL_F1].fillna("").astype(str) + KEY_SEP + df[COL_R1].fillna("").astype(str),
+            df[COL_F2].fillna("").astype(str) + KEY_SEP + df[COL_R2].fillna("").astype(str),
+        ],
+        ignore_index=True,
+    )
+    codes, uniques = pd.factorize(keys)
+    codes = codes.astype(np.int32)
+    parts = pd.Series(uniques).str.split(KEY_SEP, n=1, expand=True)
+    mentions = pd.DataFrame({"feature": parts[0], "review": parts[1]})
+    return mentions, codes[: len(df)], codes[len(df) :]
+
+
+def connected_components(n: int, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Component label per node; scipy's csgraph when available, else vectorized union-find."""
+    try:
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components as csgraph_components
+    except ImportError:
+        return union_find_components(n, src, dst)
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n)).tocsr()
+    _, labels = csgraph_components(graph, directed=False)
+    return labels.astype(np.int32)
+
+
+def union_find_components(n: int, src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """Union-find over whole edge arrays: hook roots to the smaller root, then compress paths."""
+    parent = np.arange(n, dtype=np.int32)
+    while True:
+        # Full path compression: afterwards every node points straight at its root.
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        ps, pd_ = parent[src], parent[dst]
+        if np.array_equal(ps, pd_):
+            return parent
+        low = np.minimum(ps, pd_)
+        np.minimum.at(parent, ps, low)
+        np.minimum.at(parent, pd_, low)
+
+
+def csr_adjacency(n: int, src: np.ndarray, dst: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Undirected adjacency as CSR (indptr, indices) built from both edge directions."""
+    a = np.concatenate([src, dst])
+    b = np.concatenate([dst, src])
+    order = np.argsort(a, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(a, minlength=n), out=indptr[1:])
+    return indptr, b[order]
+
+
+def pivot_clustering(n: int, src: np.ndarray, dst: np.ndarray, seed: int) -> np.ndarray:
+    """One KwikCluster pass: a random unassigned pivot takes all its unassigned positive neighbours."""
+    indptr, indices = csr_adjacency(n, src, dst)
+    labels = np.full(n, -1, dtype=np.int32)
+    next_label = 0
+    for pivot in np.random.default_rng(seed).permutation(n):
+        if labels[pivot] >= 0:
+            continue
+        nbrs = indices[indptr[pivot] : indptr[pivot + 1]]
+        labels[nbrs[labels[nbrs] < 0]] = next_label
+        labels[pivot] = next_label
+        next_label += 1
+    return labels
+
+
+def disagreements(labels: np.ndarray, src: np.ndarray, dst: np.ndarray, positive: np.ndarray) -> int:
+    """Correlation-clustering cost over scored edges: positives cut plus negatives kept together."""
+    same = labels[src] == labels[dst]
+    return int(np.count_nonzero(positive & ~same) + np.count_nonzero(~positive & same))
+
+
+def correlation_clustering(
+    n: int,
+    src: np.ndarray,
+    dst: np.ndarray,
+    positive: np.ndarray,
+    rounds: int,
+    seed: int,
+) -> Tuple[np.ndarray, int]:
+    """Best of `rounds` pivot passes by disagreement count; unscored pairs cost nothing either way."""
+    best, best_cost = None, None
+    for r in range(max(1, rounds)):
+        labels = pivot_clustering(n, src[positive], dst[positive], seed + r)
+        cost = disagreements(labels, src, dst, positive)
+        if best_cost is None or cost < best_cost:
+            best, best_cost = labels, cost
+    return best, best_cost
+
+
+def cluster_stats(
+    labels: np.ndarray,
+    mentions: pd.DataFrame,
+    src: np.ndarray,
+    dst: np.ndarray,
+    score: np.ndarray,
+    positive: np.ndarray,
+) -> pd.DataFrame:
+    """Per-cluster size and cohesion: density of positive edges, internal score stats, best outside score."""
+    k = int(labels.max()) + 1 if len(labels) else 0
+    size = np.bincount(labels, minlength=k)
+    ls, ld = labels[src], labels[dst]
+    inside = ls == ld
+    lab_in = ls[inside]
+    score_in = score[inside]
+    n_edges = np.bincount(lab_in, minlength=k)
+    n_pos = np.bincount(lab_in, weights=positive[inside], minlength=k).astype(np.int64)
+    score_sum = np.bincount(lab_in, weights=score_in, minlength=k)
+    min_score = np.full(k, np.inf)
+    np.minimum.at(min_score, lab_in, score_in)
+    max_out = np.full(k, -np.inf)
+    out = ~inside
+    np.maximum.at(max_out, ls[out], score[out])
+    np.maximum.at(max_out, ld[out], score[out])
+    possible = size * (size - 1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats = pd.DataFrame(
+            {
+                "cluster": np.arange(k, dtype=np.int32),
+                "size": size,
+                "scored_edges": n_edges,
+                "positive_edges": n_pos,
+                "density": np.where(possible > 0, n_pos / possible, 1.0),
+                "mean_score": np.where(n_edges > 0, score_sum / np.maximum(n_edges, 1), np.nan),
+                "min_score": np.where(np.isfinite(min_score), min_score, np.nan),
+                "max_outside_score": np.where(np.isfinite(max_out), max_out, np.nan),
+            }
+        )
+    top_feature = (
+        pd.DataFrame({"cluster": labels, "feature": mentions["feature"].to_numpy()})
+        .value_counts(sort=True)
+        .reset_index()
+        .drop_duplicates("cluster")
+        .set_index("cluster")["feature"]
+    )
+    stats["top_feature"] = stats["cluster"].map(top_feature)
+    return stats.sort_values(["size", "cluster"], ascending=[False, True]).reset_index(drop=True)
+
+
+def relabel_by_size(labels: np.ndarray) -> np.ndarray:
+    """Renumber clusters so 0 is the largest (ties broken by first label), keeping ids dense."""
+    _, dense = np.unique(labels, return_inverse=True)
+    size = np.bincount(dense)
+    order = np.lexsort((np.arange(len(size)), -size))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[dense].astype(np.int32)
+
+
+def label_agreement(df: pd.DataFrame, labels: np.ndarray, src: np.ndarray, dst: np.ndarray) -> Optional[dict]:
+    """Pairwise precision/recall of "same cluster" against consensus gold labels, when present."""
+    if not {COL_FIAZ, COL_NAVEEN}.issubset(df.columns):
+        return None
+    fiaz = safe_int_series(df[COL_FIAZ])
+    naveen = safe_int_series(df[COL_NAVEEN])
+    mask = consensus_mask(fiaz, naveen).to_numpy()
+    if not mask.any():
+        return None
+    gold = fiaz.to_numpy()[mask] == 1
+    same = labels[src[mask]] == labels[dst[mask]]
+    tp = int(np.count_nonzero(same & gold))
+    return {
+        "pairs": int(mask.sum()),
+        "precision": tp / max(int(same.sum()), 1),
+        "recall": tp / max(int(gold.sum()), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cluster mentions into same-feature groups from pairwise scores.")
+    parser.add_argument("--pairs", default="enhanced_row_scores.csv", help="Scored pair table (.csv/.parquet).")
+    parser.add_argument("--score-col", default="final_score", help="Edge score column used for cohesion stats.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=None,
+        help="Positive edge when score >= threshold. Default: use --pred-col instead.",
+    )
+    parser.add_argument("--pred-col", default="pred", help="0/1 column marking positive edges (no --threshold).")
+    parser.add_argument("--method", choices=["components", "correlation"], default="components")
+    parser.add_argument("--pivot-rounds", type=int, default=5, help="Pivot passes tried by --method correlation.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-size", type=int, default=2, help="Smallest cluster listed in the stats table.")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--output-format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    cols = [COL_F1, COL_R1, COL_F2, COL_R2, args.score_col, COL_FIAZ, COL_NAVEEN]
+    if args.threshold is None:
+        cols.append(args.pred_col)
+    df = read_table(args.pairs, columns=cols)
+    if args.score_col not in df.columns:
+        raise ValueError(f"Score column {args.score_col!r} not found in {args.pairs}.")
+    if args.threshold is None and args.pred_col not in df.columns:
+        raise ValueError(f"Pass --threshold or provide the {args.pred_col!r} column.")
+
+    t0 = time.perf_counter()
+    mentions, src, dst = mention_graph(df)
+    score = pd.to_numeric(df[args.score_col], errors="coerce").to_numpy(dtype=np.float32)
+    if args.threshold is None:
+        positive = pd.to_numeric(df[args.pred_col], errors="coerce").fillna(0).to_numpy() > 0
+    else:
+        positive = np.nan_to_num(score, nan=-np.inf) >= args.threshold
+    # Self-pairs carry no grouping information.
+    keep = src != dst
+    src, dst, score, positive = src[keep], dst[keep], score[keep], positive[keep]
+    n = len(mentions)
+
+    if args.method == "components":
+        labels = connected_components(n, src[positive], dst[positive])
+        cost = disagreements(labels, src, dst, positive)
+    else:
+        labels, cost = correlation_clustering(n, src, dst, positive, args.pivot_rounds, args.seed)
+    labels = relabel_by_size(labels)
+    cluster_sec = time.perf_counter() - t0
+
+    stats = cluster_stats(labels, mentions, src, dst, score, positive)
+    sizes = stats["size"].to_numpy()
+    print(
+        f"Graph: {n} mentions, {len(src)} scored edges, {int(positive.sum())} positive "
+        f"({args.method}, {cluster_sec:.2f}s)"
+    )
+    print(
+        f"Clusters: {len(stats)} total, {int((sizes >= 2).sum())} with 2+ mentions, "
+        f"largest={int(sizes.max()) if len(sizes) else 0}, disagreements={cost}"
+    )
+    agreement = label_agreement(df.loc[keep], labels, src, dst)
+    if agreement is not None:
+        print(
+            f"Same-cluster vs consensus labels ({agreement['pairs']} pairs): "
+            f"precision={agreement['precision']:.4f} recall={agreement['recall']:.4f}"
+        )
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    assignments = mentions.assign(cluster=labels, cluster_size=np.bincount(labels)[labels])
+    assign_path = write_table(
+        assignments.sort_values(["cluster", "feature"], kind="stable"),
+        out_dir / "cluster_assignments.csv",
+        args.output_format,
+    )
+    stats_path = write_table(stats[stats["size"] >= args.min_size], out_dir / "cluster_stats.csv", args.output_format)
+    print(f"Saved cluster assignments: {assign_path}")
+    print(f"Saved cluster stats: {stats_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,243 +1,572 @@
-from nltk.metrics import agreement, ConfusionMatrix
-import itertools
+import argparse
 import csv
+import json
+import math
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain, islice
+from pathlib import Path
 
-def load_annotators():
-    """Load annotator names from CSV header"""
-    with open('annotations.csv', 'r') as f:
-        reader = csv.reader(f)
-        annotators = [name.strip() for name in next(reader)]  # First row contains annotator names (Annotator 1,Annotator 2,Annotator 3, etc.)
-    return annotators
-
-def load_data(annotators):
-    """Load data from CSV file"""
-    data = []
-    with open('annotations.csv', 'r') as f:
-        reader = csv.reader(f)
-        next(reader)  # Skip header row
-        for row_idx, row in enumerate(reader, start=1):
-            datapoint = f"datapoint_{row_idx}"  # Use row number as datapoint identifier
-            for annotator_idx, answer in enumerate(row):
-                answer = answer.strip()
-                if answer:  # Only add if answer is not empty
-                    data.append([annotators[annotator_idx], datapoint, answer])
-    return data
-
-def get_annotator_answers(annotator_name, datapoints):
-    annotator_answers = []
-    for i,answers in datapoints.items():
-        for annotator, answer in answers.items():
-            if annotator == annotator_name:
-                annotator_answers.append(answer)
-    return annotator_answers
-
-def get_datapoints(data):
-    datapoints = {}
-    for i in data:
-        if i[1] not in datapoints:
-            datapoints[i[1]] = {}
-        datapoints[i[1]][i[0]] = i[2]
-    return datapoints
-
-def get_disagreements(datapoints):
-    disagreements = {}
-    for i,answers in datapoints.items():
-        if len(set(answers.values())) > 1:
-            disagreements[i] = answers
-    return disagreements
-
-def calculate_fleiss_kappa(datapoints, annotators):
+import numpy as np
+
+# Upper bound on rating pairs expanded per counting block.
+MAX_BLOCK_CELLS = 8_000_000
+
+class SparseAnnotations:
+    """
+    CSR-style item × annotator matrix: the ratings of item i are
+    annotators[indptr[i]:indptr[i+1]] with category codes codes[indptr[i]:indptr[i+1]].
+    Only present ratings are stored, so size is proportional to the number of annotations.
+    """
+
+    def __init__(self, indptr, annotators, codes):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.annotators = np.asarray(annotators, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int64)
+
+    @classmethod
+    def from_dense(cls, codes):
+        """From codes[item, annotator] with -1 for a missing rating."""
+        codes = np.asarray(codes, dtype=np.int64)
+        rows, cols = np.nonzero(codes >= 0)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(codes)))])
+        return cls(indptr, cols, codes[rows, cols])
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def raters_per_item(self):
+        return np.diff(self.indptr)
+
+    def slice(self, start, stop):
+        lo, hi = self.indptr[start], self.indptr[stop]
+        return SparseAnnotations(self.indptr[start:stop + 1] - lo, self.annotators[lo:hi], self.codes[lo:hi])
+
+class AgreementCounts:
+    """
+    Sufficient statistics for inter-annotator agreement, accumulated in a single pass.
+    Memory is O(annotators² × categories²) regardless of the number of items:
+      cooc[a, i, b, j]     = items where annotator a answered category i and annotator b answered j
+      category_totals[i]   = all assignments of category i
+      sum_item_agreement   = Σ_items P_i with P_i = Σ_j n_ij (n_ij - 1) / (n_i (n_i - 1))  (Fleiss' P̄)
+      n_agreement_items    = items with at least two ratings (the ones P̄ averages over)
+    Each item uses its own rater count n_i, so sparse data (3-5 of many annotators per item) is
+    handled exactly, and counting cost scales with the number of ratings.
+    Annotator and category codes follow first appearance; sorted_categories() gives the reporting order.
+    Counts from disjoint sets of items can be combined with merge().
+    """
+
+    def __init__(self, annotators=()):
+        self.annotators = list(annotators)
+        self._annotator_index = {a: i for i, a in enumerate(self.annotators)}
+        self.categories = []
+        self._category_index = {}
+        self.n_items = 0
+        self.n_disagreements = 0
+        self.sum_item_agreement = 0.0
+        self.n_agreement_items = 0
+        n_a = len(self.annotators)
+        self.cooc = np.zeros((n_a, 0, n_a, 0), dtype=np.int64)
+        self.category_totals = np.zeros(0, dtype=np.int64)
+
+    def category_code(self, answer):
+        code = self._category_index.get(answer)
+        if code is None:
+            code = len(self.categories)
+            self._category_index[answer] = code
+            self.categories.append(answer)
+        return code
+
+    def annotator_code(self, annotator):
+        code = self._annotator_index.get(annotator)
+        if code is None:
+            code = len(self.annotators)
+            self._annotator_index[annotator] = code
+            self.annotators.append(annotator)
+        return code
+
+    def _grow(self):
+        extra_a = len(self.annotators) - self.cooc.shape[0]
+        extra_k = len(self.categories) - self.cooc.shape[1]
+        if extra_a > 0 or extra_k > 0:
+            self.cooc = np.pad(self.cooc, ((0, extra_a), (0, extra_k), (0, extra_a), (0, extra_k)))
+        if extra_k > 0:
+            self.category_totals = np.pad(self.category_totals, (0, extra_k))
+
+    def add_rows(self, codes):
+        """Accumulate a chunk of rows: codes[item, annotator] = category code, or -1 when missing."""
+        codes = np.asarray(codes, dtype=np.int64).reshape(-1, len(self.annotators))
+        self.add_sparse(SparseAnnotations.from_dense(codes))
+
+    def add_sparse(self, sparse):
+        """Accumulate a SparseAnnotations chunk; items without ratings are not datapoints."""
+        self._grow()
+        sizes = sparse.raters_per_item
+        # Split so the rating pairs expanded per block (Σ n_i² over its items) stay bounded.
+        cum = np.cumsum(sizes.astype(np.int64) ** 2)
+        start = 0
+        while start < len(sparse):
+            base = cum[start - 1] if start else 0
+            stop = int(np.searchsorted(cum, base + MAX_BLOCK_CELLS, side='right'))
+            stop = max(stop, start + 1)
+            self._add_block(sparse.slice(start, stop))
+            start = stop
+
+    def _add_block(self, sparse):
+        n_a, n_k = len(self.annotators), len(self.categories)
+        sizes = sparse.raters_per_item
+        present = sizes > 0
+        item_of = np.repeat(np.arange(len(sparse)), sizes)
+        a, k = sparse.annotators, sparse.codes
+        # Every ordered pair of ratings on the same item (self pairs included, as in a Gram matrix).
+        reps = sizes[item_of]
+        left = np.repeat(np.arange(len(a)), reps)
+        group_start = np.repeat(np.cumsum(reps) - reps, reps)
+        right = sparse.indptr[item_of[left]] + (np.arange(len(left)) - group_start)
+        flat = ((a[left] * n_k + k[left]) * n_a + a[right]) * n_k + k[right]
+        self.cooc += np.bincount(flat, minlength=self.cooc.size).reshape(self.cooc.shape)
+        # Per-item category counts n_ij: items × categories, never items × annotators.
+        n_ij = np.bincount(item_of * n_k + k, minlength=len(sparse) * n_k).reshape(len(sparse), n_k)
+        self.category_totals += n_ij.sum(axis=0)
+        multi = sizes >= 2
+        pairs_agree = (n_ij * (n_ij - 1)).sum(axis=1)
+        self.sum_item_agreement += float((pairs_agree[multi] / (sizes[multi] * (sizes[multi] - 1))).sum())
+        self.n_agreement_items += int(multi.sum())
+        self.n_items += int(present.sum())
+        self.n_disagreements += int(((n_ij > 0).sum(axis=1) > 1).sum())
+
+    def _codes_from(self, other):
+        """Map another object's annotator/category codes onto this one's (adding new ones)."""
+        a_map = np.array([self.annotator_code(a) for a in other.annotators], dtype=np.int64)
+        k_map = np.array([self.category_code(c) for c in other.categories], dtype=np.int64)
+        self._grow()
+        return a_map, k_map
+
+    def merge(self, other):
+        """Add counts accumulated over a disjoint set of items (e.g. another shard of the file)."""
+        a_map, k_map = self._codes_from(other)
+        if len(a_map) and len(k_map):
+            self.cooc[np.ix_(a_map, k_map, a_map, k_map)] += other.cooc
+            self.category_totals[k_map] += other.category_totals
+        self.sum_item_agreement += other.sum_item_agreement
+        self.n_agreement_items += other.n_agreement_items
+        self.n_items += other.n_items
+        self.n_disagreements += other.n_disagreements
+        return self
+
+    def snapshot(self):
+        """Current agreement: pairwise Cohen's kappa, k-bar, Fleiss' kappa and the NLTK-style multi_kappa."""
+        pairs, _, tensor = self.confusion_tensor()
+        observed, expected, kappa = pairwise_agreement(tensor)
+        return {
+            "n_items": self.n_items,
+            "n_disagreements": self.n_disagreements,
+            "pairwise_kappa": {pair: float(k) for pair, k in zip(pairs, kappa)},
+            "k_bar": average_kappa(kappa),
+            "fleiss_kappa": calculate_fleiss_kappa(self),
+            "multi_kappa": multi_kappa(observed, expected),
+        }
+
+    def sorted_categories(self):
+        order = sorted(range(len(self.categories)), key=lambda i: self.categories[i])
+        return [self.categories[i] for i in order], np.array(order, dtype=np.int64)
+
+    def confusion_tensor(self):
+        """
+        All pairwise confusion matrices as (pairs, tensor), tensor[p, i, j] counting items on which
+        the first annotator of pairs[p] answered categories[i] and the second answered categories[j].
+        """
+        categories, order = self.sorted_categories()
+        cooc = self.cooc[:, order][:, :, :, order].transpose(0, 2, 1, 3)
+        first, second = np.triu_indices(len(self.annotators), k=1)
+        pairs = [(self.annotators[i], self.annotators[j]) for i, j in zip(first, second)]
+        return pairs, categories, cooc[first, second]
+
+class OnlineAgreement(AgreementCounts):
+    """
+    Agreement statistics that can be updated as annotations arrive.
+    On top of AgreementCounts it keeps each item's current ratings, so a late rating (or a
+    relabel) for an already-seen item updates the counts exactly, and shards that saw the
+    same item can still be merged.
+    """
+
+    def __init__(self, annotators=()):
+        super().__init__(annotators)
+        self.items = {}  # item -> {annotator code: category code}
+
+    def _apply_item(self, ratings, sign):
+        """Add (sign=1) or remove (sign=-1) one item's contribution to every count."""
+        if not ratings:
+            return
+        self._grow()
+        a = np.fromiter(ratings.keys(), dtype=np.int64, count=len(ratings))
+        k = np.fromiter(ratings.values(), dtype=np.int64, count=len(ratings))
+        np.add.at(self.cooc, (a[:, None], k[:, None], a[None, :], k[None, :]), sign)
+        np.add.at(self.category_totals, k, sign)
+        n_k = np.bincount(k)
+        n_i = len(ratings)
+        if n_i >= 2:
+            self.sum_item_agreement += sign * float((n_k * (n_k - 1)).sum()) / (n_i * (n_i - 1))
+            self.n_agreement_items += sign
+        self.n_items += sign
+        self.n_disagreements += sign * int((n_k > 0).sum() > 1)
+
+    def update(self, batch):
+        """Apply a batch of (annotator, item, answer) triples; a repeated (annotator, item) replaces the old answer."""
+        touched = {}
+        for annotator, item, answer in batch:
+            answer = str(answer).strip()
+            if not answer:
+                continue
+            if item not in touched:
+                touched[item] = dict(self.items.get(item, {}))
+            touched[item][self.annotator_code(annotator)] = self.category_code(answer)
+        for item, ratings in touched.items():
+            self._apply_item(self.items.get(item), -1)
+            self._apply_item(ratings, 1)
+            self.items[item] = ratings
+        return self
+
+    def merge(self, other):
+        """
+        Merge another shard. Items seen by both shards are combined (the other shard's answer
+        wins if the same annotator rated the same item in both).
+        """
+        if not isinstance(other, OnlineAgreement):
+            return super().merge(other)
+        a_map, k_map = self._codes_from(other)
+        overlap = self.items.keys() & other.items.keys()
+        super().merge(other)
+        for item, ratings in other.items.items():
+            mapped = {int(a_map[a]): int(k_map[c]) for a, c in ratings.items()}
+            if item in overlap:
+                # Both shards' partial contributions were added; replace them with the combined item.
+                self._apply_item(self.items[item], -1)
+                self._apply_item(mapped, -1)
+                combined = {**self.items[item], **mapped}
+                self._apply_item(combined, 1)
+                self.items[item] = combined
+            else:
+                self.items[item] = mapped
+        return self
+
+def _count_chunk(annotators, categories, sparse):
+    """Worker task: counts for one chunk of rows, to be merged by the reader."""
+    counts = AgreementCounts(annotators)
+    for category in categories:
+        counts.category_code(category)
+    counts.add_sparse(sparse)
+    return counts
+
+def scan_annotations(path='annotations.csv', disagreements_path=None, chunk_size=50000, workers=1):
+    """
+    Read the annotations CSV once (header of annotator names, one row per datapoint; empty
+    cells are missing ratings) and accumulate AgreementCounts chunk by chunk. Each chunk is
+    kept in CSR form (SparseAnnotations), holding only the ratings that are present. Disagreeing datapoints are streamed to
+    `disagreements_path` as JSON lines while scanning.
+    With workers > 1, chunks are counted in a process pool and merged as they finish; the
+    reader keeps at most two chunks per worker in flight.
+    """
+    out = open(disagreements_path, 'w') if disagreements_path else None
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = set()
+    # Raw cell text -> category code (-1 for an empty cell); a chunk only strips cells it has not seen.
+    cell_codes = {}
+    # JSON-encoded category of each code, so disagreement lines are formatted without json.dumps per row.
+    category_json = []
+
+    def flush(rows, first_row):
+        width = len(annotators)
+        if any(len(row) != width for row in rows):
+            rows = [(row + [''] * width)[:width] for row in rows]
+        cells = list(chain.from_iterable(rows))
+        for cell in dict.fromkeys(cells):  # first-appearance order, so codes match a cell-by-cell scan
+            if cell not in cell_codes:
+                answer = cell.strip()
+                cell_codes[cell] = counts.category_code(answer) if answer else -1
+        while len(category_json) < len(counts.categories):
+            category_json.append(json.dumps(counts.categories[len(category_json)]))
+        codes = np.fromiter(map(cell_codes.__getitem__, cells), dtype=np.int64, count=len(cells)).reshape(-1, width)
+        if out is not None:
+            present = codes >= 0
+            lo = np.where(present, codes, np.iinfo(np.int64).max).min(axis=1)
+            hi = np.where(present, codes, -1).max(axis=1)
+            rows_out = np.nonzero(hi > lo)[0]
+            # "annotator": "answer" fragment per (annotator, code); the last entry of each list is for code -1.
+            fragments = [[f"{name}: {cat}" for cat in category_json] + [None] for name in annotator_json]
+            lines = []
+            for i, row_codes in zip(rows_out.tolist(), codes[rows_out].tolist()):
+                answers = ", ".join([frag[c] for frag, c in zip(fragments, row_codes) if c >= 0])
+                # Use row number as datapoint identifier
+                lines.append(f'{{"datapoint": "datapoint_{first_row + i}", "answers": {{{answers}}}}}\n')
+            out.write("".join(lines))
+        chunk = SparseAnnotations.from_dense(codes)
+        if pool is None:
+            counts.add_sparse(chunk)
+            return
+        pending.add(pool.submit(_count_chunk, annotators, list(counts.categories), chunk))
+        while len(pending) >= 2 * workers:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.remove(fut)
+                counts.merge(fut.result())
+
+    try:
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            annotators = [name.strip() for name in next(reader)]  # First row contains annotator names (Annotator 1,Annotator 2,Annotator 3, etc.)
+            annotator_json = [json.dumps(name) for name in annotators]
+            counts = AgreementCounts(annotators)
+            first_row = 1
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    break
+                flush(rows, first_row)
+                first_row += len(rows)
+            for fut in pending:
+                counts.merge(fut.result())
+    finally:
+        if out is not None:
+            out.close()
+        if pool is not None:
+            pool.shutdown()
+    return counts
+
+def calculate_fleiss_kappa(counts):
     """
-    Calculate Fleiss' kappa manually to verify correctness.
+    Calculate Fleiss' kappa from accumulated counts.
     Fleiss' kappa formula: κ = (P̄ - P̄e) / (1 - P̄e)
     Where:
-      P̄ = average proportion of agreement across all items
+      P̄ = average proportion of agreement across items with two or more ratings
       P̄e = expected proportion of agreement by chance
     """
-    # Count annotations per category per item
-    n_items = len(datapoints)
-    n_annotators = len(annotators)
-    
-    # Get all unique categories
-    all_categories = set()
-    for answers in datapoints.values():
-        all_categories.update(answers.values())
-    categories = sorted(list(all_categories))
-    
-    # Count how many annotators assigned each category to each item
-    n_ij = {}  # n_ij[i][category] = number of annotators who assigned category to item i
-    for item, answers in datapoints.items():
-        n_ij[item] = {}
-        for cat in categories:
-            n_ij[item][cat] = sum(1 for ans in answers.values() if ans == cat)
-    
-    # Calculate P̄ (average proportion of agreement)
-    sum_pi = 0.0
-    for item in datapoints.keys():
-        pi = 0.0
-        for cat in categories:
-            n_cat = n_ij[item][cat]
-            pi += n_cat * (n_cat - 1)
-        if n_annotators > 1:
-            pi = pi / (n_annotators * (n_annotators - 1))
-        sum_pi += pi
-    P_bar = sum_pi / n_items
-    
-    # Calculate P̄e (expected proportion of agreement by chance)
-    # Count total assignments per category across all items
-    p_j = {}  # p_j[category] = proportion of all assignments that are this category
-    total_assignments = 0
-    category_counts = {cat: 0 for cat in categories}
-    
-    for answers in datapoints.values():
-        for ans in answers.values():
-            category_counts[ans] += 1
-            total_assignments += 1
-    
-    for cat in categories:
-        p_j[cat] = category_counts[cat] / total_assignments if total_assignments > 0 else 0
-    
-    P_bar_e = sum(p_j[cat] ** 2 for cat in categories)
-    
+    if counts.n_agreement_items == 0:
+        return 0.0
+
+    # P̄: P_i = Σ_j n_ij (n_ij - 1) / (n_i (n_i - 1)) with each item's own rater count n_i,
+    # averaged over items rated at least twice
+    P_bar = counts.sum_item_agreement / counts.n_agreement_items
+
+    # P̄e: squared share of all assignments per category
+    total_assignments = counts.category_totals.sum()
+    p_j = counts.category_totals / total_assignments if total_assignments > 0 else counts.category_totals * 0.0
+    P_bar_e = float((p_j ** 2).sum())
+
     # Calculate Fleiss' kappa
     if P_bar_e == 1.0:
         kappa = 1.0  # Perfect agreement
     else:
         kappa = (P_bar - P_bar_e) / (1 - P_bar_e)
-    
+
     return kappa
 
-annotators = load_annotators()
-data = load_data(annotators)
-datapoints = get_datapoints(data)
-
-# Create annotation task with data in format: [annotator, datapoint, annotation]
-# This allows NLTK to compute agreement statistics
-task = agreement.AnnotationTask(data=data)
-
-# Open file for detailed results
-output_file = 'kappa_results.txt'
-with open(output_file, 'w') as f:
-    f.write("="*60 + "\n")
-    f.write("INTER-ANNOTATOR AGREEMENT ANALYSIS\n")
-    f.write("="*60 + "\n\n")
-    
-    # Calculate pairwise kappa for each pair of annotators
-    # Kappa formula: κ = (Po - Pe) / (1 - Pe)
-    # Where:
-    #   Po = Observed agreement (proportion of items where both annotators agree)
-    #   Pe = Expected agreement by chance (based on each annotator's label distribution)
-    for pair in itertools.combinations(annotators, 2):
-        f.write("\n\n*** " + pair[0] + " vs " + pair[1] + " ***\n")
-        
-        # Observed agreement: actual proportion of agreement
-        observed = task.Ao(pair[0],pair[1])
-        f.write(f"\nObserved agreement: {observed}\n")
-        
-        # Expected agreement: what we'd expect by chance
-        expected = task.Ae_kappa(pair[0],pair[1])
-        f.write(f"Expected agreement: {expected}\n")
-        
-        # Cohen's Kappa: (observed - expected) / (1 - expected)
-        # Range: -1 to 1, where:
-        #   1 = perfect agreement
-        #   0 = agreement equal to chance
-        #   <0 = agreement worse than chance
-        kappa = task.kappa_pairwise(pair[0],pair[1])
-        f.write(f"Pairwise kappa (Cohen's): {kappa}\n")
-        
-        # Show confusion matrix: how annotations align between the two annotators
-        a1 = get_annotator_answers(pair[0], datapoints)
-        a2 = get_annotator_answers(pair[1], datapoints)
-        cm = ConfusionMatrix(a1,a2)
-        f.write("\nConfusion Matrix:\n")
-        f.write(str(cm) + "\n")
-    
-    f.write("\n" + "="*60 + "\n")
-    f.write("Overall Inter-Annotator Agreement:\n")
-    f.write("="*60 + "\n")
-    
-    # Average pairwise kappa (k-bar)
-    k_bar = task.kappa()
-    f.write(f"k̄ (k-bar / Average Pairwise Kappa): {k_bar}\n")
-    f.write(f"\nInterpretation:\n")
-    if k_bar < 0:
-        interpretation = "Poor agreement (worse than chance)"
-    elif k_bar < 0.20:
-        interpretation = "Slight agreement"
-    elif k_bar < 0.40:
-        interpretation = "Fair agreement"
-    elif k_bar < 0.60:
-        interpretation = "Moderate agreement"
-    elif k_bar < 0.80:
-        interpretation = "Substantial agreement"
-    else:
-        interpretation = "Almost perfect agreement"
-    f.write(f"  {interpretation}\n")
-    
-    # Fleiss' Kappa - supports multiple annotators
-    f.write("\n" + "-"*60 + "\n")
-    f.write("Fleiss' Kappa (Multi-Annotator Metric):\n")
-    f.write("-"*60 + "\n")
-    fleiss_kappa = calculate_fleiss_kappa(datapoints, annotators)
-    fleiss_kappa_nltk = task.multi_kappa()
-    f.write(f"Fleiss' κ (Standard Formula): {fleiss_kappa}\n")
-    f.write(f"Fleiss' κ (NLTK variant): {fleiss_kappa_nltk}\n")
-    f.write(f"Difference: {abs(fleiss_kappa - fleiss_kappa_nltk)}\n")
-    f.write(f"\nWhy the difference?\n")
-    f.write(f"  - Standard Fleiss' κ: Calculates agreement across ALL annotators\n")
-    f.write(f"    simultaneously for each item, then averages across items.\n")
-    f.write(f"    This is the true multi-annotator metric.\n")
-    f.write(f"  - NLTK's multi_kappa: Averages pairwise observed agreements\n")
-    f.write(f"    and pairwise expected agreements separately, then applies\n")
-    f.write(f"    kappa formula. This is essentially averaging pairwise metrics.\n")
-    f.write(f"\nInterpretation:\n")
-    if fleiss_kappa < 0:
-        fleiss_interpretation = "Poor agreement (worse than chance)"
-    elif fleiss_kappa < 0.20:
-        fleiss_interpretation = "Slight agreement"
-    elif fleiss_kappa < 0.40:
-        fleiss_interpretation = "Fair agreement"
-    elif fleiss_kappa < 0.60:
-        fleiss_interpretation = "Moderate agreement"
-    elif fleiss_kappa < 0.80:
-        fleiss_interpretation = "Substantial agreement"
+def pairwise_agreement(tensor):
+    """
+    Observed agreement, expected agreement and Cohen's kappa for every pair in a confusion tensor.
+    Kappa formula: κ = (Po - Pe) / (1 - Pe)
+    Where:
+      Po = Observed agreement (proportion of items where both annotators agree)
+      Pe = Expected agreement by chance (based on each annotator's label distribution)
+    Both are taken over the items the two annotators rated in common; pairs that share no
+    item get NaN and are left out of the averages.
+    """
+    n = tensor.sum(axis=(1, 2)).astype(np.float64)
+    shared = n > 0
+    safe_n = np.where(shared, n, 1.0)
+    observed = np.where(shared, np.trace(tensor, axis1=1, axis2=2) / safe_n, np.nan)
+    expected = np.where(shared, (tensor.sum(axis=2) * tensor.sum(axis=1)).sum(axis=1) / (safe_n ** 2), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = (observed - expected) / (1.0 - expected)
+    # Degenerate case (both annotators used a single label): perfect agreement, as in NLTK.
+    degenerate = np.isclose(expected, 1.0)
+    kappa = np.where(degenerate, np.where(np.isclose(observed, 1.0), 1.0, np.nan), kappa)
+    return observed, expected, kappa
+
+def average_kappa(kappa):
+    """k-bar: mean pairwise kappa over pairs that share at least one item."""
+    kappa = kappa[~np.isnan(kappa)]
+    return float(np.mean(kappa)) if len(kappa) else float("nan")
+
+def multi_kappa(observed, expected):
+    """Davies and Fleiss 1982 (NLTK's multi_kappa): average Po and Pe over pairs, then apply kappa."""
+    shared = ~np.isnan(observed)
+    if not shared.any():
+        return float("nan")
+    ao = float(np.mean(observed[shared]))
+    ae = float(np.mean(expected[shared]))
+    if math.isclose(ae, 1.0):
+        return 1.0
+    return (ao - ae) / (1.0 - ae)
+
+def interpret_kappa(kappa):
+    if kappa < 0:
+        return "Poor agreement (worse than chance)"
+    elif kappa < 0.20:
+        return "Slight agreement"
+    elif kappa < 0.40:
+        return "Fair agreement"
+    elif kappa < 0.60:
+        return "Moderate agreement"
+    elif kappa < 0.80:
+        return "Substantial agreement"
+    return "Almost perfect agreement"
+
+def write_confusion_matrices(path, pairs, categories, tensor, observed, expected, kappa):
+    """Write all pairwise confusion matrices as NPZ (default) or JSON (by file suffix)."""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        payload = {
+            "categories": list(categories),
+            "pairs": [
+                {
+                    "annotators": list(pair),
+                    "confusion": tensor[p].tolist(),
+                    "observed": float(observed[p]),
+                    "expected": float(expected[p]),
+                    "kappa": float(kappa[p]),
+                }
+                for p, pair in enumerate(pairs)
+            ],
+        }
+        path.write_text(json.dumps(payload), encoding='utf-8')
     else:
-        fleiss_interpretation = "Almost perfect agreement"
-    f.write(f"  {fleiss_interpretation}\n")
-    f.write("="*60 + "\n")
-    
-    f.write("\n\nDisagreements:\n")
-    f.write("-"*60 + "\n")
-    disagreements = get_disagreements(datapoints)
-    for d,answers in disagreements.items():
-        f.write(f"{d}: {answers}\n")
-
-# Print only summary to CLI
-k_bar = task.kappa()
-fleiss_kappa = calculate_fleiss_kappa(datapoints, annotators)
-fleiss_kappa_nltk = task.multi_kappa()
-disagreements = get_disagreements(datapoints)
-
-print("="*60)
-print("INTER-ANNOTATOR AGREEMENT ANALYSIS")
-print("="*60)
-print(f"k̄ (k-bar / Average Pairwise Kappa): {k_bar}")
-print(f"Fleiss' κ (Standard Formula): {fleiss_kappa}")
-print(f"Fleiss' κ (NLTK variant): {fleiss_kappa_nltk}")
-print(f"\nDifferences:")
-print(f"  k-bar vs Fleiss' κ (Standard): {abs(k_bar - fleiss_kappa)}")
-print(f"  Standard vs NLTK variant: {abs(fleiss_kappa - fleiss_kappa_nltk)}")
-print(f"\nNote: NLTK's multi_kappa averages pairwise metrics,")
-print(f"      while standard Fleiss' κ is a true multi-annotator metric.")
-
-# Print pairwise kappas summary
-print("\nPairwise Kappa Values (Cohen's):")
-for pair in itertools.combinations(annotators, 2):
-    kappa = task.kappa_pairwise(pair[0],pair[1])
-    print(f"  {pair[0]} vs {pair[1]}: {kappa}")
-print(f"\nTotal datapoints: {len(datapoints)}")
-print(f"Disagreements: {len(disagreements)}")
-print(f"Agreement rate: {(len(datapoints)-len(disagreements))/len(datapoints)*100}%")
-print(f"\nDetailed results saved to: {output_file}")
-print("="*60)
+        np.savez_compressed(
+            path,
+            pairs=np.array(pairs, dtype=str).reshape(-1, 2),
+            categories=np.array(categories, dtype=str),
+            confusion=tensor,
+            observed=observed,
+            expected=expected,
+            kappa=kappa,
+        )
+    return path
+
+def confusion_matrix_view(matrix, categories):
+    """Render one confusion matrix with NLTK, rebuilding aligned answer lists from the counts."""
+    # Imported here: NLTK takes longer to import than the whole scan, and only the text report needs it.
+    from nltk.metrics import ConfusionMatrix
+
+    a1, a2 = [], []
+    for i, j in zip(*np.nonzero(matrix)):
+        a1.extend([categories[i]] * int(matrix[i, j]))
+        a2.extend([categories[j]] * int(matrix[i, j]))
+    return str(ConfusionMatrix(a1, a2))
+
+def write_text_report(path, disagreements_path, pairs, categories, tensor, observed, expected, kappa,
+                      k_bar, fleiss_kappa, fleiss_kappa_nltk):
+    """Human-readable view of the agreement analysis."""
+    with open(path, 'w') as f:
+        f.write("="*60 + "\n")
+        f.write("INTER-ANNOTATOR AGREEMENT ANALYSIS\n")
+        f.write("="*60 + "\n\n")
+
+        for p, pair in enumerate(pairs):
+            f.write("\n\n*** " + pair[0] + " vs " + pair[1] + " ***\n")
+            f.write(f"\nObserved agreement: {observed[p]}\n")
+            f.write(f"Expected agreement: {expected[p]}\n")
+            # Cohen's Kappa: (observed - expected) / (1 - expected)
+            # Range: -1 to 1, where:
+            #   1 = perfect agreement
+            #   0 = agreement equal to chance
+            #   <0 = agreement worse than chance
+            f.write(f"Pairwise kappa (Cohen's): {kappa[p]}\n")
+            # Show confusion matrix: how annotations align between the two annotators
+            f.write("\nConfusion Matrix:\n")
+            f.write(confusion_matrix_view(tensor[p], categories) + "\n")
+
+        f.write("\n" + "="*60 + "\n")
+        f.write("Overall Inter-Annotator Agreement:\n")
+        f.write("="*60 + "\n")
+        f.write(f"k̄ (k-bar / Average Pairwise Kappa): {k_bar}\n")
+        f.write(f"\nInterpretation:\n")
+        f.write(f"  {interpret_kappa(k_bar)}\n")
+
+        # Fleiss' Kappa - supports multiple annotators
+        f.write("\n" + "-"*60 + "\n")
+        f.write("Fleiss' Kappa (Multi-Annotator Metric):\n")
+        f.write("-"*60 + "\n")
+        f.write(f"Fleiss' κ (Standard Formula): {fleiss_kappa}\n")
+        f.write(f"Fleiss' κ (NLTK variant): {fleiss_kappa_nltk}\n")
+        f.write(f"Difference: {abs(fleiss_kappa - fleiss_kappa_nltk)}\n")
+        f.write(f"\nWhy the difference?\n")
+        f.write(f"  - Standard Fleiss' κ: Calculates agreement across ALL annotators\n")
+        f.write(f"    simultaneously for each item, then averages across items.\n")
+        f.write(f"    This is the true multi-annotator metric.\n")
+        f.write(f"  - NLTK's multi_kappa: Averages pairwise observed agreements\n")
+        f.write(f"    and pairwise expected agreements separately, then applies\n")
+        f.write(f"    kappa formula. This is essentially averaging pairwise metrics.\n")
+        f.write(f"\nInterpretation:\n")
+        f.write(f"  {interpret_kappa(fleiss_kappa)}\n")
+        f.write("="*60 + "\n")
+
+        f.write("\n\nDisagreements:\n")
+        f.write("-"*60 + "\n")
+        if not disagreements_path:
+            f.write("(not listed: run with --disagreements-out to save them)\n")
+            return
+        with open(disagreements_path, 'r') as dis:
+            for line in dis:
+                d = json.loads(line)
+                f.write(f"{d['datapoint']}: {d['answers']}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inter-annotator agreement (Cohen's pairwise, k-bar, Fleiss' kappa).")
+    parser.add_argument("--csv", default="annotations.csv", help="Annotations CSV: header of annotator names, one row per datapoint.")
+    parser.add_argument("--confusion-out", default="kappa_confusion.npz",
+                        help="Pairwise confusion matrices (.npz, or .json for a JSON file).")
+    parser.add_argument("--disagreements-out", default="kappa_disagreements.jsonl",
+                        help="Disagreeing datapoints, one JSON object per line (\"\" = do not write them).")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows accumulated per vectorized update.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes counting chunks in parallel (useful with many annotators).")
+    parser.add_argument("--text-report", action="store_true", help="Also write the human-readable report.")
+    parser.add_argument("--report-path", default="kappa_results.txt", help="Path of the human-readable report.")
+    args = parser.parse_args()
+
+    # Single streaming pass: counts plus the disagreement list, without holding the data.
+    counts = scan_annotations(args.csv, args.disagreements_out, args.chunk_size, args.workers)
+
+    # All pairwise statistics come from one confusion tensor (pairs x K x K).
+    pairs, categories, tensor = counts.confusion_tensor()
+    observed, expected, kappa = pairwise_agreement(tensor)
+    k_bar = average_kappa(kappa)  # Average pairwise kappa (k-bar)
+    fleiss_kappa = calculate_fleiss_kappa(counts)
+    fleiss_kappa_nltk = multi_kappa(observed, expected)
+    n_items = counts.n_items
+    n_disagreements = counts.n_disagreements
+
+    confusion_out = write_confusion_matrices(args.confusion_out, pairs, categories, tensor, observed, expected, kappa)
+    if args.text_report:
+        write_text_report(args.report_path, args.disagreements_out, pairs, categories, tensor, observed, expected, kappa,
+                          k_bar, fleiss_kappa, fleiss_kappa_nltk)
+
+    # Print only summary to CLI
+    print("="*60)
+    print("INTER-ANNOTATOR AGREEMENT ANALYSIS")
+    print("="*60)
+    print(f"k̄ (k-bar / Average Pairwise Kappa): {k_bar}")
+    print(f"Fleiss' κ (Standard Formula): {fleiss_kappa}")
+    print(f"Fleiss' κ (NLTK variant): {fleiss_kappa_nltk}")
+    print(f"\nDifferences:")
+    print(f"  k-bar vs Fleiss' κ (Standard): {abs(k_bar - fleiss_kappa)}")
+    print(f"  Standard vs NLTK variant: {abs(fleiss_kappa - fleiss_kappa_nltk)}")
+    print(f"\nNote: NLTK's multi_kappa averages pairwise metrics,")
+    print(f"      while standard Fleiss' κ is a true multi-annotator metric.")
+
+    # Print pairwise kappas summary
+    print("\nPairwise Kappa Values (Cohen's):")
+    for p, pair in enumerate(pairs):
+        print(f"  {pair[0]} vs {pair[1]}: {kappa[p]}")
+    print(f"\nTotal datapoints: {n_items}")
+    print(f"Disagreements: {n_disagreements}")
+    print(f"Agreement rate: {(n_items-n_disagreements)/n_items*100}%")
+    print(f"\nConfusion matrices saved to: {confusion_out}")
+    if args.disagreements_out:
+        print(f"Disagreements saved to: {args.disagreements_out}")
+    if args.text_report:
+        print(f"Detailed results saved to: {args.report_path}")
+    print("="*60)
+
+if __name__ == "__main__":
+    main()
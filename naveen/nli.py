@@ -40,6 +40,9 @@ MODEL_REGISTRY = {
 
 TH_START, TH_END, TH_STEP = 0.10, 0.90, 0.01
 DEFAULT_THRESHOLD = 0.60
+# Unlabelled runs only: skip Review2 -> Feature1 when Review1 -> Feature2 is already below
+# DEFAULT_THRESHOLD. Predictions are unchanged, but skipped rows keep e12 as score_min and e21 = NaN.
+LAZY_MIN = False
 
 def make_hypothesis(feature: str) -> str:
     if pd.isna(feature):
@@ -150,11 +153,17 @@ def build_model(entry: dict, device="cpu"):
     else:
         raise ValueError(f"Unknown model type: {entry['type']}")
 
-def bidirectional_score(model_obj, review1, feature1, review2, feature2):
+def bidirectional_score(model_obj, review1, feature1, review2, feature2, th=None):
+    """
+    With a fixed threshold `th`, review2 => h1 is skipped when e12 < th: the
+    min is below th either way. Skipped rows return e21=NaN and smin=e12.
+    """
     h1 = make_hypothesis(feature1)
     h2 = make_hypothesis(feature2)
 
     e12 = model_obj.score(review1, h2)
+    if th is not None and e12 < th:
+        return h1, h2, e12, np.nan, e12
     e21 = model_obj.score(review2, h1)
     smin = min(e12, e21)
 
@@ -170,6 +179,8 @@ def main():
 
     report_rows = []
     h_cols_written = False
+    # Without labels the threshold is fixed, so LAZY_MIN can skip the second direction.
+    lazy_th = DEFAULT_THRESHOLD if LAZY_MIN and "label" not in df.columns else None
 
     for model_key, meta in MODEL_REGISTRY.items():
         print(f"\nLoading {model_key}: {meta['name']} ({meta['type']})")
@@ -182,7 +193,8 @@ def main():
             h1, h2, e12, e21, smin = bidirectional_score(
                 model_obj,
                 row["Review 1"], row["APP Features 1"],
-                row["Review 2"], row["App Features 2"]
+                row["Review 2"], row["App Features 2"],
+                th=lazy_th
             )
             h1_list.append(h1)
             h2_list.append(h2)
@@ -198,6 +210,8 @@ def main():
         df[f"e12_{model_key}"] = np.round(e12_list, 6)
         df[f"e21_{model_key}"] = np.round(e21_list, 6)
         df[f"score_min_{model_key}"] = np.round(smin_list, 6)
+        if lazy_th is not None:
+            df[f"dir2_skipped_{model_key}"] = np.isnan(e21_list).astype(int)
 
         if "label" in df.columns:
             val = df.dropna(subset=["label", f"score_min_{model_key}"]).copy()
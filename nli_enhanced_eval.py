@@ -53,19 +53,38 @@ python3 nli_enhanced_eval.py \
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
+import socket
+import subprocess
+import sys
+import threading
+import time
 import urllib.error
 import urllib.request
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from pathlib import Path
 from typing import Callable, Dict, List, Optional
 
 import numpy as np
 import pandas as pd
 import torch
-from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+from transformers import AutoConfig, AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+from prefilter import (
+    PREFILTER_RULES,
+    build_embeddings,
+    cosine01,
+    map_unique,
+    normalize_feature_text,
+    parse_prefilter_rules,
+    prefilter_decisions,
+    prefilter_report,
+    tokenize,
+)
 
 COL_F1 = "APP Features 1"
 COL_R1 = "Review 1"
@@ -80,10 +99,6 @@ def safe_int_series(s: pd.Series) -> pd.Series:
     return pd.to_numeric(s, errors="coerce").fillna(0).astype(int)
 
 
-def tokenize(text: str) -> List[str]:
-    return re.findall(r"[a-z0-9]+", str(text).lower())
-
-
 def jaccard(a: str, b: str) -> float:
     sa = set(tokenize(a))
     sb = set(tokenize(b))
@@ -92,15 +107,6 @@ def jaccard(a: str, b: str) -> float:
     return len(sa & sb) / max(1, len(sa | sb))
 
 
-def cosine01(a: np.ndarray, b: np.ndarray) -> float:
-    denom = np.linalg.norm(a) * np.linalg.norm(b)
-    if denom == 0.0:
-        return 0.0
-    cos = float(np.dot(a, b) / denom)
-    # Map cosine [-1,1] -> [0,1] for easy fusion with probability-like scores.
-    return max(0.0, min(1.0, 0.5 * (cos + 1.0)))
-
-
 def majority_or(fiaz: pd.Series, naveen: pd.Series) -> pd.Series:
     f = safe_int_series(fiaz)
     n = safe_int_series(naveen)
@@ -171,13 +177,10 @@ def stratified_kfold_indices(y: np.ndarray, n_splits: int, seed: int) -> List[np
     return out
 
 
-def normalize_feature_text(text: str) -> str:
-    t = str(text).strip().strip('"').strip()
-    return t.rstrip(".!? ")
-
-
 def find_label_indices(model) -> tuple[int, int]:
-    id2label = {int(k): v.lower() for k, v in model.config.id2label.items()}
+    """Entailment/contradiction label ids from a model (or its config)."""
+    config = getattr(model, "config", model)
+    id2label = {int(k): v.lower() for k, v in config.id2label.items()}
     entail_idx = -1
     contra_idx = -1
     for idx, label in id2label.items():
@@ -186,47 +189,352 @@ def find_label_indices(model) -> tuple[int, int]:
         if "contrad" in label:
             contra_idx = idx
     if entail_idx < 0 or contra_idx < 0:
-        raise ValueError(f"Could not find entailment/contradiction labels in {model.config.id2label}")
+        raise ValueError(f"Could not find entailment/contradiction labels in {config.id2label}")
     return entail_idx, contra_idx
 
 
-def nli_probs(premise: str, hypothesis: str, tokenizer, model, device: str) -> np.ndarray:
-    enc = tokenizer(premise, hypothesis, return_tensors="pt", truncation=True, max_length=512)
-    enc = {k: v.to(device) for k, v in enc.items()}
-    with torch.no_grad():
-        logits = model(**enc).logits
-        probs = torch.softmax(logits, dim=-1)[0].detach().cpu().numpy()
-    return probs
+class TokenCache:
+    """Token ids for every unique text under one tokenizer, shared across templates and tiers.
+
+    Reviews are tokenized once instead of once per template and direction; pair inputs are
+    assembled from the cached ids with the tokenizer's own special tokens and the same
+    longest-first truncation as `tokenizer(premise, hypothesis, truncation=True)`.
+    """
+
+    def __init__(self, tokenizer, max_length: int = 512):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.ids: Dict[str, List[int]] = {}
+        self.layout, self.layout_types = pair_layout(tokenizer)
+        self.budget = max_length - sum(1 for t in self.layout if t >= 0)
+        self.use_token_types = "token_type_ids" in getattr(tokenizer, "model_input_names", [])
+        self.lookups = 0
+
+    def warm(self, texts: List[str]) -> None:
+        """Tokenize all uncached texts in one batched call."""
+        new = [t for t in dict.fromkeys(texts) if t not in self.ids]
+        if not new:
+            return
+        enc = self.tokenizer(new, add_special_tokens=False)["input_ids"]
+        for t, ids in zip(new, enc):
+            self.ids[t] = list(ids)
+
+    def token_ids(self, text: str) -> List[int]:
+        self.lookups += 1
+        ids = self.ids.get(text)
+        if ids is None:
+            ids = list(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+            self.ids[text] = ids
+        return ids
+
+    def pair_inputs(self, premise: str, hypothesis: str) -> Dict[str, List[int]]:
+        a, b = truncate_longest_first(self.token_ids(premise), self.token_ids(hypothesis), self.budget)
+        input_ids: List[int] = []
+        token_types: List[int] = []
+        for tok, type_id in zip(self.layout, self.layout_types):
+            part = a if tok == -1 else b if tok == -2 else [tok]
+            input_ids.extend(part)
+            token_types.extend([type_id] * len(part))
+        out = {"input_ids": input_ids, "attention_mask": [1] * len(input_ids)}
+        if self.use_token_types:
+            out["token_type_ids"] = token_types
+        return out
+
+
+def pair_layout(tokenizer) -> tuple[List[int], List[int]]:
+    """Special-token template for a sequence pair: -1/-2 mark the premise/hypothesis slots."""
+    if getattr(tokenizer, "is_fast", False):
+        from tokenizers import Tokenizer
+
+        # Private copy so truncation/padding left on the tokenizer does not leak into the probe.
+        backend = Tokenizer.from_str(tokenizer.backend_tokenizer.to_str())
+        backend.no_truncation()
+        backend.no_padding()
+        enc = backend.encode("a", "b")
+        layout: List[int] = []
+        types: List[int] = []
+        for tok, seq, type_id in zip(enc.ids, enc.sequence_ids, enc.type_ids):
+            slot = tok if seq is None else -1 - seq
+            if slot < 0 and layout and layout[-1] == slot:
+                continue
+            layout.append(slot)
+            types.append(type_id)
+        return layout, types
+    layout = tokenizer.build_inputs_with_special_tokens([-1], [-2])
+    types = tokenizer.create_token_type_ids_from_sequences([-1], [-2])
+    return layout, types
+
+
+def truncate_longest_first(a: List[int], b: List[int], budget: int) -> tuple[List[int], List[int]]:
+    """Trim the longer sequence first, as the fast tokenizers' longest_first strategy does."""
+    if len(a) + len(b) <= budget:
+        return a, b
+    if len(a) > len(b):
+        keep_b = min(len(b), budget // 2)
+        return a[: budget - keep_b], b[:keep_b]
+    keep_a = min(len(a), budget // 2)
+    return a[:keep_a], b[: budget - keep_a]
+
+
+def pad_batch(batch: List[Dict[str, List[int]]], pad_id: int, device: str) -> Dict[str, torch.Tensor]:
+    width = max(len(enc["input_ids"]) for enc in batch)
+    out = {}
+    for key in batch[0]:
+        fill = pad_id if key == "input_ids" else 0
+        out[key] = torch.tensor([enc[key] + [fill] * (width - len(enc[key])) for enc in batch], device=device)
+    return out
+
 
+def score_nli_pairs(
+    pairs: List[tuple[str, str]],
+    cache: TokenCache,
+    model,
+    device: str,
+    batch_size: int = 1,
+    batch_order: str = "input",
+    stats: Optional[Dict[str, float]] = None,
+) -> np.ndarray:
+    """Label probabilities for (premise, hypothesis) pairs, one row per input pair.
+
+    Duplicate pairs are scored once. With batch_order="premise" the unique pairs are grouped
+    by premise and sorted by length, so a review's hypotheses share a batch and padding
+    stays low; cross-encoders attend over both texts, so no premise state is reused.
+    """
+    uniq = list(dict.fromkeys(pairs))
+    pos = {pair: i for i, pair in enumerate(uniq)}
+    encoded = [cache.pair_inputs(p, h) for p, h in uniq]
+    order = list(range(len(uniq)))
+    if batch_order == "premise":
+        order.sort(key=lambda i: (len(cache.ids[uniq[i][0]]), uniq[i][0], len(encoded[i]["input_ids"])))
+    pad_id = cache.tokenizer.pad_token_id
+    pad_id = 0 if pad_id is None else pad_id
+    probs = np.zeros((len(uniq), model.config.num_labels), dtype=np.float32)
+    real_tokens = 0
+    padded_tokens = 0
+    t0 = time.perf_counter()
+    for start in range(0, len(order), batch_size):
+        idx = order[start : start + batch_size]
+        batch = [encoded[i] for i in idx]
+        enc = pad_batch(batch, pad_id, device)
+        real_tokens += sum(len(b["input_ids"]) for b in batch)
+        padded_tokens += enc["input_ids"].numel()
+        with torch.no_grad():
+            logits = model(**enc).logits
+            probs[idx] = torch.softmax(logits, dim=-1).detach().cpu().numpy()
+    if stats is not None:
+        stats["pairs"] = stats.get("pairs", 0) + len(pairs)
+        stats["unique_pairs"] = stats.get("unique_pairs", 0) + len(uniq)
+        stats["real_tokens"] = stats.get("real_tokens", 0) + real_tokens
+        stats["padded_tokens"] = stats.get("padded_tokens", 0) + padded_tokens
+        stats["seconds"] = stats.get("seconds", 0.0) + time.perf_counter() - t0
+    return probs[[pos[pair] for pair in pairs]]
+
+
+def nli_batch_summary(stats: Dict[str, float]) -> str:
+    eff = stats["real_tokens"] / max(stats["padded_tokens"], 1)
+    rate = stats["unique_pairs"] / max(stats["seconds"], 1e-9)
+    return (
+        f"{int(stats['unique_pairs'])} unique of {int(stats['pairs'])} pairs, "
+        f"padding efficiency={eff:.1%}, throughput={rate:.1f} pairs/s"
+    )
 
-def mean_pooling(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
-    mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
-    summed = torch.sum(last_hidden_state * mask, dim=1)
-    counts = torch.clamp(mask.sum(dim=1), min=1e-9)
-    return summed / counts
 
+DEFAULT_AUTOTUNE_CACHE = Path.home() / ".cache" / "kappa_score" / "autotune.json"
 
-def build_embeddings(
-    texts: List[str],
-    tokenizer,
+
+def current_rss_mb() -> float:
+    """Current resident set size of this process (psutil if installed, else /proc on Linux)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    with open("/proc/self/statm", encoding="ascii") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def probe_memory_mb(device: str, probe: Callable[[], int], interval: float = 0.002) -> tuple[int, float]:
+    """Run `probe` and return (its result, memory it used above the pre-probe baseline in MB).
+
+    On GPU this is the CUDA allocator peak over the allocation before the probe. On CPU, RSS is
+    sampled from a side thread while the probe runs, since the process peak (ru_maxrss) includes
+    the model weights and every earlier probe, and can never be reset.
+    """
+    if device.startswith("cuda"):
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+        n = probe()
+        return n, max(0.0, (torch.cuda.max_memory_allocated() - base) / 2**20)
+    base = current_rss_mb()
+    peak = base
+    done = threading.Event()
+
+    def sample() -> None:
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, current_rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        n = probe()
+    finally:
+        done.set()
+        sampler.join()
+    peak = max(peak, current_rss_mb())
+    return n, max(0.0, peak - base)
+
+
+def thread_candidates() -> List[int]:
+    """Powers of two up to the core count (plus the core count), skipping very low counts on big hosts."""
+    cores = os.cpu_count() or 1
+    counts = {1 << i for i in range(cores.bit_length()) if (1 << i) <= cores} | {cores}
+    return sorted(t for t in counts if t >= max(1, cores // 8))
+
+
+def read_autotune_cache(cache_path: Path) -> Dict:
+    """Cached autotune results; a missing, truncated or malformed cache counts as empty, so we re-probe."""
+    if not cache_path.exists():
+        return {}
+    try:
+        cache = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        print(f"Autotune cache {cache_path} is unreadable ({exc}); re-probing.")
+        return {}
+    if not isinstance(cache, dict):
+        print(f"Autotune cache {cache_path} is not a JSON object; re-probing.")
+        return {}
+    required = {"batch_size", "threads", "items_per_sec"}
+    return {k: v for k, v in cache.items() if isinstance(v, dict) and required <= v.keys()}
+
+
+def autotune_batching(
+    kind: str,
+    model_name: str,
+    device: str,
+    run_probe: Callable[[int], int],
+    batch_sizes: List[int],
+    args: argparse.Namespace,
+    tune_threads: bool = True,
+) -> Dict:
+    """Pick the batch size (and CPU thread count) with the best items/s on a probe sample.
+
+    `run_probe(batch_size)` processes the sample and returns how many items it scored. Each probe's
+    own memory (above the loaded model) is measured; once one passes --autotune-max-memory-mb, the
+    larger batch sizes are skipped for that thread count only. Results are cached in
+    --autotune-cache per (host, device, kind, model), so later runs skip the probe.
+    """
+    cache_path = Path(args.autotune_cache).expanduser()
+    key = f"{socket.gethostname()}|{device}|{kind}|{model_name}"
+    if not tune_threads:
+        key += f"|threads={torch.get_num_threads()}"
+    cache = read_autotune_cache(cache_path)
+    if key in cache and not args.autotune_refresh:
+        best = cache[key]
+        print(
+            f"Autotune {kind}: cached batch_size={best['batch_size']} threads={best['threads']} "
+            f"({best['items_per_sec']:.1f} items/s) from {cache_path}"
+        )
+        return best
+    threads = thread_candidates() if tune_threads and not device.startswith("cuda") else [torch.get_num_threads()]
+    original_threads = torch.get_num_threads()
+    run_probe(min(batch_sizes))  # warm-up: first-call allocation and kernel selection
+    best: Optional[Dict] = None
+    tried = 0
+    for t in threads:
+        torch.set_num_threads(t)
+        for bs in sorted(batch_sizes):
+            t0 = time.perf_counter()
+            n, mem = probe_memory_mb(device, lambda: run_probe(bs))
+            rate = n / max(time.perf_counter() - t0, 1e-9)
+            tried += 1
+            if args.autotune_max_memory_mb > 0 and mem > args.autotune_max_memory_mb:
+                break  # larger batches only use more; the next thread count starts from the smallest again
+            if best is None or rate > best["items_per_sec"]:
+                best = {"batch_size": bs, "threads": t, "items_per_sec": rate, "peak_memory_mb": mem}
+    torch.set_num_threads(original_threads)
+    if best is None:
+        raise RuntimeError(
+            f"Autotune {kind}: every batch size exceeded --autotune-max-memory-mb={args.autotune_max_memory_mb}."
+        )
+    cache[key] = best
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_replace(cache_path, lambda f: f.write(json.dumps(cache, indent=2).encode("utf-8")))
+    print(
+        f"Autotune {kind}: batch_size={best['batch_size']} threads={best['threads']} "
+        f"({best['items_per_sec']:.1f} items/s, probe peak +{best['peak_memory_mb']:.0f} MB) after {tried} probes; "
+        f"cached in {cache_path}"
+    )
+    return best
+
+
+def autotune_nli(
+    eval_df: pd.DataFrame,
+    model_name: str,
+    cache: TokenCache,
     model,
     device: str,
-    batch_size: int = 64,
-) -> Dict[str, np.ndarray]:
+    args: argparse.Namespace,
+    tune_threads: bool = True,
+) -> Dict:
+    """Autotune NLI batching on real premise/hypothesis pairs sampled from `eval_df`."""
+    rng = np.random.default_rng(args.seed)
+    rows = eval_df.iloc[np.sort(rng.permutation(len(eval_df))[: max(1, args.autotune_sample // 2)])]
+    tmpl = next(iter(select_named_variants(get_templates(), args.templates, "templates").values()))
+    pairs: List[tuple[str, str]] = []
+    for prem_col, feat_col in [(COL_R1, COL_F2), (COL_R2, COL_F1)]:
+        hyps = [tmpl.format(feature=normalize_feature_text(f)) for f in rows[feat_col]]
+        pairs.extend(zip(map(str, rows[prem_col]), hyps))
+    pairs = list(dict.fromkeys(pairs))
+    cache.warm([t for pair in pairs for t in pair])
+
+    def run_probe(batch_size: int) -> int:
+        score_nli_pairs(pairs, cache, model, device, batch_size, args.nli_batch_order)
+        return len(pairs)
+
+    return autotune_batching("nli", model_name, device, run_probe, autotune_batch_sizes(args), args, tune_threads)
+
+
+def apply_nli_autotune(
+    eval_df: pd.DataFrame,
+    model_name: str,
+    cache: TokenCache,
+    model,
+    device: str,
+    args: argparse.Namespace,
+    tune_threads: bool = True,
+) -> None:
+    """With --autotune, set args.nli_batch_size and the torch thread count from the tuned result."""
+    if not args.autotune:
+        return
+    best = autotune_nli(eval_df, model_name, cache, model, device, args, tune_threads)
+    args.nli_batch_size = int(best["batch_size"])
+    if tune_threads and not device.startswith("cuda"):
+        torch.set_num_threads(int(best["threads"]))
+
+
+def autotune_embeddings(texts: List[str], tokenizer, model, model_name: str, device: str, args: argparse.Namespace) -> Dict:
+    """Autotune the embedding batch size on a sample of the texts to embed (threads stay as set for NLI)."""
     uniq = list(dict.fromkeys(texts))
-    out: Dict[str, np.ndarray] = {}
-    for i in range(0, len(uniq), batch_size):
-        batch = uniq[i : i + batch_size]
-        enc = tokenizer(batch, padding=True, truncation=True, max_length=256, return_tensors="pt")
-        enc = {k: v.to(device) for k, v in enc.items()}
-        with torch.no_grad():
-            model_out = model(**enc)
-            emb = mean_pooling(model_out.last_hidden_state, enc["attention_mask"])
-            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
-            emb_np = emb.detach().cpu().numpy()
-        for t, v in zip(batch, emb_np):
-            out[t] = v
-    return out
+    rng = np.random.default_rng(args.seed)
+    sample = [uniq[i] for i in np.sort(rng.permutation(len(uniq))[: args.autotune_sample])]
+
+    def run_probe(batch_size: int) -> int:
+        build_embeddings(sample, tokenizer, model, device, batch_size)
+        return len(sample)
+
+    return autotune_batching(
+        "embedding", model_name, device, run_probe, autotune_batch_sizes(args), args, tune_threads=False
+    )
+
+
+def autotune_batch_sizes(args: argparse.Namespace) -> List[int]:
+    sizes = [int(v) for v in parse_float_list(args.autotune_batch_sizes, "--autotune-batch-sizes") if v >= 1]
+    if not sizes:
+        raise ValueError("No valid values parsed from --autotune-batch-sizes.")
+    return sizes
 
 
 def get_templates() -> Dict[str, str]:
@@ -253,11 +561,520 @@ def normalize_entail_with_contradiction(e: np.ndarray, c: np.ndarray, eps: float
     return e / (e + c + eps)
 
 
+def score_templates_nli(
+    eval_df: pd.DataFrame,
+    tmpls: List[str],
+    cache: TokenCache,
+    model,
+    device: str,
+    batch_size: int = 1,
+    batch_order: str = "input",
+    stats: Optional[Dict[str, float]] = None,
+) -> np.ndarray:
+    """Label probabilities as an (n_rows, n_templates, 2, n_labels) tensor from one scoring pass.
+
+    Direction 0 is review 1 -> hypothesis(feature 2), direction 1 is review 2 -> hypothesis(feature 1).
+    """
+    r1 = map_unique(eval_df[COL_R1], str)
+    r2 = map_unique(eval_df[COL_R2], str)
+    f1 = map_unique(eval_df[COL_F1], normalize_feature_text)
+    f2 = map_unique(eval_df[COL_F2], normalize_feature_text)
+    pairs: List[tuple[str, str]] = []
+    for tmpl in tmpls:
+        pairs.extend(zip(r1, [tmpl.format(feature=f) for f in f2]))
+        pairs.extend(zip(r2, [tmpl.format(feature=f) for f in f1]))
+    # Reviews are cached after the first template; only the new hypotheses are tokenized here.
+    cache.warm(r1 + r2 + [h for _, h in pairs])
+    probs = score_nli_pairs(pairs, cache, model, device, batch_size, batch_order, stats)
+    return probs.reshape(len(tmpls), 2, len(eval_df), -1).transpose(2, 0, 1, 3)
+
+
+def scatter_rows(probs: np.ndarray, rows: np.ndarray, n_rows: int) -> np.ndarray:
+    """Place probabilities scored for a row subset into a zero tensor over all rows."""
+    if len(rows) == n_rows:
+        return probs
+    out = np.zeros((n_rows,) + probs.shape[1:], dtype=probs.dtype)
+    out[rows] = probs
+    return out
+
+
+def template_nli(probs: np.ndarray, entail_idx: int, contra_idx: int) -> Dict[str, np.ndarray]:
+    """Split one template's (n_rows, 2, n_labels) slice into directional entail/contradiction arrays."""
+    probs = probs.astype(np.float64)
+    return {
+        "e12": probs[:, 0, entail_idx],
+        "e21": probs[:, 1, entail_idx],
+        "c12": probs[:, 0, contra_idx],
+        "c21": probs[:, 1, contra_idx],
+    }
+
+
+def score_template_nli(
+    eval_df: pd.DataFrame,
+    tmpl: str,
+    cache: TokenCache,
+    model,
+    device: str,
+    entail_idx: int,
+    contra_idx: int,
+    batch_size: int = 1,
+    batch_order: str = "input",
+    stats: Optional[Dict[str, float]] = None,
+) -> Dict[str, np.ndarray]:
+    """Entailment/contradiction probabilities for both directions of every row under one template."""
+    probs = score_templates_nli(eval_df, [tmpl], cache, model, device, batch_size, batch_order, stats)
+    return template_nli(probs[:, 0], entail_idx, contra_idx)
+
+
+MINHASH_PRIME = np.uint64(4294967311)  # smallest prime above 2**32; a*x+b stays below 2**64
+
+
+def minhash_signatures(token_sets: List[frozenset], num_perm: int, seed: int, chunk: int = 4096) -> np.ndarray:
+    """(n_texts, num_perm) MinHash signatures of token sets (empty sets get all-max rows)."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+    token_hash: Dict[str, int] = {}
+    sig = np.full((len(token_sets), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(token_sets), chunk):
+        part = token_sets[start : start + chunk]
+        sizes = np.array([len(s) for s in part])
+        if not sizes.sum():
+            continue
+        hashes = []
+        for s in part:
+            for tok in s:
+                h = token_hash.get(tok)
+                if h is None:
+                    h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=4).digest(), "big")
+                    token_hash[tok] = h
+                hashes.append(h)
+        perm = (np.array(hashes, dtype=np.uint64)[:, None] * a + b) % MINHASH_PRIME
+        nonempty = np.where(sizes > 0)[0]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])[nonempty]
+        sig[start + nonempty] = np.minimum.reduceat(perm, offsets, axis=0)
+    return sig
+
+
+def near_duplicate_groups(
+    texts: List[str],
+    threshold: float = 0.95,
+    num_perm: int = 128,
+    bands: int = 16,
+    seed: int = 42,
+) -> tuple[np.ndarray, Dict[str, int]]:
+    """Group texts whose token-set Jaccard exceeds `threshold`, via MinHash + LSH banding.
+
+    Texts that share a band bucket are verified with exact Jaccard on `tokenize` sets, so every
+    link is a true near-duplicate; a true pair is only missed if it collides in no band.
+    Returns the group id per text (index of the group's first text) and candidate/verify counts.
+    """
+    if num_perm % bands:
+        raise ValueError(f"--minhash-perms ({num_perm}) must be divisible by --lsh-bands ({bands}).")
+    token_sets = [frozenset(tokenize(t)) for t in texts]
+    sig = minhash_signatures(token_sets, num_perm, seed)
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = num_perm // bands
+    stats = {"buckets": 0, "verified": 0, "linked": 0}
+    checked = set()
+    has_tokens = np.array([bool(s) for s in token_sets])
+    for band in range(bands):
+        keys = np.ascontiguousarray(sig[has_tokens, band * rows : (band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, inv, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        members = np.where(has_tokens)[0]
+        order = np.argsort(inv, kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        for bucket in np.where(counts > 1)[0]:
+            stats["buckets"] += 1
+            # Leader clustering inside the bucket keeps verification near-linear for big buckets.
+            leaders: List[int] = []
+            for i in members[order[bounds[bucket] : bounds[bucket + 1]]].tolist():
+                for lead in leaders:
+                    if find(i) == find(lead):
+                        break
+                    if (lead, i) in checked:
+                        continue
+                    checked.add((lead, i))
+                    stats["verified"] += 1
+                    sa, sb = token_sets[lead], token_sets[i]
+                    if len(sa & sb) / len(sa | sb) > threshold:
+                        parent[find(i)] = find(lead)
+                        stats["linked"] += 1
+                        break
+                else:
+                    leaders.append(i)
+    group = np.array([find(i) for i in range(len(texts))], dtype=np.int64)
+    # Name each group by its first member so ids are stable and independent of link order.
+    first = {}
+    for i, g in enumerate(group):
+        first.setdefault(g, i)
+    return np.array([first[g] for g in group], dtype=np.int64), stats
+
+
+def review_near_duplicates(eval_df: pd.DataFrame, args: argparse.Namespace) -> Dict[str, str]:
+    """Map every review text to its near-duplicate group's canonical text (first occurrence)."""
+    reviews = list(dict.fromkeys(map(str, pd.concat([eval_df[COL_R1].astype(str), eval_df[COL_R2].astype(str)]))))
+    t0 = time.perf_counter()
+    group, stats = near_duplicate_groups(
+        reviews, args.near_dup_threshold, args.minhash_perms, args.lsh_bands, args.seed
+    )
+    canon = {t: reviews[g] for t, g in zip(reviews, group)}
+    n_groups = len(set(group.tolist()))
+    dup = int(np.count_nonzero(np.bincount(group, minlength=len(reviews))[group] > 1))
+    print(
+        f"Near-duplicate reviews (Jaccard > {args.near_dup_threshold}): {dup} of {len(reviews)} unique reviews "
+        f"in multi-review groups, {n_groups} groups; {stats['verified']} candidate pairs verified, "
+        f"{stats['linked']} linked ({time.perf_counter() - t0:.2f}s)"
+    )
+    return canon
+
+
+def similarity_features(
+    eval_df: pd.DataFrame,
+    emb_map: Dict[str, np.ndarray],
+    similarity_method: str,
+    similarity_beta: float,
+    review_canon: Optional[Dict[str, str]] = None,
+) -> Dict[str, np.ndarray]:
+    """Template-independent similarity signals and the copied-review rule flag.
+
+    With `review_canon` (from review_near_duplicates), reviews in the same corpus-wide
+    near-duplicate group also count as copied, not only pairs that match within the row.
+    """
+    use_cosine = similarity_method in {"cosine", "blend"}
+    lex = []
+    lex_j = []
+    lex_c = []
+    rule = []
+    for _, r in eval_df.iterrows():
+        f1 = normalize_feature_text(r[COL_F1])
+        f2 = normalize_feature_text(r[COL_F2])
+        r1 = str(r[COL_R1])
+        r2 = str(r[COL_R2])
+
+        sim_feat_j = jaccard(f1, f2)
+        sim_rev_j = jaccard(r1, r2)
+        jscore = 0.5 * sim_feat_j + 0.5 * sim_rev_j
+
+        cscore = 0.0
+        if use_cosine:
+            ef1 = emb_map.get(str(r[COL_F1]))
+            ef2 = emb_map.get(str(r[COL_F2]))
+            er1 = emb_map.get(str(r[COL_R1]))
+            er2 = emb_map.get(str(r[COL_R2]))
+            sim_feat_c = cosine01(ef1, ef2) if ef1 is not None and ef2 is not None else 0.0
+            sim_rev_c = cosine01(er1, er2) if er1 is not None and er2 is not None else 0.0
+            cscore = 0.5 * sim_feat_c + 0.5 * sim_rev_c
+
+        if similarity_method == "jaccard":
+            lscore = jscore
+        elif similarity_method == "cosine":
+            lscore = cscore
+        else:
+            beta = max(0.0, min(1.0, similarity_beta))
+            lscore = beta * cscore + (1.0 - beta) * jscore
+
+        lex.append(lscore)
+        lex_j.append(jscore)
+        lex_c.append(cscore)
+
+        # Rule: copied/nearly identical reviews but low feature overlap tends to be false positive.
+        copied = sim_rev_j > 0.95 or (review_canon is not None and review_canon[r1] == review_canon[r2])
+        copied_review_feature_divergence = 1.0 if (copied and sim_feat_j < 0.50) else 0.0
+        rule.append(copied_review_feature_divergence)
+    return {
+        "lex": np.array(lex),
+        "lex_jaccard": np.array(lex_j),
+        "lex_cosine": np.array(lex_c),
+        "rule": np.array(rule),
+    }
+
+
+def apply_prefilter(score: np.ndarray, decided: Optional[np.ndarray]) -> np.ndarray:
+    """Pin prefiltered rows to 1.0/0.0 so they clear/miss any threshold in (0, 1)."""
+    if decided is None:
+        return score
+    return np.where(np.isnan(decided), score, decided)
+
+
+def directional_nli_scores(nli: Dict[str, np.ndarray], score_mode: str) -> tuple[np.ndarray, np.ndarray]:
+    if score_mode == "contra_norm":
+        return (
+            normalize_entail_with_contradiction(nli["e12"], nli["c12"]),
+            normalize_entail_with_contradiction(nli["e21"], nli["c21"]),
+        )
+    return nli["e12"], nli["e21"]
+
+
+def fuse_scores(
+    nli_score: np.ndarray,
+    lex: np.ndarray,
+    contradiction: np.ndarray,
+    rule: np.ndarray,
+    alpha: float,
+    contradiction_th: float,
+    rule_penalty: float,
+) -> np.ndarray:
+    blended = alpha * nli_score + (1.0 - alpha) * lex
+    guarded = blended.copy()
+    guarded[contradiction >= contradiction_th] = 0.0
+    return guarded * (1.0 - rule_penalty * rule)
+
+
 def model_result_dir_name(model_name: str) -> str:
     clean = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
     return f"{clean}_result"
 
 
+def output_path(path: Path, output_format: str) -> Path:
+    return path.with_suffix(".parquet") if output_format == "parquet" else path
+
+
+def arrow_schema_for(df: pd.DataFrame):
+    """Arrow schema: float64 scores, int64 labels/flags, dictionary-encoded text columns."""
+    import pyarrow as pa
+
+    fields = []
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            typ = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            typ = pa.int64()
+        elif pd.api.types.is_float_dtype(dtype):
+            typ = pa.float64()
+        else:
+            typ = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(str(col), typ))
+    return pa.schema(fields)
+
+
+def write_table(df: pd.DataFrame, path: Path, output_format: str) -> Path:
+    """Write `df` as CSV or Parquet; returns the path actually written."""
+    path = output_path(path, output_format)
+    if output_format != "parquet":
+        df.to_csv(path, index=False)
+        return path
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("--output-format parquet requires pyarrow (pip install pyarrow).") from exc
+    schema = arrow_schema_for(df)
+    out = df.copy()
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            out[field.name] = out[field.name].map(lambda v: None if pd.isna(v) else str(v)).astype("category")
+    table = pa.Table.from_pandas(out, schema=schema, preserve_index=False)
+    pq.write_table(table, path)
+    return path
+
+
+def intern_text_columns(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """Store each distinct text once: text columns become categoricals (int codes + one copy per string)."""
+    for col in cols:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def read_table(path, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a CSV or Parquet table written by write_table (or any input CSV).
+
+    With `columns`, only those of them that exist in the file are loaded.
+    """
+    path = Path(path)
+    if path.suffix.lower() in {".parquet", ".pq"}:
+        if columns is not None:
+            import pyarrow.parquet as pq
+
+            present = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in present]
+        df = pd.read_parquet(path, columns=columns)
+        # Dictionary-encoded text comes back as categoricals; downstream code expects plain strings.
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+        return df
+    if columns is not None:
+        wanted = set(columns)
+        return pd.read_csv(path, usecols=lambda c: c in wanted)
+    return pd.read_csv(path)
+
+
+SWEEP_FINGERPRINT_ARGS = [
+    "model",
+    "cascade_model",
+    "target_label",
+    "objective",
+    "cv_folds",
+    "seed",
+    "similarity_method",
+    "embedding_model",
+    "similarity_beta",
+    "templates",
+    "aggregators",
+    "alphas",
+    "contradiction_thresholds",
+    "rule_penalties",
+    "nli_score_mode",
+    "prefilter",
+    "prefilter_max_cosine",
+    "fusion",
+    "learned_l2",
+    "near_dup",
+    "near_dup_threshold",
+    "minhash_perms",
+    "lsh_bands",
+    "threshold_search",
+    "histogram_bins",
+]
+SHARD_FINGERPRINT_ARGS = [
+    "model",
+    "cascade_model",
+    "target_label",
+    "templates",
+    "near_dup",
+    "near_dup_threshold",
+    "minhash_perms",
+    "lsh_bands",
+]
+LLM_FINGERPRINT_ARGS = [
+    "llm_model",
+    "llm_api_base",
+    "llm_on",
+    "llm_icl_shots",
+    "llm_temperature",
+    "llm_max_output_tokens",
+    "llm_votes",
+    "llm_adaptive_votes",
+    "llm_vote_stop_confidence",
+    "llm_escalate_votes",
+    "llm_require_unanimous",
+    "llm_pack_size",
+]
+
+
+def args_fingerprint(args: argparse.Namespace, names: List[str], data_path: Optional[str] = None) -> str:
+    h = hashlib.sha256()
+    if data_path is not None:
+        with open(data_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    h.update(json.dumps({k: getattr(args, k) for k in names}, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def atomic_replace(path: Path, write: Callable) -> None:
+    """Write through a temp file and rename, so a crash never leaves a half-written checkpoint."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class RunCheckpoint:
+    """Stage checkpoints under <out_dir>/checkpoints for `--resume`.
+
+    Units: embedding map, per-template NLI probabilities, per-template config search rows,
+    and one JSONL line per judged row. A manifest fingerprints the input file and the
+    arguments each unit depends on; resuming against a different fingerprint is refused.
+    Starting over deletes only the files matching OWNED, so anything else kept there survives.
+    """
+
+    OWNED = ["manifest.json", "embeddings.npz", "nli_*.npy", "search_*.json", "llm_results.jsonl", "*.tmp"]
+
+    def __init__(self, root: Path, sweep_key: str, llm_key: str, resume: bool):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.root / "manifest.json"
+        manifest = {}
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if resume and manifest and manifest.get("sweep") != sweep_key:
+            raise ValueError(
+                f"Checkpoints in {self.root} were written for a different input/config; "
+                "rerun without --resume to start over."
+            )
+        if not resume or not manifest:
+            for pattern in self.OWNED:
+                for path in self.root.glob(pattern):
+                    if path.is_file():
+                        path.unlink()
+        elif manifest.get("llm") != llm_key and self.llm_path.exists():
+            print("LLM settings changed since the checkpoint; discarding saved judge results.")
+            self.llm_path.unlink()
+        self.resume = resume
+        atomic_replace(
+            manifest_path,
+            lambda f: f.write(json.dumps({"sweep": sweep_key, "llm": llm_key}, indent=2).encode("utf-8")),
+        )
+
+    @property
+    def llm_path(self) -> Path:
+        return self.root / "llm_results.jsonl"
+
+    def load_array(self, name: str) -> Optional[np.ndarray]:
+        path = self.root / f"{name}.npy"
+        return np.load(path) if path.exists() else None
+
+    def save_array(self, name: str, arr: np.ndarray) -> None:
+        atomic_replace(self.root / f"{name}.npy", lambda f: np.save(f, arr))
+
+    def load_json(self, name: str):
+        path = self.root / f"{name}.json"
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def save_json(self, name: str, obj) -> None:
+        atomic_replace(self.root / f"{name}.json", lambda f: f.write(json.dumps(obj).encode("utf-8")))
+
+    def load_embeddings(self) -> Optional[Dict[str, np.ndarray]]:
+        path = self.root / "embeddings.npz"
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return dict(zip(data["texts"].tolist(), data["vectors"]))
+
+    def save_embeddings(self, emb_map: Dict[str, np.ndarray]) -> None:
+        texts = np.array(list(emb_map), dtype=str)
+        vectors = np.stack(list(emb_map.values())) if emb_map else np.zeros((0, 0), dtype=np.float32)
+        atomic_replace(self.root / "embeddings.npz", lambda f: np.savez(f, texts=texts, vectors=vectors))
+
+    def load_llm_results(self) -> Dict[int, Dict]:
+        out: Dict[int, Dict] = {}
+        if not self.llm_path.exists():
+            return out
+        lines = self.llm_path.read_text(encoding="utf-8").splitlines(keepends=True)
+        good: List[str] = []
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            out[int(rec["row"])] = rec
+            good.append(line)
+        if len(good) < len(lines):
+            # Drop the torn tail left by a crash mid-append before appending again.
+            atomic_replace(self.llm_path, lambda f: f.write("".join(good).encode("utf-8")))
+        return out
+
+    def append_llm_result(self, rec: Dict) -> None:
+        with open(self.llm_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
 def objective_value(m: Dict[str, float], objective: str) -> float:
     if objective == "f1":
         return m["f1"]
@@ -324,6 +1141,93 @@ def tune_threshold_cv(
     return best_th, best_m
 
 
+class ScoreHistogram:
+    """Per-class counts of scores binned at the candidate thresholds; mergeable across shards.
+
+    Bin k holds scores with exactly k thresholds <= score, so the confusion counts for
+    `score >= threshold` are exact at every threshold without keeping the raw scores.
+    """
+
+    def __init__(self, thresholds: np.ndarray):
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.counts = np.zeros((2, len(self.thresholds) + 1), dtype=np.int64)
+
+    def add(self, score: np.ndarray, y: np.ndarray) -> "ScoreHistogram":
+        bins = np.searchsorted(self.thresholds, score, side="right")
+        for cls in (0, 1):
+            self.counts[cls] += np.bincount(bins[y == cls], minlength=self.counts.shape[1])
+        return self
+
+    def merge(self, other: "ScoreHistogram") -> "ScoreHistogram":
+        if not np.array_equal(self.thresholds, other.thresholds):
+            raise ValueError("Cannot merge histograms with different thresholds.")
+        self.counts += other.counts
+        return self
+
+    def confusion(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """tp, fp, tn, fn for each threshold."""
+        # Predicted positive at threshold j <=> bin > j, so take reverse cumulative counts.
+        above = np.cumsum(self.counts[:, ::-1], axis=1)[:, ::-1][:, 1:]
+        tp = above[1]
+        fp = above[0]
+        return tp, fp, self.counts[0].sum() - fp, self.counts[1].sum() - tp
+
+
+def metrics_from_counts(tp: np.ndarray, fp: np.ndarray, tn: np.ndarray, fn: np.ndarray) -> Dict[str, np.ndarray]:
+    """Vectorized `metrics()` over arrays of confusion counts (same formulas and edge cases)."""
+    tp, fp, tn, fn = (np.asarray(v, dtype=float) for v in (tp, fp, tn, fn))
+    n = tp + tn + fp + fn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acc = np.where(n > 0, (tp + tn) / n, 0.0)
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        tnr = np.where(tn + fp > 0, tn / (tn + fp), 0.0)
+        p1 = (tp + fn) / n
+        p2 = (tp + fp) / n
+        pe = p1 * p2 + (1.0 - p1) * (1.0 - p2)
+        kappa = np.where(pe == 1.0, 1.0, (acc - pe) / (1.0 - pe))
+    kappa = np.where(n > 0, kappa, 0.0)
+    return {"acc": acc, "f1": f1, "kappa": kappa, "balanced_acc": (recall + tnr) / 2.0}
+
+
+def tune_threshold_hist(
+    y: np.ndarray,
+    score: np.ndarray,
+    folds: List[np.ndarray],
+    objective: str,
+    thresholds: np.ndarray,
+) -> tuple[float, Dict[str, float]]:
+    """tune_threshold_cv from per-fold histograms: one pass per fold instead of one per threshold."""
+    fold_ms = [metrics_from_counts(*ScoreHistogram(thresholds).add(score[f], y[f]).confusion()) for f in folds]
+    avg = {k: np.mean([m[k] for m in fold_ms], axis=0) for k in ("acc", "f1", "kappa", "balanced_acc")}
+    obj = objective_value(avg, objective)
+    best = 0
+    for j in range(1, len(thresholds)):
+        if (obj[j], avg["f1"][j], avg["acc"][j]) > (obj[best], avg["f1"][best], avg["acc"][best]):
+            best = j
+    return float(thresholds[best]), {k: float(v[best]) for k, v in avg.items()}
+
+
+def search_thresholds(args: argparse.Namespace, threshold_grid: np.ndarray) -> np.ndarray:
+    """Candidate thresholds: the fixed grid, or the edges of --histogram-bins uniform bins."""
+    if args.threshold_search == "histogram" and args.histogram_bins > 0:
+        return np.linspace(0.0, 1.0, args.histogram_bins + 1)[1:-1]
+    return threshold_grid
+
+
+def tune_threshold(
+    y: np.ndarray,
+    score: np.ndarray,
+    folds: List[np.ndarray],
+    args: argparse.Namespace,
+    threshold_grid: np.ndarray,
+) -> tuple[float, Dict[str, float]]:
+    if args.threshold_search == "histogram":
+        return tune_threshold_hist(y, score, folds, args.objective, search_thresholds(args, threshold_grid))
+    return tune_threshold_cv(y, score, folds, args.objective, threshold_grid)
+
+
 def find_triage_thresholds(
     y: np.ndarray,
     score: np.ndarray,
@@ -374,6 +1278,28 @@ def _extract_response_text(resp: Dict) -> str:
     return "\n".join(texts)
 
 
+def _judge_fields(obj: Dict) -> tuple[Optional[int], float, str]:
+    """(label, confidence, rationale) from one parsed judgment object; label is None when unusable."""
+    label = obj.get("label")
+    conf = obj.get("confidence", 0.0)
+    rationale = str(obj.get("rationale", ""))[:300]
+    lbl: Optional[int] = None
+    if isinstance(label, str):
+        t = label.strip().lower()
+        if t in {"same", "1", "yes", "match"}:
+            lbl = 1
+        elif t in {"different", "0", "no", "mismatch"}:
+            lbl = 0
+    elif isinstance(label, (int, float)):
+        lbl = int(label >= 0.5)
+    try:
+        conf = float(conf)
+    except Exception:
+        conf = 0.0
+    conf = max(0.0, min(1.0, conf))
+    return lbl, conf, rationale
+
+
 def _parse_judge_json(text: str) -> tuple[Optional[int], float, str]:
     m = re.search(r"\{.*\}", text, flags=re.S)
     raw = m.group(0) if m else text
@@ -398,76 +1324,129 @@ def _parse_judge_json(text: str) -> tuple[Optional[int], float, str]:
             except Exception:
                 conf = 0.0
         return lbl, max(0.0, min(1.0, conf)), text[:300]
-    label = obj.get("label")
-    conf = obj.get("confidence", 0.0)
-    rationale = str(obj.get("rationale", ""))[:300]
-    lbl: Optional[int] = None
-    if isinstance(label, str):
-        t = label.strip().lower()
-        if t in {"same", "1", "yes", "match"}:
-            lbl = 1
-        elif t in {"different", "0", "no", "mismatch"}:
-            lbl = 0
-    elif isinstance(label, (int, float)):
-        lbl = int(label >= 0.5)
+    return _judge_fields(obj)
+
+
+def _parse_packed_judge_json(text: str, n_cases: int) -> List[tuple[Optional[int], float, str]]:
+    """One (label, confidence, rationale) per case id 1..n_cases; missing or invalid items get label None."""
+    out: List[tuple[Optional[int], float, str]] = [(None, 0.0, "missing from packed response")] * n_cases
+    m = re.search(r"[\[{].*[\]}]", text, flags=re.S)
     try:
-        conf = float(conf)
+        obj = json.loads(m.group(0) if m else text)
     except Exception:
-        conf = 0.0
-    conf = max(0.0, min(1.0, conf))
-    return lbl, conf, rationale
+        return [(None, 0.0, f"Unparseable packed response: {text[:300]}")] * n_cases
+    items = obj.get("judgments") if isinstance(obj, dict) else obj
+    if not isinstance(items, list):
+        return out
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            k = int(item.get("id", pos + 1)) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= k < n_cases and out[k][0] is None:
+            out[k] = _judge_fields(item)
+    return out
+
+
+LLM_ICL_EXAMPLES = (
+    "Example 1\n"
+    "Pair A:\nFeature: dark mode\nReview: I love the dark theme at night.\n"
+    "Pair B:\nFeature: dark mode\nReview: The app finally has night mode.\n"
+    'Answer: {"label":"same","confidence":0.95,"rationale":"Both describe dark mode."}\n\n'
+    "Example 2\n"
+    "Pair A:\nFeature: export pdf\nReview: I can save invoices as PDF.\n"
+    "Pair B:\nFeature: cloud backup\nReview: My data syncs to cloud automatically.\n"
+    'Answer: {"label":"different","confidence":0.97,"rationale":"Different product functions."}\n\n'
+    "Example 3\n"
+    "Pair A:\nFeature: add items to list\nReview: I can quickly list my groceries.\n"
+    "Pair B:\nFeature: list maker\nReview: This app is perfect for making lists.\n"
+    'Answer: {"label":"same","confidence":0.88,"rationale":"Same list-creation intent."}\n\n'
+)
+
+
+def llm_pair_text(f1: str, r1: str, f2: str, r2: str) -> str:
+    return f"Pair A:\nFeature: {f1}\nReview: {r1}\n\nPair B:\nFeature: {f2}\nReview: {r2}\n\n"
 
 
 def build_llm_user_prompt(f1: str, r1: str, f2: str, r2: str, icl_shots: int) -> str:
     if icl_shots == 3:
-        shots = (
-            "Example 1\n"
-            "Pair A:\nFeature: dark mode\nReview: I love the dark theme at night.\n"
-            "Pair B:\nFeature: dark mode\nReview: The app finally has night mode.\n"
-            'Answer: {"label":"same","confidence":0.95,"rationale":"Both describe dark mode."}\n\n'
-            "Example 2\n"
-            "Pair A:\nFeature: export pdf\nReview: I can save invoices as PDF.\n"
-            "Pair B:\nFeature: cloud backup\nReview: My data syncs to cloud automatically.\n"
-            'Answer: {"label":"different","confidence":0.97,"rationale":"Different product functions."}\n\n'
-            "Example 3\n"
-            "Pair A:\nFeature: add items to list\nReview: I can quickly list my groceries.\n"
-            "Pair B:\nFeature: list maker\nReview: This app is perfect for making lists.\n"
-            'Answer: {"label":"same","confidence":0.88,"rationale":"Same list-creation intent."}\n\n'
-        )
-        query = (
-            f"Now judge this case.\n"
-            f"Pair A:\nFeature: {f1}\nReview: {r1}\n\n"
-            f"Pair B:\nFeature: {f2}\nReview: {r2}\n\n"
-            "Answer JSON only."
-        )
-        return shots + query
+        return LLM_ICL_EXAMPLES + "Now judge this case.\n" + llm_pair_text(f1, r1, f2, r2) + "Answer JSON only."
+    return llm_pair_text(f1, r1, f2, r2) + "Are Pair A and Pair B the same meaning?"
+
+
+def build_llm_packed_prompt(cases: List[tuple[str, str, str, str]], icl_shots: int) -> str:
+    """Several cases in one prompt; instructions and in-context examples are sent once for all of them."""
+    shots = LLM_ICL_EXAMPLES if icl_shots == 3 else ""
+    body = "".join(f"Case {k}\n" + llm_pair_text(*case) for k, case in enumerate(cases, start=1))
     return (
-        f"Pair A:\nFeature: {f1}\nReview: {r1}\n\n"
-        f"Pair B:\nFeature: {f2}\nReview: {r2}\n\n"
-        "Are Pair A and Pair B the same meaning?"
+        shots
+        + f"Now judge these {len(cases)} cases.\n\n"
+        + body
+        + f"Answer JSON only, with one judgment for each case id 1..{len(cases)}."
     )
 
 
-def llm_judge_once(
+JUDGE_ITEM_PROPERTIES = {
+    "label": {"type": "string", "enum": ["same", "different"]},
+    "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+    "rationale": {"type": "string", "maxLength": 120},
+}
+JUDGE_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties": JUDGE_ITEM_PROPERTIES,
+    "required": ["label", "confidence", "rationale"],
+}
+# Packed mode: the single-case schema plus a case id, wrapped in an array (strict mode needs an object root).
+PACKED_JUDGE_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties": {
+        "judgments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {"id": {"type": "integer"}, **JUDGE_ITEM_PROPERTIES},
+                "required": ["id", "label", "confidence", "rationale"],
+            },
+        }
+    },
+    "required": ["judgments"],
+}
+JUDGE_SYSTEM_PROMPT = (
+    "You are a strict semantic judge. Compare two feature-review pairs. "
+    "Return JSON only: "
+    "{\"label\":\"same|different\",\"confidence\":0..1,\"rationale\":\"short\"}. "
+    "Keep rationale under 15 words."
+)
+PACKED_JUDGE_SYSTEM_PROMPT = (
+    "You are a strict semantic judge. Each numbered case compares two feature-review pairs. "
+    "Return JSON only: "
+    "{\"judgments\":[{\"id\":1,\"label\":\"same|different\",\"confidence\":0..1,\"rationale\":\"short\"}]} "
+    "with exactly one item per case id. "
+    "Keep each rationale under 15 words."
+)
+
+
+def _judge_request(
     api_base: str,
     api_key: str,
     model: str,
-    f1: str,
-    r1: str,
-    f2: str,
-    r2: str,
-    icl_shots: int,
+    sys: str,
+    usr: str,
+    schema_name: str,
+    schema: Dict,
     temperature: float,
     max_output_tokens: int,
     timeout_sec: int,
-) -> tuple[Optional[int], float, str]:
-    sys = (
-        "You are a strict semantic judge. Compare two feature-review pairs. "
-        "Return JSON only: "
-        "{\"label\":\"same|different\",\"confidence\":0..1,\"rationale\":\"short\"}. "
-        "Keep rationale under 15 words."
-    )
-    usr = build_llm_user_prompt(f1, r1, f2, r2, icl_shots)
+    parse: Callable[[str], object],
+    fail: Callable[[str], object],
+    token_cap: int = 2048,
+):
+    """POST one Responses API request and return `parse(text)`, or `fail(reason)` on any error."""
     model_l = str(model).lower()
     # Use the simpler Responses API format for GPT-5 family.
     if model_l.startswith("gpt-5"):
@@ -497,18 +1476,9 @@ def llm_judge_once(
         payload["text"] = {
             "format": {
                 "type": "json_schema",
-                "name": "semantic_judge",
+                "name": schema_name,
                 "strict": True,
-                "schema": {
-                    "type": "object",
-                    "additionalProperties": False,
-                    "properties": {
-                        "label": {"type": "string", "enum": ["same", "different"]},
-                        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
-                        "rationale": {"type": "string", "maxLength": 120},
-                    },
-                    "required": ["label", "confidence", "rationale"],
-                },
+                "schema": schema,
             }
         }
     headers = {"Content-Type": "application/json"}
@@ -536,20 +1506,20 @@ def llm_judge_once(
                     emsg = json.dumps(obj["error"])[:300]
                 except Exception:
                     emsg = str(obj.get("error"))[:300]
-                return None, 0.0, f"API error: {emsg}"
+                return fail(f"API error: {emsg}")
             text = _extract_response_text(obj)
             if text:
-                return _parse_judge_json(text)
+                return parse(text)
 
             status = str(obj.get("status", "")).lower() if isinstance(obj, dict) else ""
             details = obj.get("incomplete_details") if isinstance(obj, dict) else {}
             reason = str((details or {}).get("reason", "")).lower()
             if status == "incomplete" and ("max_output" in reason or "max_tokens" in reason):
                 prev = int(req_payload.get("max_output_tokens", max_output_tokens))
-                req_payload["max_output_tokens"] = min(max(prev * 2, prev + 128), 2048)
+                req_payload["max_output_tokens"] = min(max(prev * 2, prev + 128), token_cap)
                 continue
-            return None, 0.0, f"Empty model output: {str(obj)[:300]}"
-        return None, 0.0, f"Incomplete after retries: {str(obj)[:300]}"
+            return fail(f"Empty model output: {str(obj)[:300]}")
+        return fail(f"Incomplete after retries: {str(obj)[:300]}")
     except urllib.error.HTTPError as e:
         try:
             body = e.read().decode("utf-8", errors="replace")
@@ -562,16 +1532,16 @@ def llm_judge_once(
                 payload_retry.pop("temperature", None)
                 obj = _post(payload_retry)
                 text = _extract_response_text(obj)
-                return _parse_judge_json(text)
+                return parse(text)
             except Exception:
                 pass
         msg = f"HTTP {e.code} {e.reason}: {body[:300]}"
-        return None, 0.0, msg
+        return fail(msg)
     except Exception as e:
-        return None, 0.0, f"{type(e).__name__}: {str(e)[:300]}"
+        return fail(f"{type(e).__name__}: {str(e)[:300]}")
 
 
-def llm_judge_vote(
+def llm_judge_once(
     api_base: str,
     api_key: str,
     model: str,
@@ -583,32 +1553,237 @@ def llm_judge_vote(
     temperature: float,
     max_output_tokens: int,
     timeout_sec: int,
-    votes: int,
-) -> tuple[Optional[int], float, str, float]:
-    labels: List[int] = []
-    confs: List[float] = []
-    rationales: List[str] = []
-    errors: List[str] = []
-    for _ in range(max(1, votes)):
-        lbl, conf, rat = llm_judge_once(
-            api_base, api_key, model, f1, r1, f2, r2, icl_shots, temperature, max_output_tokens, timeout_sec
-        )
+) -> tuple[Optional[int], float, str]:
+    return _judge_request(
+        api_base,
+        api_key,
+        model,
+        JUDGE_SYSTEM_PROMPT,
+        build_llm_user_prompt(f1, r1, f2, r2, icl_shots),
+        "semantic_judge",
+        JUDGE_SCHEMA,
+        temperature,
+        max_output_tokens,
+        timeout_sec,
+        parse=_parse_judge_json,
+        fail=lambda msg: (None, 0.0, msg),
+    )
+
+
+def llm_judge_packed_once(
+    api_base: str,
+    api_key: str,
+    model: str,
+    cases: List[tuple[str, str, str, str]],
+    icl_shots: int,
+    temperature: float,
+    max_output_tokens: int,
+    timeout_sec: int,
+) -> List[tuple[Optional[int], float, str]]:
+    """Judge several (f1, r1, f2, r2) cases in one request; `max_output_tokens` is the per-case budget."""
+    budget = max_output_tokens * len(cases)
+    return _judge_request(
+        api_base,
+        api_key,
+        model,
+        PACKED_JUDGE_SYSTEM_PROMPT,
+        build_llm_packed_prompt(cases, icl_shots),
+        "semantic_judge_batch",
+        PACKED_JUDGE_SCHEMA,
+        temperature,
+        budget,
+        timeout_sec,
+        parse=lambda text: _parse_packed_judge_json(text, len(cases)),
+        fail=lambda msg: [(None, 0.0, msg)] * len(cases),
+        token_cap=max(2048, 2 * budget),
+    )
+
+
+def majority_decided(ones: int, zeros: int, remaining: int) -> bool:
+    """True when `remaining` further votes cannot change the majority (ties go to 1)."""
+    return ones >= zeros + remaining or zeros > ones + remaining
+
+
+class JudgeVote:
+    """Self-consistency vote state for one case; `add` one judge answer until `done`.
+
+    With `adaptive`, voting stops as soon as the remaining budget cannot flip the majority, the
+    unanimity outcome (with `require_unanimous`) or which side of `confidence_th` the mean
+    confidence ends on, so the override decision matches full voting. When `stop_confidence` > 0,
+    it also stops once at least two unanimous votes reach that mean confidence.
+    If the budget is spent and votes are still split, up to `escalate_votes` total calls are made;
+    the remaining budget counts those calls until escalation is ruled out.
+    """
+
+    def __init__(
+        self,
+        votes: int,
+        adaptive: bool = False,
+        stop_confidence: float = 0.0,
+        escalate_votes: int = 0,
+        require_unanimous: bool = False,
+        confidence_th: float = 0.0,
+    ):
+        self.adaptive = adaptive
+        self.stop_confidence = stop_confidence
+        self.escalate_votes = escalate_votes
+        self.require_unanimous = require_unanimous
+        self.confidence_th = confidence_th
+        self.target = max(1, votes)
+        self.calls = 0
+        self.stopped = False
+        self.labels: List[int] = []
+        self.confs: List[float] = []
+        self.rationales: List[str] = []
+        self.errors: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        return self.stopped or self.calls >= self.target
+
+    def confidence_decided(self, remaining: int) -> bool:
+        """True when `remaining` more votes (each confidence in [0, 1], or failed) cannot move the mean across confidence_th."""
+        n, total = len(self.confs), float(sum(self.confs))
+        lowest = total / (n + remaining)
+        highest = (total + remaining) / (n + remaining)
+        return lowest >= self.confidence_th or highest < self.confidence_th
+
+    def add(self, lbl: Optional[int], conf: float, rat: str) -> None:
+        self.calls += 1
         if lbl is not None:
-            labels.append(lbl)
-            confs.append(conf)
+            self.labels.append(lbl)
+            self.confs.append(conf)
             if rat:
-                rationales.append(rat)
+                self.rationales.append(rat)
         elif rat:
-            errors.append(rat)
-    if not labels:
-        return None, 0.0, (errors[0] if errors else ""), 0.0
-    ones = sum(labels)
-    zeros = len(labels) - ones
-    final = 1 if ones >= zeros else 0
-    conf = float(np.mean(confs)) if confs else 0.0
-    rat = rationales[0] if rationales else ""
-    agreement = float(max(ones, zeros) / max(1, len(labels)))
-    return final, conf, rat, agreement
+            self.errors.append(rat)
+        ones = sum(self.labels)
+        zeros = len(self.labels) - ones
+        unanimous = ones == 0 or zeros == 0
+        if self.calls == self.target and self.escalate_votes > self.target and not unanimous:
+            self.target = self.escalate_votes
+            return
+        if not self.adaptive or not self.labels or self.calls >= self.target:
+            return
+        # A split at the end of the budget escalates, so those calls may still come.
+        remaining = max(self.target, self.escalate_votes) - self.calls
+        # With a unanimity requirement, a still-unanimous vote must run to the end:
+        # a later dissent would block the override.
+        if (
+            majority_decided(ones, zeros, remaining)
+            and not (self.require_unanimous and unanimous)
+            and self.confidence_decided(remaining)
+        ):
+            self.stopped = True
+        elif (
+            self.stop_confidence > 0
+            and len(self.labels) >= 2
+            and unanimous
+            and float(np.mean(self.confs)) >= self.stop_confidence
+        ):
+            self.stopped = True
+
+    def result(self) -> tuple[Optional[int], float, str, float, int]:
+        """(label, confidence, rationale, agreement, calls_made)."""
+        if not self.labels:
+            return None, 0.0, (self.errors[0] if self.errors else ""), 0.0, self.calls
+        ones = sum(self.labels)
+        zeros = len(self.labels) - ones
+        final = 1 if ones >= zeros else 0
+        conf = float(np.mean(self.confs)) if self.confs else 0.0
+        rat = self.rationales[0] if self.rationales else ""
+        agreement = float(max(ones, zeros) / max(1, len(self.labels)))
+        return final, conf, rat, agreement, self.calls
+
+
+def llm_judge_vote(
+    api_base: str,
+    api_key: str,
+    model: str,
+    f1: str,
+    r1: str,
+    f2: str,
+    r2: str,
+    icl_shots: int,
+    temperature: float,
+    max_output_tokens: int,
+    timeout_sec: int,
+    votes: int,
+    adaptive: bool = False,
+    stop_confidence: float = 0.0,
+    escalate_votes: int = 0,
+    require_unanimous: bool = False,
+    confidence_th: float = 0.0,
+) -> tuple[Optional[int], float, str, float, int]:
+    """Self-consistency vote over repeated judge calls (stopping rules in `JudgeVote`).
+
+    Returns (label, confidence, rationale, agreement, calls_made).
+    """
+    vote = JudgeVote(votes, adaptive, stop_confidence, escalate_votes, require_unanimous, confidence_th)
+    while not vote.done:
+        vote.add(
+            *llm_judge_once(
+                api_base, api_key, model, f1, r1, f2, r2, icl_shots, temperature, max_output_tokens, timeout_sec
+            )
+        )
+    return vote.result()
+
+
+def llm_judge_vote_packed(
+    api_base: str,
+    api_key: str,
+    model: str,
+    cases: List[tuple[str, str, str, str]],
+    icl_shots: int,
+    temperature: float,
+    max_output_tokens: int,
+    timeout_sec: int,
+    votes: int,
+    adaptive: bool = False,
+    stop_confidence: float = 0.0,
+    escalate_votes: int = 0,
+    require_unanimous: bool = False,
+    confidence_th: float = 0.0,
+) -> tuple[List[tuple[Optional[int], float, str, float, int]], int]:
+    """Vote on several cases at once: each round sends every still-undecided case in one packed request.
+
+    Items missing or invalid in a packed answer are re-requested individually for that vote.
+    Returns one `llm_judge_vote` result per case and the number of HTTP requests made.
+    """
+    state = [
+        JudgeVote(votes, adaptive, stop_confidence, escalate_votes, require_unanimous, confidence_th) for _ in cases
+    ]
+
+    def single(k: int) -> tuple[Optional[int], float, str]:
+        return llm_judge_once(
+            api_base, api_key, model, *cases[k], icl_shots, temperature, max_output_tokens, timeout_sec
+        )
+
+    requests = 0
+    while True:
+        active = [k for k, vote in enumerate(state) if not vote.done]
+        if not active:
+            break
+        if len(active) == 1:
+            answers = [single(active[0])]
+        else:
+            answers = llm_judge_packed_once(
+                api_base,
+                api_key,
+                model,
+                [cases[k] for k in active],
+                icl_shots,
+                temperature,
+                max_output_tokens,
+                timeout_sec,
+            )
+        requests += 1
+        for k, answer in zip(active, answers):
+            if answer[0] is None and len(active) > 1:
+                answer = single(k)
+                requests += 1
+            state[k].add(*answer)
+    return [vote.result() for vote in state], requests
 
 
 def llm_server_reachable(api_base: str, timeout_sec: int) -> bool:
@@ -694,7 +1869,8 @@ def resolve_target_labels(df: pd.DataFrame, target_label: str) -> tuple[pd.DataF
     return eval_df, y_full.astype(int)
 
 
-def run_llm_judge_stage(row_df: pd.DataFrame, args: argparse.Namespace, tuned_th: float) -> pd.DataFrame:
+def llm_api_key(args: argparse.Namespace) -> Optional[str]:
+    """API key for the judge ("" for keyless local servers), or None when the stage must be skipped."""
     api_key = ""
     if args.llm_api_key_env.upper() != "NONE":
         api_key = os.environ.get(args.llm_api_key_env, "").strip()
@@ -711,66 +1887,149 @@ def run_llm_judge_stage(row_df: pd.DataFrame, args: argparse.Namespace, tuned_th
             f"LLM judge requested, but env var {args.llm_api_key_env} is empty and api-base is non-local. "
             "Skipping LLM stage."
         )
-        return row_df
-
+        return None
+    return api_key
+
+
+def llm_candidate_rows(
+    triage: np.ndarray,
+    final_score: np.ndarray,
+    row_th: np.ndarray,
+    prefilter_rule: Optional[np.ndarray],
+    args: argparse.Namespace,
+) -> np.ndarray:
+    """Positions of rows the judge should see (before the --llm-max-cases cap)."""
+    keep = np.ones(len(triage), dtype=bool)
     if args.llm_on == "needs_review":
-        idx = row_df.index[row_df["triage_label"] == "needs_review"].tolist()
-    else:
-        idx = row_df.index.tolist()
+        keep &= triage == "needs_review"
+    if prefilter_rule is not None:
+        keep &= prefilter_rule == ""
     if args.llm_uncertainty_band > 0:
-        band = float(args.llm_uncertainty_band)
-        idx = [i for i in idx if abs(float(row_df.at[i, "final_score"]) - float(tuned_th)) <= band]
-    if args.llm_max_cases > 0:
-        idx = idx[: args.llm_max_cases]
+        keep &= np.abs(final_score.astype(float) - row_th) <= float(args.llm_uncertainty_band)
+    return np.where(keep)[0]
+
+
+def llm_judge_row(f1: str, r1: str, f2: str, r2: str, args: argparse.Namespace, api_key: str) -> Dict:
+    """One row's judge vote as a checkpoint record (without the row index)."""
+    lbl, conf, rat, agree, calls = llm_judge_vote(
+        api_base=args.llm_api_base,
+        api_key=api_key,
+        model=args.llm_model,
+        f1=f1,
+        r1=r1,
+        f2=f2,
+        r2=r2,
+        icl_shots=int(args.llm_icl_shots),
+        temperature=float(args.llm_temperature),
+        max_output_tokens=int(args.llm_max_output_tokens),
+        timeout_sec=int(args.llm_timeout_sec),
+        votes=int(args.llm_votes),
+        adaptive=bool(args.llm_adaptive_votes),
+        stop_confidence=float(args.llm_vote_stop_confidence),
+        escalate_votes=int(args.llm_escalate_votes),
+        require_unanimous=bool(args.llm_require_unanimous),
+        confidence_th=float(args.llm_confidence_th),
+    )
+    return {"label": lbl, "confidence": conf, "rationale": rat, "agreement": agree, "calls": calls}
+
+
+def llm_case(df: pd.DataFrame, i: int) -> tuple[str, str, str, str]:
+    return str(df.at[i, COL_F1]), str(df.at[i, COL_R1]), str(df.at[i, COL_F2]), str(df.at[i, COL_R2])
+
+
+def llm_judge_rows(
+    cases: List[tuple[str, str, str, str]],
+    args: argparse.Namespace,
+    api_key: str,
+) -> tuple[List[Dict], int]:
+    """Judge records for a group of rows and the HTTP requests spent on them.
+
+    A group of one is judged on its own; larger groups (`--llm-pack-size`) share one packed
+    request per vote round.
+    """
+    if len(cases) == 1:
+        rec = llm_judge_row(*cases[0], args, api_key)
+        return [rec], rec["calls"]
+    results, requests = llm_judge_vote_packed(
+        api_base=args.llm_api_base,
+        api_key=api_key,
+        model=args.llm_model,
+        cases=cases,
+        icl_shots=int(args.llm_icl_shots),
+        temperature=float(args.llm_temperature),
+        max_output_tokens=int(args.llm_max_output_tokens),
+        timeout_sec=int(args.llm_timeout_sec),
+        votes=int(args.llm_votes),
+        adaptive=bool(args.llm_adaptive_votes),
+        stop_confidence=float(args.llm_vote_stop_confidence),
+        escalate_votes=int(args.llm_escalate_votes),
+        require_unanimous=bool(args.llm_require_unanimous),
+        confidence_th=float(args.llm_confidence_th),
+    )
+    keys = ["label", "confidence", "rationale", "agreement", "calls"]
+    return [dict(zip(keys, r)) for r in results], requests
+
+
+def apply_llm_judgment(row_df: pd.DataFrame, i: int, rec: Dict, args: argparse.Namespace, tally: Dict) -> None:
+    """Write one judge result into `row_df` and override the prediction when it is confident enough."""
+    row_df.at[i, "llm_calls"] = int(rec["calls"])
+    if rec["label"] is None:
+        tally["failed"] += 1
+        if rec["rationale"]:
+            tally["failure_reasons"].append(rec["rationale"])
+        return
+    lbl = int(rec["label"])
+    tally["judged"] += 1
+    row_df.at[i, "llm_label"] = lbl
+    row_df.at[i, "llm_confidence"] = float(rec["confidence"])
+    row_df.at[i, "llm_rationale"] = rec["rationale"]
+    unanimous_ok = (not args.llm_require_unanimous) or (rec["agreement"] >= 0.999999)
+    if rec["confidence"] >= args.llm_confidence_th and unanimous_ok:
+        base_pred = int(row_df.at[i, "pred_final"])
+        row_df.at[i, "pred_final"] = lbl
+        if base_pred != lbl:
+            tally["overrides"] += 1
+            row_df.at[i, "llm_override"] = 1
+        row_df.at[i, "triage_label"] = "auto_positive_llm" if lbl == 1 else "auto_negative_llm"
+
+
+def new_llm_tally() -> Dict:
+    return {
+        "judged": 0,
+        "overrides": 0,
+        "failed": 0,
+        "judge_calls": 0,
+        "requests": 0,
+        "resumed": 0,
+        "failure_reasons": [],
+    }
 
-    overrides = 0
-    judged = 0
-    failed = 0
-    eligible = len(idx)
-    failure_reasons: List[str] = []
-    for i in idx:
-        r = row_df.loc[i]
-        lbl, conf, rat, agree = llm_judge_vote(
-            api_base=args.llm_api_base,
-            api_key=api_key,
-            model=args.llm_model,
-            f1=str(r[COL_F1]),
-            r1=str(r[COL_R1]),
-            f2=str(r[COL_F2]),
-            r2=str(r[COL_R2]),
-            icl_shots=int(args.llm_icl_shots),
-            temperature=float(args.llm_temperature),
-            max_output_tokens=int(args.llm_max_output_tokens),
-            timeout_sec=int(args.llm_timeout_sec),
-            votes=int(args.llm_votes),
-        )
-        if lbl is None:
-            failed += 1
-            if rat:
-                failure_reasons.append(rat)
-            continue
-        judged += 1
-        row_df.at[i, "llm_label"] = int(lbl)
-        row_df.at[i, "llm_confidence"] = float(conf)
-        row_df.at[i, "llm_rationale"] = rat
-        unanimous_ok = (not args.llm_require_unanimous) or (agree >= 0.999999)
-        if conf >= args.llm_confidence_th and unanimous_ok:
-            base_pred = int(row_df.at[i, "pred_final"])
-            row_df.at[i, "pred_final"] = int(lbl)
-            if base_pred != int(lbl):
-                overrides += 1
-                row_df.at[i, "llm_override"] = 1
-            row_df.at[i, "triage_label"] = "auto_positive_llm" if int(lbl) == 1 else "auto_negative_llm"
 
+def report_llm_judge(tally: Dict, eligible: int, args: argparse.Namespace) -> None:
+    """Print the judge summary and enforce --llm-fail-on-error / --llm-strict."""
+    judged, overrides, failed = tally["judged"], tally["overrides"], tally["failed"]
     print(
         f"LLM judge(api): model={args.llm_model} judged={judged} overrides={overrides} "
         f"failed={failed} (on={args.llm_on}, confidence_th={args.llm_confidence_th:.2f}, "
         f"band={args.llm_uncertainty_band:.3f}, unanimous={args.llm_require_unanimous})"
     )
-    if failed > 0 and failure_reasons:
+    if tally["resumed"] > 0:
+        print(f"LLM judge: restored {tally['resumed']} judged rows from checkpoint")
+    if eligible > 0:
+        print(
+            f"LLM judge calls: {tally['judge_calls']} for {eligible} rows "
+            f"(max {eligible * max(int(args.llm_votes), int(args.llm_escalate_votes), 1)}, "
+            f"adaptive={args.llm_adaptive_votes})"
+        )
+    if args.llm_pack_size > 1 and tally["requests"] > 0:
+        print(
+            f"LLM judge requests: {tally['requests']} for {tally['judge_calls']} calls "
+            f"(pack size {args.llm_pack_size}; missing or invalid items re-requested one by one)"
+        )
+    if failed > 0 and tally["failure_reasons"]:
         # Print only a few unique reasons to keep terminal output readable.
         seen = []
-        for msg in failure_reasons:
+        for msg in tally["failure_reasons"]:
             if msg not in seen:
                 seen.append(msg)
             if len(seen) >= 3:
@@ -795,23 +2054,1024 @@ def run_llm_judge_stage(row_df: pd.DataFrame, args: argparse.Namespace, tuned_th
             "WARNING: LLM judge returned labels but made zero overrides. "
             "This can be valid, or confidence threshold may be too high."
         )
-    return row_df
 
 
-def ablation_markdown_lines(ablation_df: pd.DataFrame) -> List[str]:
-    md_lines = []
-    md_lines.append("| # | Model | Best th | Acc | F1 | Kappa | BalAcc | TP | TN | FP | FN |")
-    md_lines.append("|---:|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|")
-    for _, r in ablation_df.iterrows():
-        best_th_str = "-" if pd.isna(r["Best th"]) else f"{float(r['Best th']):.2f}"
-        md_lines.append(
-            f"| {int(r['#'])} | {r['Model']} | {best_th_str} | {r['Acc']:.4f} | {r['F1']:.4f} | "
-            f"{r['Kappa']:.4f} | {r['BalAcc']:.4f} | {int(r['TP'])} | {int(r['TN'])} | {int(r['FP'])} | {int(r['FN'])} |"
+def run_llm_judge_stage(
+    row_df: pd.DataFrame,
+    args: argparse.Namespace,
+    tuned_th,
+    checkpoint: Optional[RunCheckpoint] = None,
+) -> pd.DataFrame:
+    """Judge uncertain rows; `tuned_th` is a scalar or a per-row threshold array (cascade mode).
+
+    Successful judgments are appended to the checkpoint as they arrive; with `--resume`,
+    rows already judged are restored instead of calling the API again.
+    """
+    row_th = np.broadcast_to(np.asarray(tuned_th, dtype=float), (len(row_df),))
+    api_key = llm_api_key(args)
+    if api_key is None:
+        return row_df
+
+    idx = row_df.index[
+        llm_candidate_rows(
+            row_df["triage_label"].to_numpy(),
+            row_df["final_score"].to_numpy(),
+            row_th,
+            row_df["prefilter_rule"].to_numpy() if "prefilter_rule" in row_df.columns else None,
+            args,
         )
-    return md_lines
+    ].tolist()
+    if args.llm_max_cases > 0:
+        idx = idx[: args.llm_max_cases]
 
+    tally = new_llm_tally()
+    saved = checkpoint.load_llm_results() if checkpoint is not None and checkpoint.resume else {}
+    # Rows still to judge go out in groups of --llm-pack-size, in row order.
+    fresh = [i for i in idx if int(i) not in saved]
+    fresh_pos = {i: k for k, i in enumerate(fresh)}
+    pack = max(1, int(args.llm_pack_size))
+    judged: Dict[int, Dict] = {}
+    for i in idx:
+        rec = saved.get(int(i))
+        if rec is not None:
+            tally["resumed"] += 1
+        else:
+            if i not in judged:
+                group = fresh[fresh_pos[i] : fresh_pos[i] + pack]
+                recs, requests = llm_judge_rows([llm_case(row_df, j) for j in group], args, api_key)
+                judged.update(zip(group, recs))
+                tally["requests"] += requests
+            rec = judged.pop(i)
+            tally["judge_calls"] += rec["calls"]
+            if rec["label"] is not None and checkpoint is not None:
+                checkpoint.append_llm_result({"row": int(i), **rec})
+        apply_llm_judgment(row_df, i, rec, args, tally)
+
+    report_llm_judge(tally, len(idx), args)
+    return row_df
 
-def print_ablation_terminal(ablation_df: pd.DataFrame) -> None:
+
+def load_nli_model(model_name: str, device: str) -> tuple:
+    print(f"Loading model: {model_name} on device={device}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device)
+    model.eval()
+    entail_idx, contra_idx = find_label_indices(model)
+    return tokenizer, model, entail_idx, contra_idx
+
+
+def tiered_final_scores(
+    eval_df: pd.DataFrame,
+    sim: Dict[str, np.ndarray],
+    idx: np.ndarray,
+    cfg: Config,
+    args: argparse.Namespace,
+    cache: TokenCache,
+    model,
+    device: str,
+    entail_idx: int,
+    contra_idx: int,
+) -> np.ndarray:
+    """Final fused scores for rows `idx` under `cfg`, using the given NLI model."""
+    tmpl = get_templates()[cfg.template]
+    nli = score_template_nli(
+        eval_df.iloc[idx],
+        tmpl,
+        cache,
+        model,
+        device,
+        entail_idx,
+        contra_idx,
+        args.nli_batch_size,
+        args.nli_batch_order,
+    )
+    d12, d21 = directional_nli_scores(nli, args.nli_score_mode)
+    nli_score = get_aggregators()[cfg.aggregator](d12, d21)
+    contradiction = np.maximum(nli["c12"], nli["c21"])
+    return fuse_scores(
+        nli_score,
+        sim["lex"][idx],
+        contradiction,
+        sim["rule"][idx],
+        cfg.alpha,
+        cfg.contradiction_th,
+        cfg.rule_penalty,
+    )
+
+
+def tier_threshold(y: np.ndarray, score: np.ndarray, args: argparse.Namespace, fallback: float) -> float:
+    """CV-tuned threshold on a subset; falls back when a class has fewer rows than folds."""
+    n_splits = min(args.cv_folds, int((y == 0).sum()), int((y == 1).sum()))
+    if n_splits < 2:
+        return fallback
+    folds = stratified_kfold_indices(y, n_splits, args.seed)
+    th, _ = tune_threshold(y, score, folds, args, np.linspace(0.01, 0.99, 99))
+    return th
+
+
+def run_cascade_stage(
+    row_df: pd.DataFrame,
+    eval_df: pd.DataFrame,
+    y: np.ndarray,
+    sim: Dict[str, np.ndarray],
+    cfg: Config,
+    args: argparse.Namespace,
+    device: str,
+    small_sec: float,
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """Re-score the small model's needs_review band with the large `--model`.
+
+    Returns the updated rows and the per-row decision threshold (small-tier rows keep the
+    sweep's tuned threshold; large-tier rows use a threshold tuned on the routed subset).
+    """
+    decision_th = np.full(len(row_df), float(cfg.tuned_th))
+    row_df["cascade_tier"] = "small"
+    idx = np.where(row_df["triage_label"].to_numpy() == "needs_review")[0]
+    if len(idx) == 0:
+        print("Cascade: no needs_review rows, large model not used.")
+        return row_df, decision_th
+
+    tokenizer, model, entail_idx, contra_idx = load_nli_model(args.model, device)
+    cache = TokenCache(tokenizer)
+    apply_nli_autotune(eval_df, args.model, cache, model, device, args)
+    t0 = time.perf_counter()
+    large_score = tiered_final_scores(
+        eval_df, sim, idx, cfg, args, cache, model, device, entail_idx, contra_idx
+    )
+    large_sec = time.perf_counter() - t0
+    large_th = tier_threshold(y[idx], large_score, args, float(cfg.tuned_th))
+    low_th, high_th = find_triage_thresholds(y[idx], large_score, args.min_pos_precision, args.min_neg_precision)
+
+    final_col = row_df.columns.get_loc("final_score")
+    pred_col = row_df.columns.get_loc("pred")
+    row_df.iloc[idx, final_col] = large_score.astype(np.float32)
+    row_df.iloc[idx, pred_col] = (large_score >= large_th).astype(int)
+    row_df.iloc[idx, row_df.columns.get_loc("triage_label")] = np.where(
+        large_score >= high_th,
+        "auto_positive",
+        np.where(large_score <= low_th, "auto_negative", "needs_review"),
+    )
+    row_df.iloc[idx, row_df.columns.get_loc("cascade_tier")] = "large"
+    row_df["pred_final"] = row_df["pred"].copy()
+    decision_th[idx] = large_th
+
+    n_templates = len(select_named_variants(get_templates(), args.templates, "templates"))
+    n = len(row_df)
+    cascade_m = metrics(y, row_df["pred"].to_numpy().astype(int))
+    print(
+        f"Cascade: small={args.cascade_model} rows={n} ({2 * n * n_templates} NLI calls, {small_sec:.1f}s) | "
+        f"large={args.model} rows={len(idx)} ({2 * len(idx)} NLI calls, {large_sec:.1f}s) | "
+        f"still needs_review={int((row_df['triage_label'] == 'needs_review').sum())}"
+    )
+    print(f"Cascade large-tier thresholds: decision={large_th:.2f} triage low={low_th:.2f} high={high_th:.2f}")
+    if args.cascade_compare_full:
+        t0 = time.perf_counter()
+        all_idx = np.arange(n)
+        full_score = tiered_final_scores(
+            eval_df, sim, all_idx, cfg, args, cache, model, device, entail_idx, contra_idx
+        )
+        full_sec = time.perf_counter() - t0
+        full_th = tier_threshold(y, full_score, args, float(cfg.tuned_th))
+        full_m = metrics(y, (full_score >= full_th).astype(int))
+        print(
+            f"Cascade vs large-only: kappa {cascade_m['kappa']:.4f} vs {full_m['kappa']:.4f} "
+            f"(delta={cascade_m['kappa'] - full_m['kappa']:+.4f}) | "
+            f"large-only {2 * n} NLI calls, {full_sec:.1f}s"
+        )
+    else:
+        print(f"Cascade kappa: {cascade_m['kappa']:.4f} (use --cascade-compare-full for the large-only delta)")
+    return row_df, decision_th
+
+
+def triage_labels(score: np.ndarray, low_th: float, high_th: float) -> np.ndarray:
+    return np.where(score >= high_th, "auto_positive", np.where(score <= low_th, "auto_negative", "needs_review"))
+
+
+def build_row_scores(
+    eval_df: pd.DataFrame,
+    y: np.ndarray,
+    nli: Dict[str, np.ndarray],
+    nli_score: np.ndarray,
+    sim: Dict[str, np.ndarray],
+    final_score: np.ndarray,
+    tuned_th: float,
+    low_th: float,
+    high_th: float,
+    decided: Optional[np.ndarray],
+    prefilter_rule: Optional[np.ndarray],
+) -> pd.DataFrame:
+    """Per-row output frame: texts, labels, score columns, prediction, triage and empty LLM columns."""
+    row_df = eval_df.copy()
+    if COL_FIAZ in row_df.columns:
+        row_df[COL_FIAZ] = safe_int_series(row_df[COL_FIAZ])
+    if COL_NAVEEN in row_df.columns:
+        row_df[COL_NAVEEN] = safe_int_series(row_df[COL_NAVEEN])
+    row_df["target_label"] = y
+    # Per-row score columns are kept as float32; decisions use the float64 vectors.
+    score_cols = {
+        "e12": nli["e12"],
+        "e21": nli["e21"],
+        "c12": nli["c12"],
+        "c21": nli["c21"],
+        "nli_score": nli_score,
+        "lex_score": sim["lex"],
+        "lex_jaccard": sim["lex_jaccard"],
+        "lex_cosine": sim["lex_cosine"],
+        "contradiction": np.maximum(nli["c12"], nli["c21"]),
+    }
+    for col, values in score_cols.items():
+        row_df[col] = values.astype(np.float32)
+    if decided is not None:
+        # Prefiltered rows never reached NLI.
+        skipped = ~np.isnan(decided)
+        for col in ["e12", "e21", "c12", "c21", "nli_score", "contradiction"]:
+            row_df.loc[skipped, col] = np.nan
+    row_df["rule_flag"] = sim["rule"]
+    row_df["final_score"] = final_score.astype(np.float32)
+    row_df["pred"] = (final_score >= tuned_th).astype(int)
+    row_df["pred"] = safe_int_series(row_df["pred"])
+    row_df["target_label"] = safe_int_series(row_df["target_label"])
+    row_df["rule_flag"] = safe_int_series(row_df["rule_flag"])
+
+    row_df["triage_label"] = triage_labels(final_score, low_th, high_th)
+    if prefilter_rule is not None:
+        row_df["prefilter_rule"] = prefilter_rule
+        row_df.loc[decided == 1, "triage_label"] = "auto_positive"
+        row_df.loc[decided == 0, "triage_label"] = "auto_negative"
+
+    row_df["llm_label"] = np.nan
+    row_df["llm_confidence"] = np.nan
+    row_df["llm_rationale"] = ""
+    row_df["llm_calls"] = 0
+    row_df["pred_final"] = row_df["pred"].copy()
+    row_df["llm_override"] = 0
+    return row_df
+
+
+def write_row_outputs(
+    row_df: pd.DataFrame,
+    out_rows: Path,
+    out_triage: Path,
+    output_format: str,
+) -> tuple[Path, Path]:
+    """Write the row score and triage tables; returns their final paths."""
+    row_df["pred_final"] = safe_int_series(row_df["pred_final"])
+    row_df["llm_override"] = safe_int_series(row_df["llm_override"])
+    row_df["match"] = (row_df["pred_final"] == row_df["target_label"]).astype(int)
+    out_rows = write_table(row_df, out_rows, output_format)
+
+    triage_df = row_df[
+        [
+            COL_F1,
+            COL_R1,
+            COL_F2,
+            COL_R2,
+            "target_label",
+            "final_score",
+            "pred",
+            "pred_final",
+            "llm_label",
+            "llm_confidence",
+            ]
+    ].copy()
+    triage_df["triage_label"] = row_df["triage_label"]
+    out_triage = write_table(triage_df, out_triage, output_format)
+    return out_rows, out_triage
+
+
+# Settings a fixed-config run takes from best_config.json instead of the command line,
+# so rows are scored exactly as during tuning.
+FIXED_CONFIG_ARGS = [
+    "model",
+    "nli_score_mode",
+    "similarity_method",
+    "similarity_beta",
+    "embedding_model",
+    "prefilter",
+    "prefilter_max_cosine",
+    "near_dup",
+    "near_dup_threshold",
+    "minhash_perms",
+    "lsh_bands",
+    "fusion",
+]
+
+
+def save_best_config(
+    path: Path,
+    cfg: Config,
+    low_th: float,
+    high_th: float,
+    model_name: str,
+    args: argparse.Namespace,
+) -> None:
+    """Write the winning config and triage thresholds for later `--fixed-config` runs."""
+    payload = {name: getattr(args, name) for name in FIXED_CONFIG_ARGS}
+    payload["model"] = model_name
+    for name, value in asdict(cfg).items():
+        payload[name] = None if isinstance(value, float) and np.isnan(value) else value
+    payload["triage_low"] = float(low_th)
+    payload["triage_high"] = float(high_th)
+    if args.fusion == "learned":
+        payload["learned_model"] = "learned_fusion.json"
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def load_fixed_config(path: str, args: argparse.Namespace) -> Dict:
+    """Read best_config.json and apply its scoring settings to `args`."""
+    fixed = json.loads(Path(path).read_text(encoding="utf-8"))
+    for name in FIXED_CONFIG_ARGS:
+        setattr(args, name, fixed[name])
+    args.cascade_model = ""
+    if fixed["fusion"] == "learned":
+        model = json.loads((Path(path).parent / fixed["learned_model"]).read_text(encoding="utf-8"))
+        if model["template"] != fixed["template"]:
+            raise ValueError(f"{fixed['learned_model']} was fitted on template {model['template']}, not {fixed['template']}.")
+        fixed["learned"] = {
+            "mean": np.array(model["mean"]),
+            "std": np.array(model["std"]),
+            "coef": np.array(model["coef"]),
+            "intercept": float(model["intercept"]),
+        }
+    return fixed
+
+
+def fixed_config_scores(
+    nli: Dict[str, np.ndarray],
+    sim: Dict[str, np.ndarray],
+    fixed: Dict,
+    score_mode: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """(nli_score, final_score) for a batch of rows under a loaded best_config.json."""
+    d12, d21 = directional_nli_scores(nli, score_mode)
+    if fixed["fusion"] == "learned":
+        return get_aggregators()["mean"](d12, d21), predict_logistic(fixed["learned"], fusion_features(nli, sim))
+    nli_score = get_aggregators()[fixed["aggregator"]](d12, d21)
+    final = fuse_scores(
+        nli_score,
+        sim["lex"],
+        np.maximum(nli["c12"], nli["c21"]),
+        sim["rule"],
+        fixed["alpha"],
+        fixed["contradiction_th"],
+        fixed["rule_penalty"],
+    )
+    return nli_score, final
+
+
+def run_fixed_config_pipeline(
+    eval_df: pd.DataFrame,
+    nli_df: pd.DataFrame,
+    y: np.ndarray,
+    sim: Dict[str, np.ndarray],
+    fixed: Dict,
+    args: argparse.Namespace,
+    cache: TokenCache,
+    model,
+    device: str,
+    entail_idx: int,
+    contra_idx: int,
+    decided: Optional[np.ndarray],
+    prefilter_rule: Optional[np.ndarray],
+) -> pd.DataFrame:
+    """Score rows under a fixed config in chunks, judging uncertain rows while NLI continues.
+
+    Each chunk's rows are fused and triaged as soon as NLI finishes them; rows the judge should
+    see (same selection as `run_llm_judge_stage`) go straight to a pool of `--llm-workers`
+    threads, so end-to-end time approaches max(NLI, LLM) instead of their sum.
+    """
+    n = len(eval_df)
+    todo = np.arange(n) if decided is None else np.where(np.isnan(decided))[0]
+    tmpl = get_templates()[fixed["template"]]
+    tuned_th = float(fixed["tuned_th"])
+    low_th, high_th = float(fixed["triage_low"]), float(fixed["triage_high"])
+    nli = {key: np.zeros(n) for key in ["e12", "e21", "c12", "c21"]}
+    nli_score = np.zeros(n)
+    final_score = np.zeros(n)
+
+    api_key = llm_api_key(args) if args.llm_judge else None
+    pool = ThreadPoolExecutor(max_workers=max(1, args.llm_workers)) if api_key is not None else None
+    tally = new_llm_tally()
+    pending: Dict[Future, List[int]] = {}
+    results: Dict[int, Dict] = {}
+    dispatched = 0
+    judge_sec = 0.0
+    pack = max(1, int(args.llm_pack_size))
+
+    def judge(group: List[int]) -> tuple[List[Dict], int, float]:
+        t0 = time.perf_counter()
+        recs, requests = llm_judge_rows([llm_case(eval_df, i) for i in group], args, api_key)
+        return recs, requests, time.perf_counter() - t0
+
+    def collect(done) -> None:
+        nonlocal judge_sec
+        for fut in done:
+            group = pending.pop(fut)
+            recs, requests, sec = fut.result()
+            judge_sec += sec
+            tally["requests"] += requests
+            for i, rec in zip(group, recs):
+                tally["judge_calls"] += rec["calls"]
+                results[i] = rec
+
+    t_start = time.perf_counter()
+    nli_sec = 0.0
+    nli_stats: Dict[str, float] = {}
+    chunk = max(1, args.pipeline_chunk_rows)
+    for start in range(0, len(todo), chunk):
+        rows = todo[start : start + chunk]
+        t0 = time.perf_counter()
+        part = score_template_nli(
+            nli_df.iloc[rows],
+            tmpl,
+            cache,
+            model,
+            device,
+            entail_idx,
+            contra_idx,
+            args.nli_batch_size,
+            args.nli_batch_order,
+            nli_stats,
+        )
+        nli_sec += time.perf_counter() - t0
+        part_nli_score, part_final = fixed_config_scores(
+            part, {key: values[rows] for key, values in sim.items()}, fixed, args.nli_score_mode
+        )
+        for key in nli:
+            nli[key][rows] = part[key]
+        nli_score[rows] = part_nli_score
+        final_score[rows] = part_final
+        if pool is None:
+            continue
+
+        candidates = rows[
+            llm_candidate_rows(
+                triage_labels(part_final, low_th, high_th), part_final, np.full(len(rows), tuned_th), None, args
+            )
+        ]
+        if args.llm_max_cases > 0:
+            candidates = candidates[: max(0, args.llm_max_cases - dispatched)]
+        dispatched += len(candidates)
+        fresh = candidates.tolist()
+        for start in range(0, len(fresh), pack):
+            group = fresh[start : start + pack]
+            pending[pool.submit(judge, group)] = group
+        collect([fut for fut in pending if fut.done()])
+    nli_wall = time.perf_counter() - t_start
+    if pool is not None:
+        collect(as_completed(list(pending)))
+        pool.shutdown()
+    total_sec = time.perf_counter() - t_start
+
+    row_df = build_row_scores(
+        eval_df,
+        y,
+        nli,
+        nli_score,
+        sim,
+        apply_prefilter(final_score, decided),
+        tuned_th,
+        low_th,
+        high_th,
+        decided,
+        prefilter_rule,
+    )
+    for i in sorted(results):
+        apply_llm_judgment(row_df, i, results[i], args, tally)
+
+    summary = nli_batch_summary(nli_stats) if nli_stats else "no rows"
+    print(f"Fixed config NLI: {len(todo)} rows in chunks of {chunk}, {nli_sec:.1f}s ({summary})")
+    if pool is not None:
+        report_llm_judge(tally, dispatched, args)
+        print(
+            f"Pipeline: end-to-end {total_sec:.1f}s (NLI done at {nli_wall:.1f}s) | judge time {judge_sec:.1f}s "
+            f"summed over {len(results)} rows on {args.llm_workers} workers | "
+            f"NLI then sequential judge would take ~{nli_sec + judge_sec:.1f}s"
+        )
+    return row_df
+
+
+def shard_assignments(eval_df: pd.DataFrame, num_shards: int) -> np.ndarray:
+    """Deterministic shard per row from a hash of its texts (stable across hosts and runs)."""
+    keys = zip(eval_df[COL_F1], eval_df[COL_R1], eval_df[COL_F2], eval_df[COL_R2])
+    return np.array(
+        [
+            int.from_bytes(hashlib.blake2b("\x1f".join(map(str, k)).encode("utf-8"), digest_size=8).digest(), "big")
+            % num_shards
+            for k in keys
+        ],
+        dtype=np.int64,
+    )
+
+
+def shard_path(out_dir: Path, shard_index: int, num_shards: int) -> Path:
+    return out_dir / "shards" / f"shard_{shard_index:03d}_of_{num_shards:03d}.npz"
+
+
+def run_shard_worker(
+    eval_df: pd.DataFrame,
+    args: argparse.Namespace,
+    model_name: str,
+    device: str,
+    out_dir: Path,
+) -> None:
+    """Score one shard's rows for every template and write them to the shared shard directory."""
+    rows = np.where(shard_assignments(eval_df, args.num_shards) == args.shard_index)[0]
+    templates = select_named_variants(get_templates(), args.templates, "templates")
+    tokenizer, model, _, _ = load_nli_model(model_name, device)
+    cache = TokenCache(tokenizer)
+    # Workers share the host, so only the batch size is tuned under the thread budget they were given.
+    apply_nli_autotune(eval_df, model_name, cache, model, device, args, tune_threads=False)
+    stats: Dict[str, float] = {}
+    probs = score_templates_nli(
+        eval_df.iloc[rows],
+        list(templates.values()),
+        cache,
+        model,
+        device,
+        args.nli_batch_size,
+        args.nli_batch_order,
+        stats,
+    )
+    path = shard_path(out_dir, args.shard_index, args.num_shards)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_replace(
+        path,
+        lambda f: np.savez(
+            f,
+            rows=rows,
+            probs=probs,
+            templates=np.array(list(templates), dtype=str),
+            fingerprint=np.array(args_fingerprint(args, SHARD_FINGERPRINT_ARGS, args.csv)),
+        ),
+    )
+    summary = nli_batch_summary(stats) if stats else "no rows"
+    print(f"Shard {args.shard_index}/{args.num_shards}: {len(rows)} rows -> {path} ({summary})")
+
+
+def spawn_shard_workers(num_shards: int, out_dir: Path) -> None:
+    """Run every shard as a local worker process (same arguments) and wait for all of them."""
+    env = dict(os.environ)
+    env.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // num_shards)))
+    log_dir = out_dir / "shards"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    procs = []
+    for k in range(num_shards):
+        # argparse keeps the last occurrence, so appending overrides the coordinator's own flags.
+        cmd = [sys.executable, os.path.abspath(__file__), *sys.argv[1:]]
+        cmd += ["--shard-workers", "0", "--num-shards", str(num_shards), "--shard-index", str(k)]
+        cmd += ["--out-dir", str(out_dir)]
+        log = open(log_dir / f"worker_{k:03d}.log", "w", encoding="utf-8")
+        procs.append((k, subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env), log))
+    failed = []
+    for k, proc, log in procs:
+        if proc.wait() != 0:
+            failed.append(k)
+        log.close()
+    if failed:
+        raise RuntimeError(f"Shard workers {failed} failed; see {log_dir}/worker_*.log")
+
+
+def merge_shards(
+    out_dir: Path,
+    num_shards: int,
+    n_rows: int,
+    templates: List[str],
+    fingerprint: str,
+) -> Dict[str, np.ndarray]:
+    """Reassemble per-template probabilities from all shard files, checking every row is covered once."""
+    missing = [k for k in range(num_shards) if not shard_path(out_dir, k, num_shards).exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing shard outputs {missing} in {out_dir / 'shards'}")
+    merged: Optional[np.ndarray] = None
+    seen = np.zeros(n_rows, dtype=np.int64)
+    for k in range(num_shards):
+        with np.load(shard_path(out_dir, k, num_shards)) as data:
+            if str(data["fingerprint"]) != fingerprint or data["templates"].tolist() != templates:
+                raise ValueError(f"Shard {k} was scored with a different input or model config.")
+            rows, probs = data["rows"], data["probs"]
+        if merged is None:
+            merged = np.zeros((n_rows,) + probs.shape[1:], dtype=np.float32)
+        merged[rows] = probs
+        seen[rows] += 1
+    if merged is None or not (seen == 1).all():
+        raise ValueError(f"Shard outputs cover {int((seen > 0).sum())} of {n_rows} rows.")
+    return {name: merged[:, t] for t, name in enumerate(templates)}
+
+
+def report_histogram_search(
+    y: np.ndarray,
+    score: np.ndarray,
+    folds: List[np.ndarray],
+    cfg: Config,
+    args: argparse.Namespace,
+    threshold_grid: np.ndarray,
+) -> None:
+    """Error bound of the binned threshold search for the best config, and optionally the exact gap."""
+    thresholds = search_thresholds(args, threshold_grid)
+    # Moving the threshold anywhere between two adjacent candidates changes a fold's confusion counts
+    # by at most the rows in that bin, which bounds the accuracy gap to the best unbinned threshold.
+    max_bin = 0
+    acc_bound = 0.0
+    for f in folds:
+        interior = ScoreHistogram(thresholds).add(score[f], y[f]).counts.sum(axis=0)[1:-1]
+        if len(interior):
+            max_bin = max(max_bin, int(interior.max()))
+            acc_bound = max(acc_bound, float(interior.max()) / max(len(f), 1))
+    print(
+        f"Histogram threshold search: {len(thresholds)} candidate thresholds, "
+        f"max rows between adjacent thresholds in a fold={max_bin} (per-fold accuracy error <= {acc_bound:.4f})"
+    )
+    if args.histogram_verify:
+        exact_th, exact_m = tune_threshold_hist(y, score, folds, args.objective, np.unique(score))
+        binned = objective_value(
+            {"kappa": cfg.cv_kappa, "f1": cfg.cv_f1, "balanced_acc": cfg.cv_balanced_acc}, args.objective
+        )
+        exact = objective_value(exact_m, args.objective)
+        print(
+            f"Histogram vs exact (all distinct scores) for best config: cv_{args.objective} "
+            f"{binned:.4f} @ th={cfg.tuned_th:.4f} vs {exact:.4f} @ th={exact_th:.4f} (gap={exact - binned:+.4f})"
+        )
+
+
+def search_template_grid(
+    tmpl_name: str,
+    nli: Dict[str, np.ndarray],
+    lex: np.ndarray,
+    rule: np.ndarray,
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    aggs: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]],
+    alphas: List[float],
+    contra_thresholds: List[float],
+    rule_penalties: List[float],
+    threshold_grid: np.ndarray,
+    args: argparse.Namespace,
+    decided: Optional[np.ndarray] = None,
+) -> List[Dict]:
+    """Config search rows (CV-tuned threshold + full-data metrics) for one template's NLI scores."""
+    rows = []
+    contradiction = np.maximum(nli["c12"], nli["c21"])
+    for agg_name, agg_fn in aggs.items():
+        print(f"  Aggregator: {agg_name}")
+        d12, d21 = directional_nli_scores(nli, args.nli_score_mode)
+        nli_score = agg_fn(d12, d21)
+        for alpha in alphas:
+            blended = alpha * nli_score + (1.0 - alpha) * lex
+            for ct in contra_thresholds:
+                guarded = blended.copy()
+                guarded[contradiction >= ct] = 0.0
+                for penalty in rule_penalties:
+                    final_score = apply_prefilter(guarded * (1.0 - penalty * rule), decided)
+                    rows.append(
+                        config_row(
+                            (tmpl_name, agg_name, alpha, ct, penalty), final_score, y, folds, threshold_grid, args
+                        )
+                    )
+    return rows
+
+
+def config_row(
+    cfg: tuple,
+    final_score: np.ndarray,
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    threshold_grid: np.ndarray,
+    args: argparse.Namespace,
+) -> Dict:
+    """Config search row for (template, aggregator, alpha, contradiction_th, rule_penalty)."""
+    tuned_th, cv_m = tune_threshold(y, final_score, folds, args, threshold_grid)
+    full_m = metrics(y, (final_score >= tuned_th).astype(int))
+    tmpl_name, agg_name, alpha, ct, penalty = cfg
+    return {
+        "template": tmpl_name,
+        "aggregator": agg_name,
+        "alpha": alpha,
+        "contradiction_th": ct,
+        "rule_penalty": penalty,
+        "tuned_th": tuned_th,
+        "cv_acc": cv_m["acc"],
+        "cv_f1": cv_m["f1"],
+        "cv_kappa": cv_m["kappa"],
+        "cv_balanced_acc": cv_m["balanced_acc"],
+        "full_acc": full_m["acc"],
+        "full_f1": full_m["f1"],
+        "full_kappa": full_m["kappa"],
+        "full_balanced_acc": full_m["balanced_acc"],
+    }
+
+
+LEARNED_FEATURES = ["e12", "e21", "c12", "c21", "e_min", "c_max", "lex", "lex_jaccard", "lex_cosine", "rule"]
+
+
+def fusion_features(nli: Dict[str, np.ndarray], sim: Dict[str, np.ndarray]) -> np.ndarray:
+    """(n_rows, len(LEARNED_FEATURES)) feature matrix for the learned fusion model."""
+    return np.column_stack(
+        [
+            nli["e12"],
+            nli["e21"],
+            nli["c12"],
+            nli["c21"],
+            np.minimum(nli["e12"], nli["e21"]),
+            np.maximum(nli["c12"], nli["c21"]),
+            sim["lex"],
+            sim["lex_jaccard"],
+            sim["lex_cosine"],
+            sim["rule"],
+        ]
+    ).astype(np.float64)
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, l2: float, max_iter: int = 50, tol: float = 1e-8) -> Dict:
+    """L2-regularized logistic regression on standardized features, fitted with Newton steps."""
+    mean = x.mean(axis=0)
+    std = x.std(axis=0)
+    std[std == 0] = 1.0
+    z = np.column_stack([np.ones(len(x)), (x - mean) / std])
+    reg = np.full(z.shape[1], float(l2))
+    reg[0] = 0.0
+    w = np.zeros(z.shape[1])
+    for _ in range(max_iter):
+        p = 0.5 * (1.0 + np.tanh(0.5 * (z @ w)))
+        grad = z.T @ (p - y) + reg * w
+        hess = (z * (p * (1.0 - p))[:, None]).T @ z + np.diag(reg + 1e-9)
+        step = np.linalg.solve(hess, grad)
+        w -= step
+        if np.abs(step).max() < tol:
+            break
+    return {"mean": mean, "std": std, "intercept": float(w[0]), "coef": w[1:]}
+
+
+def predict_logistic(model: Dict, x: np.ndarray) -> np.ndarray:
+    """Match probability: one dot product per row."""
+    z = ((x - model["mean"]) / model["std"]) @ model["coef"] + model["intercept"]
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def learned_fusion_scores(
+    x: np.ndarray,
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    l2: float,
+    decided: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Out-of-fold probabilities: each fold is scored by a model fitted on the other folds.
+
+    Prefiltered rows are left out of training (their NLI features were never computed) and pinned.
+    """
+    train = np.ones(len(y), dtype=bool) if decided is None else np.isnan(decided)
+    oof = np.zeros(len(y))
+    for f in folds:
+        fit_rows = train.copy()
+        fit_rows[f] = False
+        oof[f] = predict_logistic(fit_logistic(x[fit_rows], y[fit_rows], l2), x[f])
+    return apply_prefilter(oof, decided)
+
+
+def learned_fusion_row(
+    tmpl_name: str,
+    nli: Dict[str, np.ndarray],
+    sim: Dict[str, np.ndarray],
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    threshold_grid: np.ndarray,
+    args: argparse.Namespace,
+    decided: Optional[np.ndarray] = None,
+) -> Dict:
+    """Config search row for the learned fusion model on one template's NLI scores."""
+    print("  Fusion: learned (logistic regression, out-of-fold scores)")
+    score = learned_fusion_scores(fusion_features(nli, sim), y, folds, args.learned_l2, decided)
+    return config_row((tmpl_name, "learned", np.nan, np.nan, np.nan), score, y, folds, threshold_grid, args)
+
+
+def save_learned_fusion(path: Path, tmpl_name: str, x: np.ndarray, y: np.ndarray, l2: float, train: np.ndarray) -> None:
+    """Fit on all training rows and write the model as JSON for scoring new pairs."""
+    model = fit_logistic(x[train], y[train], l2)
+    payload = {
+        "template": tmpl_name,
+        "features": LEARNED_FEATURES,
+        "mean": model["mean"].tolist(),
+        "std": model["std"].tolist(),
+        "coef": model["coef"].tolist(),
+        "intercept": model["intercept"],
+        "l2": l2,
+    }
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def config_key(row: Dict, objective: str) -> tuple:
+    """Ranking key of a config search row: full-data objective, then F1, then accuracy."""
+    full_m = {
+        "acc": row["full_acc"],
+        "f1": row["full_f1"],
+        "kappa": row["full_kappa"],
+        "balanced_acc": row["full_balanced_acc"],
+    }
+    return (objective_value(full_m, objective), full_m["f1"], full_m["acc"])
+
+
+def best_config_index(rows: List[Dict], objective: str) -> int:
+    """Index of the best row; the first one wins ties."""
+    if not rows:
+        raise ValueError("Config search produced no rows.")
+    best_idx = 0
+    for i, row in enumerate(rows):
+        if config_key(row, objective) > config_key(rows[best_idx], objective):
+            best_idx = i
+    return best_idx
+
+
+def report_halving_gap(
+    halving_best: Dict,
+    templates: Dict[str, str],
+    template_probs: Dict[str, np.ndarray],
+    complete_templates: List[str],
+    score_rows: Callable[[List[str], np.ndarray], np.ndarray],
+    nli_rows: np.ndarray,
+    lex: np.ndarray,
+    rule: np.ndarray,
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    aggs: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]],
+    alphas: List[float],
+    contra_thresholds: List[float],
+    rule_penalties: List[float],
+    threshold_grid: np.ndarray,
+    entail_idx: int,
+    contra_idx: int,
+    args: argparse.Namespace,
+    decided: Optional[np.ndarray],
+) -> None:
+    """Run the exhaustive grid as well and print the objective gap to the halving winner."""
+    incomplete = [t for t in templates if t not in complete_templates]
+    if incomplete:
+        probs = scatter_rows(score_rows(incomplete, nli_rows), nli_rows, len(y))
+        for t_idx, name in enumerate(incomplete):
+            template_probs[name] = probs[:, t_idx]
+    rows: List[Dict] = []
+    for tmpl_name in templates:
+        nli = template_nli(template_probs[tmpl_name], entail_idx, contra_idx)
+        rows.extend(
+            search_template_grid(
+                tmpl_name,
+                nli,
+                lex,
+                rule,
+                y,
+                folds,
+                aggs,
+                alphas,
+                contra_thresholds,
+                rule_penalties,
+                threshold_grid,
+                args,
+                decided,
+            )
+        )
+    exhaustive_best = rows[best_config_index(rows, args.objective)]
+    names = ["template", "aggregator", "alpha", "contradiction_th", "rule_penalty"]
+    same = all(exhaustive_best[k] == halving_best[k] for k in names)
+    gap = config_key(exhaustive_best, args.objective)[0] - config_key(halving_best, args.objective)[0]
+    print(
+        f"Halving vs exhaustive ({len(rows)} configs): full_{args.objective} "
+        f"{config_key(halving_best, args.objective)[0]:.4f} vs {config_key(exhaustive_best, args.objective)[0]:.4f} "
+        f"(gap={gap:+.4f}, {'same config' if same else 'different config'})"
+    )
+
+
+def nested_stratified_order(y: np.ndarray, seed: int) -> np.ndarray:
+    """Row order whose every prefix keeps the class ratio, so growing subsamples nest."""
+    rng = np.random.default_rng(seed)
+    rank = np.empty(len(y))
+    for cls in [0, 1]:
+        idx = np.where(y == cls)[0]
+        rng.shuffle(idx)
+        rank[idx] = (np.arange(len(idx)) + rng.random()) / max(len(idx), 1)
+    return np.argsort(rank, kind="stable")
+
+
+def halving_search(
+    template_names: List[str],
+    template_probs: Dict[str, np.ndarray],
+    score_rows: Callable[[List[str], np.ndarray], np.ndarray],
+    lex: np.ndarray,
+    rule: np.ndarray,
+    y: np.ndarray,
+    folds: List[np.ndarray],
+    aggs: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]],
+    alphas: List[float],
+    contra_thresholds: List[float],
+    rule_penalties: List[float],
+    threshold_grid: np.ndarray,
+    entail_idx: int,
+    contra_idx: int,
+    args: argparse.Namespace,
+    decided: Optional[np.ndarray] = None,
+    nli_rows: Optional[np.ndarray] = None,
+) -> tuple[List[Dict], Dict]:
+    """Successive halving over the config grid on growing, nested row subsamples.
+
+    Each round ranks the surviving configs by CV objective on a stratified subsample and keeps
+    the top 1/eta; NLI is only scored for the rows and templates still in play (`score_rows`).
+    The last round evaluates survivors on all rows exactly as the exhaustive search does, so the
+    returned rows are directly comparable. `template_probs` is filled in place (full-size arrays,
+    zero for rows never scored); templates scored on every row are listed in the stats.
+    """
+    n = len(y)
+    configs = [
+        (t, a, al, ct, p)
+        for t in template_names
+        for a in aggs
+        for al in alphas
+        for ct in contra_thresholds
+        for p in rule_penalties
+    ]
+    total = len(configs)
+    need = np.ones(n, dtype=bool) if nli_rows is None else np.isin(np.arange(n), nli_rows)
+    scored = {t: np.zeros(n, dtype=bool) for t in template_names}
+    for t in template_names:
+        if t in template_probs:
+            scored[t][:] = True
+    nli_exhaustive = sum(int((need & ~scored[t]).sum()) for t in template_names)
+    order = nested_stratified_order(y, args.seed)
+    eta = max(2, args.halving_eta)
+    frac = min(1.0, max(args.halving_min_fraction, 1.0 / n))
+    cost = 0.0
+    nli_scored = 0
+    rnd = 0
+    while True:
+        final = int(np.ceil(frac * n)) >= n
+        rows = np.arange(n) if final else np.sort(order[: int(np.ceil(frac * n))])
+        live = list(dict.fromkeys(c[0] for c in configs))
+        missing = np.where(np.isin(np.arange(n), rows) & need & ~np.logical_and.reduce([scored[t] for t in live]))[0]
+        if len(missing):
+            probs = score_rows(live, missing)
+            nli_scored += len(missing) * len(live)
+            for t_idx, t in enumerate(live):
+                if t not in template_probs:
+                    template_probs[t] = np.zeros((n,) + probs.shape[2:], dtype=probs.dtype)
+                template_probs[t][missing] = probs[:, t_idx]
+                scored[t][missing] = True
+        for t in live:
+            scored[t][~need] = True
+        y_sub = y[rows]
+        k = min(args.cv_folds, int((y_sub == 0).sum()), int((y_sub == 1).sum()))
+        if not final and k < 2:
+            # Too few rows of a class to cross-validate; grow the sample without eliminating.
+            frac = min(1.0, frac * eta)
+            continue
+        sub_folds = folds if final else stratified_kfold_indices(y_sub, k, args.seed)
+        cached: Dict[tuple, tuple] = {}
+        results = []
+        for cfg in configs:
+            tmpl_name, agg_name, alpha, ct, penalty = cfg
+            if (tmpl_name, agg_name) not in cached:
+                nli = template_nli(template_probs[tmpl_name][rows], entail_idx, contra_idx)
+                d12, d21 = directional_nli_scores(nli, args.nli_score_mode)
+                cached[(tmpl_name, agg_name)] = (aggs[agg_name](d12, d21), np.maximum(nli["c12"], nli["c21"]))
+            nli_score, contradiction = cached[(tmpl_name, agg_name)]
+            score = fuse_scores(nli_score, lex[rows], contradiction, rule[rows], alpha, ct, penalty)
+            score = apply_prefilter(score, None if decided is None else decided[rows])
+            if final:
+                results.append(config_row(cfg, score, y, sub_folds, threshold_grid, args))
+            else:
+                _, cv_m = tune_threshold(y_sub, score, sub_folds, args, threshold_grid)
+                results.append((objective_value(cv_m, args.objective), cv_m["f1"], cv_m["acc"]))
+        cost += len(configs) * len(rows)
+        if final:
+            print(f"  Halving round {rnd}: {len(configs)} configs on all {n} rows with {len(folds)}-fold CV")
+            break
+        keep = max(1, int(np.ceil(len(configs) / eta)))
+        ranked = sorted(range(len(configs)), key=lambda i: results[i], reverse=True)[:keep]
+        print(f"  Halving round {rnd}: {len(configs)} configs on {len(rows)} rows ({k}-fold CV) -> keep {keep}")
+        configs = [configs[i] for i in sorted(ranked)]
+        frac = min(1.0, frac * eta)
+        rnd += 1
+    stats = {
+        "configs": total,
+        "full_cv": len(results),
+        "cost_fraction": cost / max(total * n, 1),
+        "nli_scored": nli_scored,
+        "nli_exhaustive": nli_exhaustive,
+        "complete_templates": [t for t, m in scored.items() if m.all()],
+    }
+    return results, stats
+
+
+def ablation_markdown_lines(ablation_df: pd.DataFrame) -> List[str]:
+    md_lines = []
+    md_lines.append("| # | Model | Best th | Acc | F1 | Kappa | BalAcc | TP | TN | FP | FN |")
+    md_lines.append("|---:|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|")
+    for _, r in ablation_df.iterrows():
+        best_th_str = "-" if pd.isna(r["Best th"]) else f"{float(r['Best th']):.2f}"
+        md_lines.append(
+            f"| {int(r['#'])} | {r['Model']} | {best_th_str} | {r['Acc']:.4f} | {r['F1']:.4f} | "
+            f"{r['Kappa']:.4f} | {r['BalAcc']:.4f} | {int(r['TP'])} | {int(r['TN'])} | {int(r['FP'])} | {int(r['FN'])} |"
+        )
+    return md_lines
+
+
+def print_ablation_terminal(ablation_df: pd.DataFrame) -> None:
     cols = ["#", "Model", "Best th", "Acc", "F1", "Kappa", "BalAcc", "TP", "TN", "FP", "FN"]
     rows: List[List[str]] = []
     for _, r in ablation_df.iterrows():
@@ -856,6 +3116,12 @@ def main() -> None:
     parser.add_argument("--out-config", default="enhanced_config_search.csv")
     parser.add_argument("--out-rows", default="enhanced_row_scores.csv")
     parser.add_argument("--out-triage", default="enhanced_triage.csv")
+    parser.add_argument(
+        "--output-format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Format for config search, row score and triage outputs (parquet needs pyarrow).",
+    )
     parser.add_argument("--min-pos-precision", type=float, default=0.90)
     parser.add_argument("--min-neg-precision", type=float, default=0.90)
     parser.add_argument(
@@ -890,6 +3156,177 @@ def main() -> None:
         default="contra_norm",
         help="How to build per-direction NLI score before aggregation.",
     )
+    parser.add_argument(
+        "--fusion",
+        choices=["grid", "learned"],
+        default="grid",
+        help="learned: fit a logistic regression on e12/e21/c12/c21/lex/rule features per template "
+        "(out-of-fold scores) instead of searching alpha/tau_c/lambda.",
+    )
+    parser.add_argument("--learned-l2", type=float, default=1.0, help="L2 penalty of the learned fusion model.")
+    parser.add_argument(
+        "--search",
+        choices=["grid", "halving"],
+        default="grid",
+        help="halving: successive halving on growing row subsamples; only survivors get full CV.",
+    )
+    parser.add_argument(
+        "--halving-eta",
+        type=int,
+        default=3,
+        help="Keep the top 1/eta configs per halving round; row subsample grows by eta.",
+    )
+    parser.add_argument(
+        "--halving-min-fraction",
+        type=float,
+        default=0.11,
+        help="Share of rows in the first halving round.",
+    )
+    parser.add_argument(
+        "--search-verify",
+        action="store_true",
+        help="With --search halving, also run the exhaustive grid and report the objective gap (small grids).",
+    )
+    parser.add_argument(
+        "--threshold-search",
+        choices=["grid", "histogram"],
+        default="grid",
+        help="histogram: tune thresholds from per-fold class histograms (one pass per fold, mergeable).",
+    )
+    parser.add_argument(
+        "--histogram-bins",
+        type=int,
+        default=0,
+        help="Uniform bins on [0,1] for --threshold-search histogram; 0 uses the 0.01..0.99 grid (exact).",
+    )
+    parser.add_argument(
+        "--histogram-verify",
+        action="store_true",
+        help="Also tune the best config over all distinct scores and report the gap to the binned result.",
+    )
+    parser.add_argument(
+        "--prefilter",
+        default="",
+        help=f"Comma list of rules that decide trivial rows before NLI, in order ({', '.join(PREFILTER_RULES)}).",
+    )
+    parser.add_argument(
+        "--prefilter-max-cosine",
+        type=float,
+        default=0.2,
+        help="disjoint rule: max feature embedding cosine (raw, -1..1) for a no-overlap row to be decided negative.",
+    )
+    parser.add_argument(
+        "--near-dup",
+        choices=["off", "rule", "nli", "both"],
+        default="off",
+        help="Corpus-wide near-duplicate reviews (MinHash/LSH): rule = count as copied in the rule flag, "
+        "nli = score each near-duplicate group's reviews once, both = both.",
+    )
+    parser.add_argument(
+        "--near-dup-threshold",
+        type=float,
+        default=0.95,
+        help="Token Jaccard above which two reviews are near-duplicates (verified exactly).",
+    )
+    parser.add_argument("--minhash-perms", type=int, default=128, help="MinHash signature length.")
+    parser.add_argument(
+        "--lsh-bands",
+        type=int,
+        default=16,
+        help="LSH bands (--minhash-perms / bands rows each); more bands = higher recall, more candidates.",
+    )
+    parser.add_argument(
+        "--nli-batch-size",
+        type=int,
+        default=16,
+        help="Premise/hypothesis pairs per NLI forward pass.",
+    )
+    parser.add_argument(
+        "--embedding-batch-size",
+        type=int,
+        default=64,
+        help="Texts per embedding forward pass.",
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Probe batch sizes and CPU thread counts on a sample of real inputs and use the fastest "
+        "(cached per host and model in --autotune-cache).",
+    )
+    parser.add_argument("--autotune-cache", default=str(DEFAULT_AUTOTUNE_CACHE), help="Autotune result cache file.")
+    parser.add_argument("--autotune-refresh", action="store_true", help="Ignore cached autotune results and re-probe.")
+    parser.add_argument("--autotune-batch-sizes", default="4,8,16,32,64", help="Batch sizes tried by --autotune.")
+    parser.add_argument(
+        "--autotune-max-memory-mb",
+        type=int,
+        default=0,
+        help="Skip batch sizes whose probe needs more than this many MB above the loaded model "
+        "(CUDA allocator, or sampled RSS on CPU; 0 = no cap).",
+    )
+    parser.add_argument("--autotune-sample", type=int, default=128, help="Probe sample size (pairs / texts).")
+    parser.add_argument(
+        "--nli-batch-order",
+        choices=["premise", "input"],
+        default="premise",
+        help="premise: group a review's hypotheses into the same batches, sorted by length; input: row order.",
+    )
+    parser.add_argument(
+        "--template-mode",
+        choices=["per_template", "single_pass"],
+        default="per_template",
+        help="single_pass: score all templates' hypotheses in one pass over the data instead of one pass per template.",
+    )
+    parser.add_argument(
+        "--cascade-model",
+        default="",
+        help="Small NLI model for a cascade: it scores all rows, and only its needs_review band is re-scored by --model.",
+    )
+    parser.add_argument(
+        "--cascade-compare-full",
+        action="store_true",
+        help="In cascade mode, also score all rows with --model to report the kappa delta.",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Split NLI scoring into N hash shards. With --shard-index: score that shard only; without: merge all shards.",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=-1,
+        help="Shard to score in worker mode (0..num_shards-1); writes <out-dir>/shards/shard_K_of_N.npz and exits.",
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=0,
+        help="Run N local worker processes (one per shard), then merge and continue.",
+    )
+    parser.add_argument(
+        "--fixed-config",
+        default="",
+        help="Score with the best_config.json of an earlier run instead of searching; NLI runs in chunks "
+        "and uncertain rows are sent to the LLM judge while later chunks are still being scored.",
+    )
+    parser.add_argument(
+        "--pipeline-chunk-rows",
+        type=int,
+        default=256,
+        help="With --fixed-config: rows per NLI chunk handed to triage and the judge.",
+    )
+    parser.add_argument(
+        "--llm-workers",
+        type=int,
+        default=4,
+        help="With --fixed-config: concurrent LLM judge requests.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse stage checkpoints in <out-dir>/checkpoints from an interrupted run with the same input and settings.",
+    )
     parser.add_argument(
         "--out-dir",
         default="",
@@ -926,12 +3363,35 @@ def main() -> None:
     )
     parser.add_argument("--llm-confidence-th", type=float, default=0.70, help="Min confidence to override base pred.")
     parser.add_argument("--llm-votes", type=int, default=1, help="Self-consistency votes per case.")
+    parser.add_argument(
+        "--llm-adaptive-votes",
+        action="store_true",
+        help="Stop voting early once the remaining votes cannot change the majority or the --llm-confidence-th override.",
+    )
+    parser.add_argument(
+        "--llm-vote-stop-confidence",
+        type=float,
+        default=0.0,
+        help="With --llm-adaptive-votes, also stop after >=2 unanimous votes with mean confidence >= this (0 = off).",
+    )
+    parser.add_argument(
+        "--llm-escalate-votes",
+        type=int,
+        default=0,
+        help="If votes are still split after --llm-votes calls, keep voting up to this many calls (0 = off).",
+    )
     parser.add_argument(
         "--llm-uncertainty-band",
         type=float,
         default=0.05,
         help="Only apply LLM when |final_score - tuned_threshold| <= band.",
     )
+    parser.add_argument(
+        "--llm-pack-size",
+        type=int,
+        default=1,
+        help="Judge up to K rows per request (one JSON array answer); missing or invalid items are re-requested alone.",
+    )
     parser.add_argument(
         "--llm-require-unanimous",
         action="store_true",
@@ -970,29 +3430,104 @@ def main() -> None:
     )
     args = parser.parse_args()
     apply_llm_mode_presets(args)
+    fixed: Optional[Dict] = None
+    if args.fixed_config:
+        fixed = load_fixed_config(args.fixed_config, args)
+        if args.num_shards > 1 or args.shard_workers > 0:
+            raise ValueError("--fixed-config scores in one process; it cannot be combined with sharding.")
+        if args.resume:
+            raise ValueError("--fixed-config runs keep no checkpoints; --resume only applies to tuning runs.")
+        print(
+            f"Fixed config from {args.fixed_config}: model={args.model} template={fixed['template']} "
+            f"fusion={fixed['fusion']} threshold={fixed['tuned_th']:.2f} "
+            f"triage low={fixed['triage_low']:.2f} high={fixed['triage_high']:.2f}"
+        )
+    if args.fusion == "learned" and (args.search != "grid" or args.cascade_model):
+        raise ValueError("--fusion learned replaces the grid search; it cannot be combined with --search halving or --cascade-model.")
     out_dir = Path(args.out_dir) if args.out_dir else Path(model_result_dir_name(args.model))
+    if fixed is not None:
+        # Keep a tuning run's outputs and checkpoints intact when scoring into the same directory.
+        out_dir = out_dir / "fixed"
     out_dir.mkdir(parents=True, exist_ok=True)
     out_cfg = out_dir / Path(args.out_config).name
     out_rows = out_dir / Path(args.out_rows).name
     out_triage = out_dir / Path(args.out_triage).name
 
-    df = pd.read_csv(args.csv)
-    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    df = read_table(args.csv)
+    # Fixed-config runs also score unlabelled input; labels are then -1 and no metrics are reported.
+    required = REQUIRED_COLUMNS if fixed is None else [COL_F1, COL_R1, COL_F2, COL_R2]
+    missing = [c for c in required if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
-    eval_df, y = resolve_target_labels(df, args.target_label)
+    if fixed is not None and not {COL_FIAZ, COL_NAVEEN}.issubset(df.columns):
+        eval_df, y = df.reset_index(drop=True), np.full(len(df), -1)
+    else:
+        eval_df, y = resolve_target_labels(df, args.target_label)
+    del df
+    # Text is interned up front; full strings are only materialized again when writing outputs.
+    eval_df = intern_text_columns(eval_df, [COL_F1, COL_R1, COL_F2, COL_R2])
     folds = stratified_kfold_indices(y, args.cv_folds, args.seed)
 
+    review_canon: Optional[Dict[str, str]] = None
+    # Frame used for NLI premises; with --near-dup nli/both each near-duplicate group is scored
+    # through its canonical review, so duplicate premise/hypothesis pairs are scored once.
+    nli_df = eval_df
+    if args.near_dup != "off":
+        review_canon = review_near_duplicates(eval_df, args)
+        if args.near_dup in {"nli", "both"}:
+            nli_df = eval_df.copy()
+            for col in [COL_R1, COL_R2]:
+                nli_df[col] = eval_df[col].astype(str).map(review_canon).astype("category")
+            before = len(set(map_unique(eval_df[COL_R1], str)) | set(map_unique(eval_df[COL_R2], str)))
+            after = len(set(map_unique(nli_df[COL_R1], str)) | set(map_unique(nli_df[COL_R2], str)))
+            print(f"NLI premises: {before} unique reviews -> {after} after merging near-duplicates")
+
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Loading model: {args.model} on device={device}")
-    tokenizer = AutoTokenizer.from_pretrained(args.model)
-    model = AutoModelForSequenceClassification.from_pretrained(args.model).to(device)
-    model.eval()
-    entail_idx, contra_idx = find_label_indices(model)
+    # In cascade mode the sweep runs on the small model; --model is only used for needs_review rows.
+    sweep_model = args.cascade_model or args.model
+    if args.shard_workers > 0:
+        args.num_shards = args.shard_workers
+    if args.num_shards > 1 and args.shard_index >= 0:
+        run_shard_worker(nli_df, args, sweep_model, device, out_dir)
+        return
+
+    merged_probs: Dict[str, np.ndarray] = {}
+    token_cache: Optional[TokenCache] = None
+    if args.num_shards > 1:
+        if args.shard_workers > 0:
+            print(f"Scoring {args.num_shards} shards with local workers (logs in {out_dir / 'shards'})")
+            spawn_shard_workers(args.num_shards, out_dir)
+        merged_probs = merge_shards(
+            out_dir,
+            args.num_shards,
+            len(eval_df),
+            list(select_named_variants(get_templates(), args.templates, "templates")),
+            args_fingerprint(args, SHARD_FINGERPRINT_ARGS, args.csv),
+        )
+        print(f"Merged NLI probabilities from {args.num_shards} shards")
+        entail_idx, contra_idx = find_label_indices(AutoConfig.from_pretrained(sweep_model))
+    else:
+        tokenizer, model, entail_idx, contra_idx = load_nli_model(sweep_model, device)
+        token_cache = TokenCache(tokenizer)
+        apply_nli_autotune(nli_df, sweep_model, token_cache, model, device, args)
+
+    checkpoint: Optional[RunCheckpoint] = None
+    if fixed is None:
+        checkpoint = RunCheckpoint(
+            out_dir / "checkpoints",
+            args_fingerprint(args, SWEEP_FINGERPRINT_ARGS, args.csv),
+            args_fingerprint(args, LLM_FINGERPRINT_ARGS),
+            args.resume,
+        )
 
-    use_cosine = args.similarity_method in {"cosine", "blend"}
+    prefilter = parse_prefilter_rules(args.prefilter)
+    use_cosine = args.similarity_method in {"cosine", "blend"} or "disjoint" in prefilter
     emb_map: Dict[str, np.ndarray] = {}
-    if use_cosine:
+    saved_emb = checkpoint.load_embeddings() if use_cosine and checkpoint is not None else None
+    if saved_emb is not None:
+        print(f"Resumed {len(saved_emb)} embeddings from checkpoint")
+        emb_map = saved_emb
+    elif use_cosine:
         print(f"Loading embedding model: {args.embedding_model} on device={device}")
         emb_tok = AutoTokenizer.from_pretrained(args.embedding_model)
         emb_model = AutoModel.from_pretrained(args.embedding_model).to(device)
@@ -1003,7 +3538,12 @@ def main() -> None:
             all_texts.append(str(r[COL_F2]))
             all_texts.append(str(r[COL_R1]))
             all_texts.append(str(r[COL_R2]))
-        emb_map = build_embeddings(all_texts, emb_tok, emb_model, device=device)
+        if args.autotune:
+            best = autotune_embeddings(all_texts, emb_tok, emb_model, args.embedding_model, device, args)
+            args.embedding_batch_size = int(best["batch_size"])
+        emb_map = build_embeddings(all_texts, emb_tok, emb_model, device=device, batch_size=args.embedding_batch_size)
+        if checkpoint is not None:
+            checkpoint.save_embeddings(emb_map)
 
     all_templates = get_templates()
     all_aggs = get_aggregators()
@@ -1020,226 +3560,295 @@ def main() -> None:
         raise ValueError("No valid values parsed from --rule-penalties.")
     threshold_grid = np.linspace(0.01, 0.99, 99)
 
-    config_rows = []
-    best_cfg: Optional[Config] = None
-    best_final_obj = -1e9
-    best_score_vector = None
-    best_aux = {}
+    config_rows: List[Dict] = []
 
-    for tmpl_name, tmpl in templates.items():
+    sim = similarity_features(
+        eval_df,
+        emb_map,
+        args.similarity_method,
+        args.similarity_beta,
+        review_canon if args.near_dup in {"rule", "both"} else None,
+    )
+    lex = sim["lex"]
+    rule = sim["rule"]
+
+    decided: Optional[np.ndarray] = None
+    prefilter_rule: Optional[np.ndarray] = None
+    todo = np.arange(len(eval_df))
+    if prefilter:
+        decided, prefilter_rule = prefilter_decisions(
+            eval_df[COL_F1], eval_df[COL_F2], prefilter, emb_map, args.prefilter_max_cosine
+        )
+        todo = np.where(np.isnan(decided))[0]
+        print("Prefilter:")
+        for line in prefilter_report(decided, prefilter_rule, y):
+            print(line)
+        if merged_probs:
+            print("  (shard workers scored every row; prefiltered rows are only pinned)")
+
+    if fixed is not None:
+        row_df = run_fixed_config_pipeline(
+            eval_df,
+            nli_df,
+            y,
+            sim,
+            fixed,
+            args,
+            token_cache,
+            model,
+            device,
+            entail_idx,
+            contra_idx,
+            decided,
+            prefilter_rule,
+        )
+        out_rows, out_triage = write_row_outputs(row_df, out_rows, out_triage, args.output_format)
+        if (y >= 0).all():
+            m_base = metrics(y, row_df["pred"].to_numpy().astype(int))
+            m_final = metrics(y, row_df["pred_final"].to_numpy().astype(int))
+            print(f"Fixed config kappa: {m_base['kappa']:.4f} (after LLM judge: {m_final['kappa']:.4f})")
+        print(f"Saved row scores: {out_rows}")
+        print(f"Saved triage labels: {out_triage}")
+        return
+
+    sweep_nli_sec = 0.0
+    nli_stats: Dict[str, float] = {}
+    template_probs: Dict[str, np.ndarray] = dict(merged_probs)
+    for name, probs in merged_probs.items():
+        checkpoint.save_array(f"nli_{name}", probs)
+    for tmpl_name in templates:
+        if tmpl_name in template_probs:
+            continue
+        saved = checkpoint.load_array(f"nli_{tmpl_name}") if args.resume else None
+        if saved is not None:
+            template_probs[tmpl_name] = saved
+    if template_probs and not merged_probs:
+        print(f"Resumed NLI probabilities for templates: {', '.join(template_probs)}")
+    pending = [name for name in templates if name not in template_probs]
+
+    def score_rows(names: List[str], rows: np.ndarray) -> np.ndarray:
+        nonlocal sweep_nli_sec
+        t0 = time.perf_counter()
+        probs = score_templates_nli(
+            nli_df.iloc[rows],
+            [templates[name] for name in names],
+            token_cache,
+            model,
+            device,
+            args.nli_batch_size,
+            args.nli_batch_order,
+            nli_stats,
+        )
+        sweep_nli_sec += time.perf_counter() - t0
+        return probs
+
+    if args.search == "halving":
+        print(f"Successive halving (eta={args.halving_eta}, first round on {args.halving_min_fraction:.0%} of rows)")
+        loaded = set(template_probs)
+        config_rows, halving_stats = halving_search(
+            list(templates),
+            template_probs,
+            score_rows,
+            lex,
+            rule,
+            y,
+            folds,
+            aggs,
+            alphas,
+            contra_thresholds,
+            rule_penalties,
+            threshold_grid,
+            entail_idx,
+            contra_idx,
+            args,
+            decided,
+            todo,
+        )
+        for name in halving_stats["complete_templates"]:
+            if name not in loaded:
+                checkpoint.save_array(f"nli_{name}", template_probs[name])
+        print(
+            f"Halving search: {halving_stats['full_cv']} of {halving_stats['configs']} configs reached full CV; "
+            f"config x row evaluations {halving_stats['cost_fraction']:.1%} of exhaustive; "
+            f"NLI rows x templates scored {halving_stats['nli_scored']} of {halving_stats['nli_exhaustive']}"
+        )
+    if args.search == "grid" and args.template_mode == "single_pass" and pending:
+        # Every template's hypotheses go through the same batches; templates become a tensor axis.
+        t0 = time.perf_counter()
+        probs = scatter_rows(
+            score_templates_nli(
+                nli_df.iloc[todo],
+                [templates[name] for name in pending],
+                token_cache,
+                model,
+                device,
+                args.nli_batch_size,
+                args.nli_batch_order,
+                nli_stats,
+            ),
+            todo,
+            len(eval_df),
+        )
+        sweep_nli_sec += time.perf_counter() - t0
+        print(f"Scored {len(pending)} templates in one pass: probability tensor {probs.shape}")
+        for t_idx, name in enumerate(pending):
+            template_probs[name] = probs[:, t_idx]
+            checkpoint.save_array(f"nli_{name}", template_probs[name])
+    for tmpl_name, tmpl in (templates if args.search == "grid" else {}).items():
         print(f"Template: {tmpl_name}")
-        e12 = []
-        e21 = []
-        c12 = []
-        c21 = []
-        lex = []
-        lex_j = []
-        lex_c = []
-        rule = []
-        for _, r in eval_df.iterrows():
-            f1 = normalize_feature_text(r[COL_F1])
-            f2 = normalize_feature_text(r[COL_F2])
-            h1 = tmpl.format(feature=f1)
-            h2 = tmpl.format(feature=f2)
-            r1 = str(r[COL_R1])
-            r2 = str(r[COL_R2])
-
-            p12 = nli_probs(r1, h2, tokenizer, model, device)
-            p21 = nli_probs(r2, h1, tokenizer, model, device)
-            e12.append(float(p12[entail_idx]))
-            e21.append(float(p21[entail_idx]))
-            c12.append(float(p12[contra_idx]))
-            c21.append(float(p21[contra_idx]))
-
-            sim_feat_j = jaccard(f1, f2)
-            sim_rev_j = jaccard(r1, r2)
-            jscore = 0.5 * sim_feat_j + 0.5 * sim_rev_j
-
-            cscore = 0.0
-            if use_cosine:
-                ef1 = emb_map.get(str(r[COL_F1]))
-                ef2 = emb_map.get(str(r[COL_F2]))
-                er1 = emb_map.get(str(r[COL_R1]))
-                er2 = emb_map.get(str(r[COL_R2]))
-                sim_feat_c = cosine01(ef1, ef2) if ef1 is not None and ef2 is not None else 0.0
-                sim_rev_c = cosine01(er1, er2) if er1 is not None and er2 is not None else 0.0
-                cscore = 0.5 * sim_feat_c + 0.5 * sim_rev_c
-
-            if args.similarity_method == "jaccard":
-                lscore = jscore
-            elif args.similarity_method == "cosine":
-                lscore = cscore
-            else:
-                beta = max(0.0, min(1.0, args.similarity_beta))
-                lscore = beta * cscore + (1.0 - beta) * jscore
-
-            lex.append(lscore)
-            lex_j.append(jscore)
-            lex_c.append(cscore)
-
-            # Rule: copied/nearly identical reviews but low feature overlap tends to be false positive.
-            copied_review_feature_divergence = 1.0 if (sim_rev_j > 0.95 and sim_feat_j < 0.50) else 0.0
-            rule.append(copied_review_feature_divergence)
-
-        e12 = np.array(e12)
-        e21 = np.array(e21)
-        c12 = np.array(c12)
-        c21 = np.array(c21)
-        lex = np.array(lex)
-        lex_j = np.array(lex_j)
-        lex_c = np.array(lex_c)
-        rule = np.array(rule)
-
-        for agg_name, agg_fn in aggs.items():
-            print(f"  Aggregator: {agg_name}")
-            if args.nli_score_mode == "contra_norm":
-                d12 = normalize_entail_with_contradiction(e12, c12)
-                d21 = normalize_entail_with_contradiction(e21, c21)
-            else:
-                d12 = e12
-                d21 = e21
-            nli_score = agg_fn(d12, d21)
-            contradiction = np.maximum(c12, c21)
-            for alpha in alphas:
-                blended = alpha * nli_score + (1.0 - alpha) * lex
-                for ct in contra_thresholds:
-                    guarded = blended.copy()
-                    guarded[contradiction >= ct] = 0.0
-                    for penalty in rule_penalties:
-                        final_score = guarded * (1.0 - penalty * rule)
-                        tuned_th, cv_m = tune_threshold_cv(y, final_score, folds, args.objective, threshold_grid)
-                        pred = (final_score >= tuned_th).astype(int)
-                        full_m = metrics(y, pred)
-                        obj = objective_value(full_m, args.objective)
-                        config_rows.append(
-                            {
-                                "template": tmpl_name,
-                                "aggregator": agg_name,
-                                "alpha": alpha,
-                                "contradiction_th": ct,
-                                "rule_penalty": penalty,
-                                "tuned_th": tuned_th,
-                                "cv_acc": cv_m["acc"],
-                                "cv_f1": cv_m["f1"],
-                                "cv_kappa": cv_m["kappa"],
-                                "cv_balanced_acc": cv_m["balanced_acc"],
-                                "full_acc": full_m["acc"],
-                                "full_f1": full_m["f1"],
-                                "full_kappa": full_m["kappa"],
-                                "full_balanced_acc": full_m["balanced_acc"],
-                            }
-                        )
-                        if best_cfg is None or (obj, full_m["f1"], full_m["acc"]) > (
-                            best_final_obj,
-                            best_aux.get("best_f1", -1e9),
-                            best_aux.get("best_acc", -1e9),
-                        ):
-                            best_final_obj = obj
-                            best_cfg = Config(
-                                template=tmpl_name,
-                                aggregator=agg_name,
-                                alpha=alpha,
-                                contradiction_th=ct,
-                                rule_penalty=penalty,
-                                tuned_th=tuned_th,
-                                cv_acc=cv_m["acc"],
-                                cv_f1=cv_m["f1"],
-                                cv_kappa=cv_m["kappa"],
-                                cv_balanced_acc=cv_m["balanced_acc"],
-                            )
-                            best_score_vector = final_score.copy()
-                            best_aux = {
-                                "e12": e12.copy(),
-                                "e21": e21.copy(),
-                                "c12": c12.copy(),
-                                "c21": c21.copy(),
-                                "lex": lex.copy(),
-                                "lex_jaccard": lex_j.copy(),
-                                "lex_cosine": lex_c.copy(),
-                                "rule": rule.copy(),
-                                "nli_score": nli_score.copy(),
-                                "contradiction": contradiction.copy(),
-                                "best_f1": full_m["f1"],
-                                "best_acc": full_m["acc"],
-                            }
+        if tmpl_name not in template_probs:
+            t0 = time.perf_counter()
+            template_probs[tmpl_name] = scatter_rows(
+                score_templates_nli(
+                    nli_df.iloc[todo],
+                    [tmpl],
+                    token_cache,
+                    model,
+                    device,
+                    args.nli_batch_size,
+                    args.nli_batch_order,
+                    nli_stats,
+                ),
+                todo,
+                len(eval_df),
+            )[:, 0]
+            sweep_nli_sec += time.perf_counter() - t0
+            checkpoint.save_array(f"nli_{tmpl_name}", template_probs[tmpl_name])
+        nli = template_nli(template_probs[tmpl_name], entail_idx, contra_idx)
+
+        rows = checkpoint.load_json(f"search_{tmpl_name}") if args.resume else None
+        if rows is None and args.fusion == "learned":
+            rows = [learned_fusion_row(tmpl_name, nli, sim, y, folds, threshold_grid, args, decided)]
+            checkpoint.save_json(f"search_{tmpl_name}", rows)
+        elif rows is None:
+            rows = search_template_grid(
+                tmpl_name,
+                nli,
+                lex,
+                rule,
+                y,
+                folds,
+                aggs,
+                alphas,
+                contra_thresholds,
+                rule_penalties,
+                threshold_grid,
+                args,
+                decided,
+            )
+            checkpoint.save_json(f"search_{tmpl_name}", rows)
+        else:
+            print(f"  Resumed {len(rows)} config search rows from checkpoint")
+        config_rows.extend(rows)
+
+    best_idx = best_config_index(config_rows, args.objective)
+    if args.search == "halving" and args.search_verify:
+        report_halving_gap(
+            config_rows[best_idx],
+            templates,
+            template_probs,
+            halving_stats["complete_templates"],
+            score_rows,
+            todo,
+            lex,
+            rule,
+            y,
+            folds,
+            aggs,
+            alphas,
+            contra_thresholds,
+            rule_penalties,
+            threshold_grid,
+            entail_idx,
+            contra_idx,
+            args,
+            decided,
+        )
 
+    # Only the winning grid index is tracked during the search; its vectors are rebuilt once here
+    # from the float32 probability store.
+    best_cfg = Config(**{k: config_rows[best_idx][k] for k in Config.__dataclass_fields__})
+    best_nli = template_nli(template_probs[best_cfg.template], entail_idx, contra_idx)
+    d12, d21 = directional_nli_scores(best_nli, args.nli_score_mode)
+    best_contradiction = np.maximum(best_nli["c12"], best_nli["c21"])
+    if args.fusion == "learned":
+        # The learned model has no aggregator; nli_score reports the mean of the two directions.
+        best_nli_score = get_aggregators()["mean"](d12, d21)
+        features = fusion_features(best_nli, sim)
+        best_score_vector = learned_fusion_scores(features, y, folds, args.learned_l2, decided)
+        learned_path = out_dir / "learned_fusion.json"
+        train = np.ones(len(y), dtype=bool) if decided is None else np.isnan(decided)
+        save_learned_fusion(learned_path, best_cfg.template, features, y, args.learned_l2, train)
+        print(f"Saved learned fusion model (fitted on all rows): {learned_path}")
+    else:
+        best_nli_score = aggs[best_cfg.aggregator](d12, d21)
+        best_score_vector = apply_prefilter(
+            fuse_scores(
+                best_nli_score,
+                lex,
+                best_contradiction,
+                rule,
+                best_cfg.alpha,
+                best_cfg.contradiction_th,
+                best_cfg.rule_penalty,
+            ),
+            decided,
+        )
+
+    if args.threshold_search == "histogram":
+        report_histogram_search(y, best_score_vector, folds, best_cfg, args, threshold_grid)
+    if token_cache is not None and token_cache.lookups:
+        print(
+            f"Token cache: {len(token_cache.ids)} unique texts tokenized for "
+            f"{token_cache.lookups} premise/hypothesis lookups"
+        )
+    if nli_stats:
+        print(
+            f"NLI batching (size={args.nli_batch_size}, order={args.nli_batch_order}): "
+            f"{nli_batch_summary(nli_stats)}"
+        )
     cfg_df = pd.DataFrame(config_rows).sort_values(
         ["full_kappa", "full_f1", "full_acc", "cv_kappa"], ascending=False
     )
-    cfg_df.to_csv(out_cfg, index=False)
+    out_cfg = write_table(cfg_df, out_cfg, args.output_format)
 
-    assert best_cfg is not None and best_score_vector is not None
     best_pred = (best_score_vector >= best_cfg.tuned_th).astype(int)
     best_m = metrics(y, best_pred)
     low_th, high_th = find_triage_thresholds(y, best_score_vector, args.min_pos_precision, args.min_neg_precision)
 
-    row_df = eval_df.copy()
-    if COL_FIAZ in row_df.columns:
-        row_df[COL_FIAZ] = safe_int_series(row_df[COL_FIAZ])
-    if COL_NAVEEN in row_df.columns:
-        row_df[COL_NAVEEN] = safe_int_series(row_df[COL_NAVEEN])
-    row_df["target_label"] = y
-    row_df["e12"] = best_aux["e12"]
-    row_df["e21"] = best_aux["e21"]
-    row_df["c12"] = best_aux["c12"]
-    row_df["c21"] = best_aux["c21"]
-    row_df["nli_score"] = best_aux["nli_score"]
-    row_df["lex_score"] = best_aux["lex"]
-    row_df["lex_jaccard"] = best_aux["lex_jaccard"]
-    row_df["lex_cosine"] = best_aux["lex_cosine"]
-    row_df["contradiction"] = best_aux["contradiction"]
-    row_df["rule_flag"] = best_aux["rule"]
-    row_df["final_score"] = best_score_vector
-    row_df["pred"] = best_pred
-    row_df["pred"] = safe_int_series(row_df["pred"])
-    row_df["target_label"] = safe_int_series(row_df["target_label"])
-    row_df["rule_flag"] = safe_int_series(row_df["rule_flag"])
-
-    triage = np.where(
-        best_score_vector >= high_th,
-        "auto_positive",
-        np.where(best_score_vector <= low_th, "auto_negative", "needs_review"),
+    best_config_path = out_dir / "best_config.json"
+    save_best_config(best_config_path, best_cfg, low_th, high_th, sweep_model, args)
+
+    row_df = build_row_scores(
+        eval_df,
+        y,
+        best_nli,
+        best_nli_score,
+        sim,
+        best_score_vector,
+        best_cfg.tuned_th,
+        low_th,
+        high_th,
+        decided,
+        prefilter_rule,
     )
-    row_df["triage_label"] = triage
 
-    row_df["llm_label"] = np.nan
-    row_df["llm_confidence"] = np.nan
-    row_df["llm_rationale"] = ""
-    row_df["pred_final"] = row_df["pred"].copy()
-    row_df["llm_override"] = 0
+    decision_th: object = best_cfg.tuned_th
+    if args.cascade_model:
+        row_df, decision_th = run_cascade_stage(row_df, nli_df, y, sim, best_cfg, args, device, sweep_nli_sec)
 
     if args.llm_judge:
-        row_df = run_llm_judge_stage(row_df, args, best_cfg.tuned_th)
+        row_df = run_llm_judge_stage(row_df, args, decision_th, checkpoint)
 
-    row_df["pred_final"] = safe_int_series(row_df["pred_final"])
-    row_df["llm_override"] = safe_int_series(row_df["llm_override"])
-    row_df["match"] = (row_df["pred_final"] == row_df["target_label"]).astype(int)
-    row_df.to_csv(out_rows, index=False)
-
-    triage_df = row_df[
-        [
-            COL_F1,
-            COL_R1,
-            COL_F2,
-            COL_R2,
-            "target_label",
-            "final_score",
-            "pred",
-            "pred_final",
-            "llm_label",
-            "llm_confidence",
-            ]
-    ].copy()
-    triage_df["triage_label"] = row_df["triage_label"]
-    triage_df.to_csv(out_triage, index=False)
+    out_rows, out_triage = write_row_outputs(row_df, out_rows, out_triage, args.output_format)
 
     # Per-run ablation table (markdown + csv) 
-    nli_only = best_aux["nli_score"]
-    sim_only = best_aux["lex"]
+    nli_only = best_nli_score
+    sim_only = lex
     combined = best_cfg.alpha * nli_only + (1.0 - best_cfg.alpha) * sim_only
     guarded = combined.copy()
-    guarded[np.array(best_aux["contradiction"]) >= best_cfg.contradiction_th] = 0.0
-    final_sc = guarded * (1.0 - best_cfg.rule_penalty * np.array(best_aux["rule"]))
+    guarded[best_contradiction >= best_cfg.contradiction_th] = 0.0
+    final_sc = guarded * (1.0 - best_cfg.rule_penalty * rule)
 
     variants = [
         ("NLI only", nli_only),
@@ -1248,6 +3857,10 @@ def main() -> None:
         (f"+ Contradiction guard (tau_c={best_cfg.contradiction_th:.2f})", guarded),
         (f"+ Rule penalty (lambda={best_cfg.rule_penalty:.2f}) [Final]", final_sc),
     ]
+    if args.fusion == "learned":
+        variants = variants[:2] + [("Learned fusion (logistic, out-of-fold) [Final]", best_score_vector)]
+    # Prefiltered rows are decided the same way in every variant.
+    variants = [(name, apply_prefilter(sc, decided)) for name, sc in variants]
 
     ablation_rows = []
     for i, (name, sc) in enumerate(variants, start=1):
@@ -1268,6 +3881,24 @@ def main() -> None:
             }
         )
 
+    if args.cascade_model:
+        m_cas = metrics(y, row_df["pred"].to_numpy().astype(int))
+        ablation_rows.append(
+            {
+                "#": len(ablation_rows) + 1,
+                "Model": f"+ Cascade ({args.model} on needs_review)",
+                "Best th": np.nan,
+                "Acc": m_cas["acc"],
+                "F1": m_cas["f1"],
+                "Kappa": m_cas["kappa"],
+                "BalAcc": m_cas["balanced_acc"],
+                "TP": int(m_cas["tp"]),
+                "TN": int(m_cas["tn"]),
+                "FP": int(m_cas["fp"]),
+                "FN": int(m_cas["fn"]),
+            }
+        )
+
     # If LLM judge is enabled, add final post-LLM row (no threshold search here).
     if args.llm_judge:
         m_llm = metrics(y, row_df["pred_final"].to_numpy().astype(int))
@@ -1315,6 +3946,7 @@ def main() -> None:
     )
     print(f"Triage thresholds: low={low_th:.2f} high={high_th:.2f}")
     print(f"Saved config search: {out_cfg}")
+    print(f"Saved best config (for --fixed-config): {best_config_path}")
     print(f"Saved row scores: {out_rows}")
     print(f"Saved triage labels: {out_triage}")
 
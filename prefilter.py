@@ -0,0 +1,139 @@
+"""Cheap prefilter rules and feature embeddings shared by nli_enhanced_eval.py and score_demo.py.
+
+Kept free of the evaluation pipeline so the demo scripts can decide trivial rows with exactly the
+same rules without importing it.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+
+PREFILTER_RULES = ["same_feature", "disjoint"]
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+
+def cosine01(a: np.ndarray, b: np.ndarray) -> float:
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    if denom == 0.0:
+        return 0.0
+    cos = float(np.dot(a, b) / denom)
+    # Map cosine [-1,1] -> [0,1] for easy fusion with probability-like scores.
+    return max(0.0, min(1.0, 0.5 * (cos + 1.0)))
+
+
+def normalize_feature_text(text: str) -> str:
+    t = str(text).strip().strip('"').strip()
+    return t.rstrip(".!? ")
+
+
+def map_unique(values: pd.Series, fn: Callable) -> List:
+    """Apply `fn` once per distinct value and expand back to rows (text columns repeat heavily)."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = [fn(v) for v in uniques]
+    return [mapped[c] for c in codes]
+
+
+def mean_pooling(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    mask = attention_mask.unsqueeze(-1).expand(last_hidden_state.size()).float()
+    summed = torch.sum(last_hidden_state * mask, dim=1)
+    counts = torch.clamp(mask.sum(dim=1), min=1e-9)
+    return summed / counts
+
+
+def build_embeddings(
+    texts: List[str],
+    tokenizer,
+    model,
+    device: str,
+    batch_size: int = 64,
+) -> Dict[str, np.ndarray]:
+    uniq = list(dict.fromkeys(texts))
+    out: Dict[str, np.ndarray] = {}
+    for i in range(0, len(uniq), batch_size):
+        batch = uniq[i : i + batch_size]
+        enc = tokenizer(batch, padding=True, truncation=True, max_length=256, return_tensors="pt")
+        enc = {k: v.to(device) for k, v in enc.items()}
+        with torch.no_grad():
+            model_out = model(**enc)
+            emb = mean_pooling(model_out.last_hidden_state, enc["attention_mask"])
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+            emb_np = emb.detach().cpu().numpy()
+        for t, v in zip(batch, emb_np):
+            out[t] = v
+    return out
+
+
+def feature_stems(text: str, stem: Callable[[str], str]) -> frozenset:
+    """Stemmed token set of a normalized feature ("loaded" and "loading" both give {"load"})."""
+    return frozenset(stem(t) for t in tokenize(normalize_feature_text(text)))
+
+
+def parse_prefilter_rules(raw: str) -> List[str]:
+    rules = [r.strip() for r in raw.split(",") if r.strip()]
+    unknown = [r for r in rules if r not in PREFILTER_RULES]
+    if unknown:
+        raise ValueError(f"Unknown --prefilter rules {unknown}. Available: {PREFILTER_RULES}")
+    return rules
+
+
+def prefilter_decisions(
+    feat1: pd.Series,
+    feat2: pd.Series,
+    rules: List[str],
+    emb_map: Dict[str, np.ndarray],
+    max_cosine: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Rows the cheap rules are confident about, decided before any NLI call.
+
+    Returns the decided label per row (NaN = left for the models) and the deciding rule name
+    ("" when undecided). Rules run in the given order; the first one that fires wins.
+      same_feature: both features have the same stemmed token set -> match.
+      disjoint: no shared stemmed feature token and feature embedding cosine <= max_cosine -> no match.
+    """
+    n = len(feat1)
+    decided = np.full(n, np.nan)
+    rule_name = np.full(n, "", dtype=object)
+    from nltk.stem import PorterStemmer
+
+    stem = PorterStemmer().stem
+    s1 = map_unique(feat1, lambda t: feature_stems(t, stem))
+    s2 = map_unique(feat2, lambda t: feature_stems(t, stem))
+    for rule in rules:
+        if rule == "same_feature":
+            fired = np.array([bool(a) and a == b for a, b in zip(s1, s2)])
+            label = 1.0
+        else:
+            f1 = map_unique(feat1, str)
+            f2 = map_unique(feat2, str)
+            # cosine01 maps [-1, 1] to [0, 1]; compare on the raw cosine scale.
+            cos = np.array([2.0 * cosine01(emb_map[a], emb_map[b]) - 1.0 for a, b in zip(f1, f2)])
+            fired = np.array([not (a & b) for a, b in zip(s1, s2)]) & (cos <= max_cosine)
+            label = 0.0
+        fired &= np.isnan(decided)
+        decided[fired] = label
+        rule_name[fired] = rule
+    return decided, rule_name
+
+
+def prefilter_report(decided: np.ndarray, rule_name: np.ndarray, y: Optional[np.ndarray]) -> List[str]:
+    """One line per rule: rows decided and, where `y` has labels (-1 = unlabelled), the rule's precision."""
+    lines = []
+    for rule in PREFILTER_RULES:
+        hit = rule_name == rule
+        if not hit.any():
+            continue
+        label = int(decided[hit][0])
+        line = f"  {rule}: {int(hit.sum())} rows -> {'match' if label else 'no match'}"
+        known = hit & (y >= 0) if y is not None else np.zeros_like(hit)
+        if known.any():
+            line += f" (precision {float((y[known] == label).mean()):.4f} on {int(known.sum())} labelled)"
+        lines.append(line)
+    todo = int(np.isnan(decided).sum())
+    lines.append(f"  models run on {todo} of {len(decided)} rows")
+    return lines
@@ -2,9 +2,12 @@
 # pip install transformers torch pandas
 
 import argparse
+import numpy as np
 import pandas as pd
 import torch
-from transformers import pipeline
+from transformers import AutoModel, AutoTokenizer, pipeline
+
+from prefilter import build_embeddings, parse_prefilter_rules, prefilter_decisions, prefilter_report
 
 def entail_prob(nli, premise: str, hypothesis: str) -> float:
     out = nli(f"{premise} </s></s> {hypothesis}")[0]
@@ -23,7 +26,17 @@ def main():
     ap.add_argument("--out", required=True, help="Output CSV path")
     ap.add_argument("--th", type=float, required=True, help="Threshold")
     ap.add_argument("--model", default="roberta-large-mnli", help="NLI model name")
+    ap.add_argument("--lazy-min", action="store_true",
+                    help="Score Review2 => Feature1 only when Review1 => Feature2 already clears --th "
+                         "(same preds; skipped rows keep the first-direction score)")
+    ap.add_argument("--prefilter", default="",
+                    help="Comma list of rules that decide trivial rows without NLI (same_feature, disjoint)")
+    ap.add_argument("--prefilter-max-cosine", type=float, default=0.2,
+                    help="disjoint rule: max feature embedding cosine for a no-overlap row to be a negative")
+    ap.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2",
+                    help="Embedding model for the disjoint rule")
     args = ap.parse_args()
+    prefilter = parse_prefilter_rules(args.prefilter)
 
     # AUTO device: GPU if available else CPU
     device = 0 if torch.cuda.is_available() else -1
@@ -31,24 +44,71 @@ def main():
 
     df = pd.read_csv(args.csv)
 
-    scores = []
-    preds = []
-
-    for _, row in df.iterrows():
+    def texts(row):
         r1 = "" if pd.isna(row.get("Review 1")) else str(row.get("Review 1"))
         r2 = "" if pd.isna(row.get("Review 2")) else str(row.get("Review 2"))
         f1 = "" if pd.isna(row.get("APP Features 1")) else str(row.get("APP Features 1"))
         f2 = "" if pd.isna(row.get("App Features 2")) else str(row.get("App Features 2"))
+        return r1, f1, r2, f2
+
+    rows = [texts(row) for _, row in df.iterrows()]
 
-        s12 = entail_prob(nli, r1, H(f2))   # Review1 supports Feature2
-        s21 = entail_prob(nli, r2, H(f1))   # Review2 supports Feature1
-        score = min(s12, s21)
+    # Phase 0: cheap rules decide trivial rows; they never reach NLI.
+    decided = np.full(len(rows), np.nan)
+    if prefilter:
+        feats = pd.DataFrame({"APP Features 1": [r[1] for r in rows], "App Features 2": [r[3] for r in rows]})
+        emb_map = {}
+        if "disjoint" in prefilter:
+            dev = "cuda" if torch.cuda.is_available() else "cpu"
+            emb_tok = AutoTokenizer.from_pretrained(args.embedding_model)
+            emb_model = AutoModel.from_pretrained(args.embedding_model).to(dev).eval()
+            emb_map = build_embeddings(feats.stack().tolist(), emb_tok, emb_model, device=dev)
+        decided, rule_name = prefilter_decisions(
+            feats["APP Features 1"], feats["App Features 2"], prefilter, emb_map, args.prefilter_max_cosine
+        )
+        y = None
+        if "Fiaz" in df.columns and "Naveen" in df.columns:
+            # consensus rows only; -1 leaves a row out of the precision counts
+            fiaz = pd.to_numeric(df["Fiaz"], errors="coerce").fillna(0).astype(int).to_numpy()
+            naveen = pd.to_numeric(df["Naveen"], errors="coerce").fillna(0).astype(int).to_numpy()
+            y = np.where(fiaz == naveen, fiaz, -1)
+        print("Prefilter:")
+        for line in prefilter_report(decided, rule_name, y):
+            print(line)
+    todo = np.isnan(decided)
+
+    # Phase 1: Review1 supports Feature2, for every undecided row
+    s12 = [entail_prob(nli, r1, H(f2)) if t else d for (r1, _, _, f2), t, d in zip(rows, todo, decided)]
+
+    # Phase 2: Review2 supports Feature1. With min, a row whose s12 is already below
+    # the threshold is a negative whatever s21 is, so --lazy-min skips it.
+    scores = []
+    preds = []
+    skipped = []
+    for (_, f1, r2, _), a, t in zip(rows, s12, todo):
+        if not t:
+            score = a
+            skipped.append(1)
+        elif args.lazy_min and a < args.th:
+            score = a
+            skipped.append(1)
+        else:
+            score = min(a, entail_prob(nli, r2, H(f1)))
+            skipped.append(0)
 
         scores.append(score)
         preds.append(1 if score >= args.th else 0)
 
     df["score"] = scores
     df["pred"] = preds
+    if prefilter:
+        df["prefilter_rule"] = rule_name
+    if args.lazy_min:
+        df["dir2_skipped"] = skipped
+    if args.lazy_min or prefilter:
+        calls = int(todo.sum()) + skipped.count(0)
+        print(f"NLI calls: {calls} of {2 * len(rows)} "
+              f"({int((~todo).sum())} rows prefiltered, {sum(skipped) - int((~todo).sum())} second directions skipped)")
     df.to_csv(args.out, index=False)
     print("Wrote:", args.out, "| device:", ("GPU" if device == 0 else "CPU"))
 